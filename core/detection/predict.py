@@ -10,13 +10,13 @@ Copyright (c) 2025 by lizh, All Rights Reserved.
 '''
 from pathlib import Path
 import cv2
-from ultralytics import YOLO
 
 from core.detection.detect_utils import *
 from core.detection.utils.path_utils import ensure_output_dir
+from core.vision.model_backend import load_model
 
 img_path = "../../tests/test_images/partial/sample1.jpg"
-model = YOLO("../../shared/models/yolo/best.pt")
+model, backend = load_model("../../shared/models/yolo/best.pt")
 results = model.predict(source=img_path, save=True)
 
 # 获取所有检测框
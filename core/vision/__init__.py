@@ -2,10 +2,15 @@
 
 from core.vision.yolo_detector import YoloDetection
 from core.vision.barcode_recognizer import BarcodeRecognizer
+from core.vision.detections import ImageDetections
+from core.vision.model_backend import export_model, load_model
 
 __all__ = [
     "YoloDetection",
     "BarcodeRecognizer",
+    "ImageDetections",
+    "export_model",
+    "load_model",
 ]
 
 
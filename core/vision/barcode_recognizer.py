@@ -2,7 +2,8 @@ import os
 import subprocess
 import json
 import datetime
-from typing import List, Dict, Any
+import tempfile
+from typing import List, Dict, Any, Sequence
 from pathlib import Path
 
 
@@ -64,6 +65,30 @@ class BarcodeRecognizer:
 
         return self.results
 
+    def recognize_crops(self, crops: Sequence[Any], scale: float = 2.0) -> List[Dict[str, Any]]:
+        """
+        识别检测框裁剪出的条码图片（来自 ImageDetections.crops，不再单独运行 YOLO）
+
+        :param crops: BGR 图像数组列表
+        :param scale: 识别前的放大倍数（条码区域较小时提高识别率）
+        :return: 识别结果列表 [ { "filename": str, "output": str, "error": str }, ... ]
+        """
+        import cv2
+
+        self.results = []
+        with tempfile.TemporaryDirectory(prefix="barcode_") as work_dir:
+            for index, crop in enumerate(crops):
+                if crop is None or crop.size == 0:
+                    continue
+                if scale != 1.0:
+                    crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+                # 保存为无损格式再交给识别程序
+                filename = f"barcode_{index}.png"
+                image_path = os.path.join(work_dir, filename)
+                cv2.imwrite(image_path, crop)
+                self._process_image(image_path, filename)
+        return self.results
+
     def _is_image_file(self, filename: str) -> bool:
         """检查文件是否为图片格式"""
         image_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif'}
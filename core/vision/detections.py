@@ -0,0 +1,75 @@
+"""
+单张图片的检测结果
+功能：
+1. 一张图片只推理一次，得到的检测框（barcode / QR / pile / box）由箱体计数和条码裁剪识别共同使用
+2. 本地 YOLO 推理结果与推理服务返回的检测框统一为字典列表
+   （字段同 extract_yolo_detections，另含类别编号 cls_id）
+3. 按类别裁剪检测框区域（扩展边界），供条码识别和分类保存
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# 条码类别名称（与模型 names 一致）
+BARCODE_CLASSES = ("barcode",)
+
+
+def results_to_detections(results: Iterable[Any], names: Optional[Dict[int, str]] = None) -> List[Dict[str, Any]]:
+    """
+    YOLO 推理结果转换为检测框字典列表
+
+    :param results: YOLO 推理结果列表（单张图片）
+    :param names: 类别编号到名称的映射，默认使用结果自带的 names
+    """
+    detections = []
+    for res in results:
+        boxes = getattr(res, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            continue
+        model_names = names or getattr(res, "names", None) or {}
+        # 整批转换为列表，避免逐个检测框访问张量
+        for cls_id, conf, (x1, y1, x2, y2) in zip(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxy.tolist()):
+            cls_id = int(cls_id)
+            detections.append({
+                "cls": model_names.get(cls_id, str(cls_id)),
+                "cls_id": cls_id,
+                "conf": float(conf),
+                "x1": float(x1), "y1": float(y1), "x2": float(x2), "y2": float(y2)
+            })
+    return detections
+
+
+def crop_box(image: np.ndarray, detection: Dict[str, Any], padding: int = 0) -> np.ndarray:
+    """裁剪检测框区域（四边各扩展 padding 像素，不超出图片范围）"""
+    height, width = image.shape[:2]
+    x1 = max(0, int(detection["x1"]) - padding)
+    y1 = max(0, int(detection["y1"]) - padding)
+    x2 = min(width, int(detection["x2"]) + padding)
+    y2 = min(height, int(detection["y2"]) + padding)
+    return image[y1:y2, x1:x2]
+
+
+@dataclass
+class ImageDetections:
+    """单张图片一次推理得到的全部检测框"""
+
+    detections: List[Dict[str, Any]] = field(default_factory=list)
+
+    def of_classes(self, classes: Iterable[str], conf: float = 0.0) -> List[Dict[str, Any]]:
+        """指定类别且置信度不低于 conf 的检测框"""
+        classes = set(classes)
+        return [d for d in self.detections if d["cls"] in classes and d["conf"] >= conf]
+
+    def barcodes(self, conf: float = 0.0) -> List[Dict[str, Any]]:
+        return self.of_classes(BARCODE_CLASSES, conf)
+
+    def crops(self, image: np.ndarray, classes: Iterable[str] = BARCODE_CLASSES,
+              conf: float = 0.0, padding: int = 10) -> List[np.ndarray]:
+        """裁剪指定类别的检测框区域（按置信度从高到低）"""
+        selected = sorted(self.of_classes(classes, conf), key=lambda d: d["conf"], reverse=True)
+        return [crop_box(image, d, padding) for d in selected]
+
+    def __len__(self) -> int:
+        return len(self.detections)
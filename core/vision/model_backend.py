@@ -0,0 +1,330 @@
+"""
+YOLO 推理后端选择与模型导出缓存
+功能：
+1. 支持 pytorch（默认，直接加载 .pt）、onnx（ONNX Runtime）、openvino 三种 CPU 推理后端
+2. 首次使用 onnx/openvino 时由 ultralytics 导出模型，导出结果按权重文件哈希缓存，
+   权重不变时直接复用，多个进程同时启动时只导出一次
+3. 导出后的模型仍通过 ultralytics.YOLO 加载，predict 返回的结果格式与 .pt 一致，后处理无需修改
+4. 后端通过参数或环境变量 YOLO_BACKEND 选择，导出或加载失败时回退到 pytorch
+5. INT8 量化后端（onnx-int8 / openvino-int8）：用现场抓拍样本校准，加载时可执行精度校验，
+   校验不通过的量化模型不会被使用（改用同后端的 FP32 模型），校验结果记录在导出信息中
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("pytorch", "onnx", "openvino", "onnx-int8", "openvino-int8")
+DEFAULT_BACKEND = "pytorch"
+DEFAULT_IMGSZ = 640
+INT8_SUFFIX = "-int8"
+
+# INT8 校准和精度校验默认使用的样本图片（满垛、非满垛、特殊垛型）
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_CALIBRATION_DIRS = [PROJECT_ROOT / "tests" / "test_images" / name for name in ("full", "partial", "special")]
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+# 导出缓存目录，默认与权重文件同级的 exports/
+EXPORT_DIR_ENV = "YOLO_EXPORT_DIR"
+BACKEND_ENV = "YOLO_BACKEND"
+
+# 各后端导出结果在缓存目录中的名称（ultralytics 按后缀/目录名识别后端）
+EXPORT_NAMES = {
+    "onnx": "model.onnx",
+    "openvino": "model_openvino_model",
+    "onnx-int8": "model.onnx",
+    "openvino-int8": "model_openvino_model",
+}
+EXPORT_INFO = "export_info.json"
+
+# 权重文件哈希缓存：(路径, 大小, 修改时间) -> 哈希
+_hash_cache: Dict[Tuple[str, int, int], str] = {}
+
+# INT8 模型精度校验：参数为量化后的模型，返回 (是否通过, 说明)
+Validator = Callable[[YOLO], Tuple[bool, str]]
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """确定使用的后端：参数 > 环境变量 YOLO_BACKEND > pytorch"""
+    name = (backend or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND).strip().lower()
+    if name in ("pt", "torch"):
+        name = "pytorch"
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {name}，可选: {', '.join(BACKENDS)}")
+    return name
+
+
+def is_int8(backend: str) -> bool:
+    return backend.endswith(INT8_SUFFIX)
+
+
+def fp32_backend(backend: str) -> str:
+    """量化后端对应的 FP32 后端"""
+    return backend[:-len(INT8_SUFFIX)] if is_int8(backend) else backend
+
+
+def calibration_images(dirs: Optional[Sequence[Union[str, Path]]] = None) -> List[Path]:
+    """INT8 校准/校验使用的样本图片列表（按路径排序）"""
+    images = []
+    for directory in dirs or DEFAULT_CALIBRATION_DIRS:
+        images.extend(p for p in Path(directory).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    return sorted(images)
+
+
+def weights_hash(weights_path: Union[str, Path]) -> str:
+    """计算权重文件的 SHA-256（取前 16 位），同一文件只计算一次"""
+    path = Path(weights_path).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = sha.hexdigest()[:16]
+        _hash_cache[key] = digest
+    return digest
+
+
+def export_dir(weights_path: Union[str, Path], cache_dir: Optional[Union[str, Path]] = None) -> Path:
+    """导出缓存根目录"""
+    if cache_dir is None:
+        cache_dir = os.environ.get(EXPORT_DIR_ENV) or Path(weights_path).resolve().parent / "exports"
+    return Path(cache_dir)
+
+
+def export_model(
+    weights_path: Union[str, Path],
+    backend: str,
+    cache_dir: Optional[Union[str, Path]] = None,
+    imgsz: int = DEFAULT_IMGSZ,
+    calibration_dirs: Optional[Sequence[Union[str, Path]]] = None
+) -> Path:
+    """
+    导出模型到指定后端（已有缓存时直接返回）
+
+    缓存路径：<cache_dir>/<权重文件名>-<权重哈希>/<后端>-<imgsz>/，权重更新后哈希变化，自动重新导出。
+
+    :param weights_path: .pt 权重文件路径
+    :param backend: 目标后端（onnx / openvino / onnx-int8 / openvino-int8），pytorch 时直接返回权重路径
+    :param cache_dir: 导出缓存目录，默认为环境变量 YOLO_EXPORT_DIR 或权重文件同级的 exports/
+    :param imgsz: 导出的输入尺寸（与推理时一致）
+    :param calibration_dirs: INT8 校准样本目录，默认 tests/test_images 下的 full / partial / special
+    :return: 可由 ultralytics.YOLO 加载的模型路径
+    :raises: 导出失败时抛出 ultralytics 的异常（如缺少 onnxruntime/openvino 依赖）
+    """
+    backend = resolve_backend(backend)
+    weights_path = Path(weights_path)
+    if backend == "pytorch":
+        return weights_path
+
+    digest = weights_hash(weights_path)
+    root = export_dir(weights_path, cache_dir)
+    target = root / f"{weights_path.stem}-{digest}" / f"{backend}-{imgsz}"
+    model_path = target / EXPORT_NAMES[backend]
+    if (target / EXPORT_INFO).exists():
+        return model_path
+
+    calibration = calibration_images(calibration_dirs) if is_int8(backend) else []
+    if is_int8(backend) and not calibration:
+        raise FileNotFoundError(f"未找到 INT8 校准图片: {calibration_dirs or DEFAULT_CALIBRATION_DIRS}")
+    # ONNX 量化基于 FP32 导出结果（在获取锁之前完成，避免重入）
+    fp32_onnx = export_model(weights_path, "onnx", cache_dir, imgsz) if backend == "onnx-int8" else None
+
+    root.mkdir(parents=True, exist_ok=True)
+    with _export_lock(root):
+        # 等待锁期间其他进程可能已完成导出
+        if (target / EXPORT_INFO).exists():
+            return model_path
+
+        logger.info(f"导出模型: {weights_path} -> {backend} (哈希 {digest})")
+        start = time.perf_counter()
+        # ultralytics 把导出结果写在权重文件旁边，先复制到临时目录，避免污染模型目录
+        work = Path(tempfile.mkdtemp(prefix=".export-", dir=root))
+        try:
+            if backend == "onnx-int8":
+                exported = _quantize_onnx(fp32_onnx, work / "model.onnx", calibration, imgsz)
+            elif backend == "openvino-int8":
+                source = work / "model.pt"
+                shutil.copy2(weights_path, source)
+                source_model = YOLO(str(source))
+                data = _calibration_yaml(work, calibration, source_model.names)
+                exported = source_model.export(format="openvino", imgsz=imgsz, dynamic=True,
+                                               int8=True, data=str(data))
+            else:
+                source = work / "model.pt"
+                shutil.copy2(weights_path, source)
+                exported = YOLO(str(source)).export(format=backend, imgsz=imgsz, dynamic=True)
+            if target.exists():
+                shutil.rmtree(target)
+            target.mkdir(parents=True)
+            os.replace(exported, model_path)
+            # 最后写入导出信息，作为导出完成的标记
+            info = {
+                "source": str(weights_path.resolve()),
+                "sha256": digest,
+                "backend": backend,
+                "imgsz": imgsz,
+                "calibrationImages": len(calibration),
+                "exportedAt": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "exportSeconds": round(time.perf_counter() - start, 1),
+            }
+            (target / EXPORT_INFO).write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    logger.info(f"模型导出完成: {model_path} ({time.perf_counter() - start:.1f}秒)")
+    return model_path
+
+
+def _calibration_yaml(work: Path, images: List[Path], names) -> Path:
+    """生成 ultralytics INT8 校准使用的数据集配置（校准只需要图片，不需要标注）"""
+    listing = work / "calibration.txt"
+    listing.write_text("\n".join(str(p.resolve()) for p in images), encoding="utf-8")
+    names = names if isinstance(names, dict) else dict(enumerate(names))
+    data = {"path": str(work), "train": str(listing), "val": str(listing), "names": names}
+    path = work / "calibration.yaml"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")  # JSON 是合法的 YAML
+    return path
+
+
+def _quantize_onnx(fp32_path: Path, output: Path, images: List[Path], imgsz: int) -> Path:
+    """ONNX Runtime 静态量化（QDQ，权重按通道 INT8），保留 ultralytics 写入的模型元数据"""
+    import cv2
+    import numpy as np
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+    from ultralytics.data.augment import LetterBox
+
+    class Reader(CalibrationDataReader):
+        """按推理时的预处理（letterbox、BGR->RGB、归一化）逐张提供校准输入"""
+
+        def __init__(self, input_name: str):
+            self.input_name = input_name
+            self.pending = iter(images)
+            self.letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=False)
+
+        def get_next(self):
+            for path in self.pending:
+                image = cv2.imread(str(path))
+                if image is None:
+                    continue
+                image = self.letterbox(image=image)
+                tensor = np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+                return {self.input_name: tensor}
+            return None
+
+    source = onnx.load(str(fp32_path))
+    quantize_static(
+        str(fp32_path), str(output), Reader(source.graph.input[0].name),
+        quant_format=QuantFormat.QDQ, per_channel=True,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8
+    )
+    quantized = onnx.load(str(output))
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, str(output))
+    return output
+
+
+def _validate_once(target: Path, model: YOLO, validator: Validator, key: str) -> Tuple[bool, str]:
+    """执行一次 INT8 精度校验并记录到导出信息中，参考集（key）不变时直接使用记录的结果"""
+    info_path = target / EXPORT_INFO
+    with _export_lock(target.parent.parent):
+        info = json.loads(info_path.read_text(encoding="utf-8"))
+        record = info.get("validation")
+        if record is None or record.get("key") != key:
+            start = time.perf_counter()
+            passed, detail = validator(model)
+            record = {
+                "key": key,
+                "passed": passed,
+                "detail": detail,
+                "validatedAt": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "seconds": round(time.perf_counter() - start, 1),
+            }
+            info["validation"] = record
+            info_path.write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+    return record["passed"], record["detail"]
+
+
+def _recorded_rejection(target: Path, key: str) -> Optional[str]:
+    """已记录的校验未通过原因（同一参考集）"""
+    try:
+        record = json.loads((target / EXPORT_INFO).read_text(encoding="utf-8")).get("validation")
+    except (OSError, ValueError):
+        return None
+    if record and record.get("key") == key and not record.get("passed"):
+        return record.get("detail", "")
+    return None
+
+
+@contextmanager
+def _export_lock(root: Path):
+    """导出文件锁（同一缓存目录同时只有一个进程导出）"""
+    fd = os.open(root / ".export.lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def load_model(
+    weights_path: Union[str, Path],
+    backend: Optional[str] = None,
+    cache_dir: Optional[Union[str, Path]] = None,
+    imgsz: int = DEFAULT_IMGSZ,
+    fallback: bool = True,
+    validator: Optional[Validator] = None,
+    validator_key: str = ""
+) -> Tuple[YOLO, str]:
+    """
+    按后端加载 YOLO 模型
+
+    :param weights_path: .pt 权重文件路径
+    :param backend: 推理后端，默认读取环境变量 YOLO_BACKEND
+    :param fallback: 导出或加载失败时是否回退（INT8 回退到同后端 FP32，其他回退到 pytorch）
+    :param validator: INT8 模型的精度校验，不通过时改用同后端的 FP32 模型
+    :param validator_key: 校验参考集的标识，标识不变时复用已记录的校验结果
+    :return: (模型, 实际使用的后端)
+    """
+    backend = resolve_backend(backend)
+    if backend == "pytorch":
+        return YOLO(str(weights_path)), backend
+    try:
+        model_path = export_model(weights_path, backend, cache_dir, imgsz)
+        if is_int8(backend) and validator is not None:
+            rejected = _recorded_rejection(model_path.parent, validator_key)
+            if rejected is not None:
+                logger.warning(f"INT8 模型未通过精度校验，使用 {fp32_backend(backend)}: {rejected}")
+                return load_model(weights_path, fp32_backend(backend), cache_dir, imgsz, fallback)
+        model = YOLO(str(model_path), task="detect")
+        if is_int8(backend) and validator is not None:
+            passed, detail = _validate_once(model_path.parent, model, validator, validator_key)
+            if not passed:
+                logger.warning(f"INT8 模型未通过精度校验，使用 {fp32_backend(backend)}: {detail}")
+                return load_model(weights_path, fp32_backend(backend), cache_dir, imgsz, fallback)
+            logger.info(f"INT8 模型精度校验通过: {detail}")
+        logger.info(f"使用 {backend} 推理后端: {model_path}")
+        return model, backend
+    except Exception as e:
+        if not fallback:
+            raise
+        retry = fp32_backend(backend) if is_int8(backend) else "pytorch"
+        logger.warning(f"{backend} 推理后端不可用，回退到 {retry}: {str(e)}")
+        return load_model(weights_path, retry, cache_dir, imgsz, fallback)
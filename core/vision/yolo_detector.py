@@ -1,17 +1,21 @@
 import os
 import cv2
-from ultralytics import YOLO
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional
 import json
 import datetime  # 添加时间模块
 
+from core.vision.detections import ImageDetections, crop_box, results_to_detections
+from core.vision.model_backend import load_model
+
 
 class YoloDetection:
     def __init__(self,
                  model_path: str,
                  class_mapping: Dict[int, str] = None,
                  confidence_threshold: float = 0.7,
-                 padding: int = 50):
+                 padding: int = 50,
+                 backend: Optional[str] = None,
+                 inference_url: Optional[str] = None):
         """
         初始化条形码检测器
 
@@ -19,8 +23,18 @@ class YoloDetection:
         :param class_mapping: 类别ID到名称的映射 (e.g., {0: 'barcode', 1: 'QR', 2: 'piles', 3: 'box'})
         :param confidence_threshold: 置信度阈值
         :param padding: 裁剪边界扩展像素
+        :param backend: 推理后端（pytorch / onnx / openvino），默认读取环境变量 YOLO_BACKEND
+        :param inference_url: 本地推理服务地址，默认读取环境变量 INFERENCE_SERVER_URL，
+            配置后检测交给推理服务（与计数共用模型副本），不在本进程加载模型
         """
-        self.model = YOLO(model_path)
+        inference_url = inference_url or os.environ.get("INFERENCE_SERVER_URL")
+        if inference_url:
+            from services.inference.client import get_inference_client
+            self.inference = get_inference_client(inference_url)
+            self.model, self.backend = None, "remote"
+        else:
+            self.inference = None
+            self.model, self.backend = load_model(model_path, backend)
         self.class_mapping = class_mapping or {
             0: 'barcode', 1: 'QR', 2: 'piles', 3: 'box'}
         self.confidence_threshold = confidence_threshold
@@ -80,6 +94,16 @@ class YoloDetection:
         image_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif'}
         return os.path.splitext(filename.lower())[1] in image_extensions
 
+    def detect(self, image) -> ImageDetections:
+        """单张图片推理一次（本地模型或推理服务），返回全部类别的检测框"""
+        if self.inference is not None:
+            return ImageDetections(self.inference.detect(image, conf=self.confidence_threshold))
+        results = self.model.predict(
+            source=image,
+            conf=self.confidence_threshold
+        )
+        return ImageDetections(results_to_detections(results, getattr(self.model, "names", None)))
+
     def _process_image(self, image_path: str, filename: str, output_dir: str, detected_images_dir: str):
         """处理单张图片的检测和裁剪（无预处理）"""
         original_image = cv2.imread(image_path)
@@ -87,68 +111,71 @@ class YoloDetection:
             print(f"⚠️ 跳过无法读取的图像: {filename}")
             return
 
-        # 执行YOLO预测
-        results = self.model.predict(
-            source=original_image,
-            conf=self.confidence_threshold
-        )
+        # 执行YOLO预测（推理服务直接读取图片文件）
+        detections = self.detect(image_path if self.inference is not None else original_image)
+        self.save_detections(original_image, detections, filename, output_dir, detected_images_dir)
 
-        # 保存带检测框的原始图片
-        if results:
-            plot_image = results[0].plot()  # 获取带框的图像 (RGB)
-            # 转换为BGR格式以便OpenCV保存
-            plot_image_bgr = cv2.cvtColor(plot_image, cv2.COLOR_RGB2BGR)
-            detected_image_path = os.path.join(detected_images_dir, filename)
-            cv2.imwrite(detected_image_path, plot_image_bgr)
-            print(f"✅ 保存带检测框的图像: {detected_image_path}")
-        else:
-            # 如果没有检测结果，保存原始图片
-            detected_image_path = os.path.join(detected_images_dir, filename)
-            cv2.imwrite(detected_image_path, original_image)
-            print(f"✅ 保存原始图像（无检测框）: {detected_image_path}")
+    def save_detections(self, original_image, detections: ImageDetections, filename: str,
+                        output_dir: str, detected_images_dir: str):
+        """
+        按类别裁剪并保存检测框区域
+
+        检测结果可以来自其他服务对同一张图片的推理（如 BoxCountService.detect），不再重复推理
+
+        :param original_image: BGR 原图
+        :param detections: 该图片的检测结果
+        :param filename: 原图文件名（结果文件命名用）
+        """
+        # 保存带检测框的原始图片（没有检测结果时即原图）
+        detected_image_path = os.path.join(detected_images_dir, filename)
+        cv2.imwrite(detected_image_path, self._plot_boxes(original_image, detections))
+        print(f"✅ 保存带检测框的图像: {detected_image_path}")
 
         # 遍历所有检测结果
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls)
-                conf = box.conf.item()
-
-                # 检查类别是否在映射中
-                if cls not in self.class_mapping:
-                    continue
-
-                # 检查置信度
-                if conf < self.confidence_threshold:
-                    continue
-
-                category = self.class_mapping[cls]
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-
-                # 扩展边界
-                x1_pad = max(0, x1 - self.padding)
-                y1_pad = max(0, y1 - self.padding)
-                x2_pad = min(original_image.shape[1], x2 + self.padding)
-                y2_pad = min(original_image.shape[0], y2 + self.padding)
-
-                # 裁剪图像（无预处理）
-                cropped_img = original_image[y1_pad:y2_pad, x1_pad:x2_pad]
-
-                # 保存裁剪图像 (带类别前缀)
-                save_filename = f"{category}_{os.path.splitext(filename)[0]}_{len(self.category_results[category])}.png"
-                save_path = os.path.join(output_dir, category, save_filename)
-                cv2.imwrite(save_path, cropped_img)
-
-                # 记录检测结果
-                self.category_results[category].append({
-                    "original_image": filename,
-                    "cropped_image": save_filename,
-                    "bbox": [x1, y1, x2, y2],
-                    "confidence": conf,
-                    "category": category
-                })
-
-                print(f"✅ 保存裁剪图像: {save_path}")
+        for detection in detections.detections:
+            cls = detection["cls_id"]
+            conf = detection["conf"]
+
+            # 检查类别是否在映射中
+            if cls not in self.class_mapping:
+                continue
+
+            # 检查置信度
+            if conf < self.confidence_threshold:
+                continue
+
+            category = self.class_mapping[cls]
+            x1, y1, x2, y2 = (int(detection[k]) for k in ("x1", "y1", "x2", "y2"))
+
+            # 裁剪图像（扩展边界，无预处理）
+            cropped_img = crop_box(original_image, detection, self.padding)
+
+            # 保存裁剪图像 (带类别前缀)
+            save_filename = f"{category}_{os.path.splitext(filename)[0]}_{len(self.category_results[category])}.png"
+            save_path = os.path.join(output_dir, category, save_filename)
+            cv2.imwrite(save_path, cropped_img)
+
+            # 记录检测结果
+            self.category_results[category].append({
+                "original_image": filename,
+                "cropped_image": save_filename,
+                "bbox": [x1, y1, x2, y2],
+                "confidence": conf,
+                "category": category
+            })
+
+            print(f"✅ 保存裁剪图像: {save_path}")
+
+    def _plot_boxes(self, image, detections: ImageDetections):
+        """在图片副本上绘制检测框"""
+        plot_image = image.copy()
+        for detection in detections.detections:
+            x1, y1, x2, y2 = (int(detection[k]) for k in ("x1", "y1", "x2", "y2"))
+            label = f"{self.class_mapping.get(detection['cls_id'], detection['cls'])} {detection['conf']:.2f}"
+            cv2.rectangle(plot_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(plot_image, label, (x1, max(0, y1 - 5)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        return plot_image
 
     def _save_category_results(self, output_dir: str):
         """将每个类别的结果保存为JSON文件"""
@@ -0,0 +1,396 @@
+'''
+Description: 相机常驻抓图服务
+
+每个相机一个常驻进程，保持一个已登录的 CamController 并持续预览，
+抓图请求通过本地 HTTP 接口下发，避免每个储位都重新启动解释器、加载 .so 和登录相机。
+
+- 每个相机单独一个进程：SDK 的 logout / 登录失败会调用 NET_DVR_Cleanup 释放进程内全部资源，
+  多个相机放在同一进程内会互相影响
+- 预览常开：startRealPlay 需要约3秒等待码流，常驻后抓图只需 getCapture
+- 抓图失败或图片未生成时自动重新登录并重试一次
+- 记录抓图耗时直方图，可通过 GET /stats 查询
+
+接口：
+    POST /capture  {"task_no": "...", "bin_location": "..."}
+    GET  /health
+    GET  /stats
+
+使用方法：
+    python capture_daemon.py --camera all          # 启动全部相机（每个相机一个子进程）
+    python capture_daemon.py --camera 3d_camera    # 只启动单个相机
+
+抓图脚本（3d_capture.py 等）会优先调用本服务，服务未启动时回退为直接调用 camera_api。
+'''
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("capture_daemon")
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DAEMON_HOST = os.environ.get("CAPTURE_DAEMON_HOST", "127.0.0.1")
+
+# 相机配置：修改相机IP、端口、账号密码时同步修改此处
+CAMERA_CONFIGS: Dict[str, Dict[str, Any]] = {
+    "3d_camera": {
+        "address": "10.16.82.180",
+        "port": 8000,
+        "username": "admin",
+        "password": "qwe147852",
+        "streams": [0, 3],  # 主码流 + 第四码流（深度图）
+        "daemon_port": 8101
+    },
+    "scan_camera_1": {
+        "address": "10.16.82.181",
+        "port": 8000,
+        "username": "admin",
+        "password": "qwe147852",
+        "streams": [0],
+        "daemon_port": 8102
+    },
+    "scan_camera_2": {
+        "address": "10.16.82.182",
+        "port": 8000,
+        "username": "admin",
+        "password": "qwe147852",
+        "streams": [0],
+        "daemon_port": 8103
+    }
+}
+
+# 码流类型 -> camera_api 输出的文件名
+STREAM_FILES = {0: "main.jpg", 3: "depth.jpg"}
+STREAM_NAMES = {0: "main", 3: "fourth"}
+
+# 抓图耗时直方图的桶上限（毫秒）
+LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2500, 5000, 10000]
+
+RECONNECT_DELAY = 2.0  # 重新登录失败后的等待时间（秒）
+
+
+def load_camera_api():
+    """加载 camera_api 模块，指定 CAMERA_API_PATH 时优先从该目录加载"""
+    sys.path.insert(0, CURRENT_DIR)
+    camera_api_path = os.environ.get("CAMERA_API_PATH")
+    if camera_api_path:
+        sys.path.insert(0, os.path.abspath(camera_api_path))
+    import camera_api
+    return camera_api
+
+
+class LatencyHistogram:
+    """抓图耗时直方图（累计计数）"""
+
+    def __init__(self, buckets_ms: List[float]):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """记录一次耗时"""
+        ms = seconds * 1000
+        with self._lock:
+            self.total += 1
+            self.sum_ms += ms
+            for i, upper in enumerate(self.buckets_ms):
+                if ms <= upper:
+                    self.counts[i] += 1
+                    return
+            self.counts[-1] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为接口返回格式，各桶为累计值"""
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for upper, count in zip(self.buckets_ms, self.counts):
+                cumulative += count
+                buckets[f"le_{upper}ms"] = cumulative
+            buckets["le_inf"] = self.total
+            return {
+                "count": self.total,
+                "avgMs": round(self.sum_ms / self.total, 2) if self.total else 0.0,
+                "buckets": buckets
+            }
+
+
+class CameraSession:
+    """单个相机的常驻会话：保持登录和预览"""
+
+    def __init__(self, camera_type: str, config: Dict[str, Any], camera_api):
+        self.camera_type = camera_type
+        self.config = config
+        self.camera_api = camera_api
+        self.streams: List[int] = config["streams"]
+        self.cam = None
+        self.current_stream: Optional[int] = None
+        self.histogram = LatencyHistogram(LATENCY_BUCKETS_MS)
+        self.reconnects = 0
+        self.failures = 0
+        # SDK 对同一相机的调用需串行
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.cam is not None
+
+    def connect(self) -> bool:
+        """登录相机并打开第一个码流的预览"""
+        self._disconnect()
+        # logout / 登录失败会释放 SDK 资源，重连时需要重新创建 CamController
+        cam = self.camera_api.CamController()
+        if not cam.login(self.config["address"], self.config["port"],
+                         self.config["username"], self.config["password"]):
+            logger.error(f"[{self.camera_type}] 登录失败: {self.config['address']}")
+            return False
+        cam.setCameraType(self.camera_type)
+        self.cam = cam
+        if not self._play(self.streams[0]):
+            self.cam = None
+            return False
+        logger.info(f"[{self.camera_type}] 已登录并开始预览: {self.config['address']}")
+        return True
+
+    def close(self):
+        """退出登录"""
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self.cam is None:
+            return
+        try:
+            if self.current_stream is not None:
+                self.cam.stopRealPlay()
+            self.cam.logout()
+        except Exception as e:
+            logger.warning(f"[{self.camera_type}] 退出登录异常: {str(e)}")
+        self.cam = None
+        self.current_stream = None
+
+    def _play(self, stream: int) -> bool:
+        """切换到指定码流的预览"""
+        if self.current_stream == stream:
+            return True
+        if self.current_stream is not None:
+            self.cam.stopRealPlay()
+            self.current_stream = None
+        if not self.cam.startRealPlay(1, stream, 0, 1):
+            logger.error(f"[{self.camera_type}] 开始预览失败, 码流 {stream}")
+            return False
+        self.current_stream = stream
+        return True
+
+    def capture(self, task_no: str, bin_location: str) -> Dict[str, Any]:
+        """
+        抓取所有码流的图片，失败时重新登录并重试一次
+
+        :return: {"success", "camera", "latency", "capture_results", "error"}
+        """
+        start = time.perf_counter()
+        with self._lock:
+            result = None
+            for attempt in range(2):
+                if attempt > 0 or not self.connected:
+                    if attempt > 0:
+                        logger.warning(f"[{self.camera_type}] 抓图失败，重新登录后重试")
+                        self.reconnects += 1
+                    if not self.connect():
+                        result = {"success": False, "error": "相机登录或预览失败"}
+                        continue
+                try:
+                    result = self._capture_streams(task_no, bin_location)
+                except Exception as e:
+                    logger.error(f"[{self.camera_type}] 抓图异常: {str(e)}")
+                    result = {"success": False, "error": str(e)}
+                if result["success"]:
+                    break
+
+            if not result["success"]:
+                self.failures += 1
+                self._disconnect()
+            elif self.connected and self.current_stream != self.streams[0]:
+                # 抓完其他码流后恢复第一个码流的预览，放到后台执行以免拖慢本次响应
+                threading.Thread(target=self._restore_preview, daemon=True).start()
+
+        latency = time.perf_counter() - start
+        self.histogram.observe(latency)
+        result.update({"camera": self.camera_type, "latency": latency})
+        return result
+
+    def _capture_streams(self, task_no: str, bin_location: str) -> Dict[str, Any]:
+        """依次抓取各码流，并确认图片已生成"""
+        self.cam.setTaskInfo(task_no, bin_location)
+        output_dir = os.path.join("output", task_no, bin_location, self.camera_type)
+        capture_results = []
+        for stream in self.streams:
+            if not self._play(stream):
+                return {"success": False, "error": f"码流 {stream} 预览失败"}
+            target = os.path.join(output_dir, STREAM_FILES.get(stream, "default.jpg"))
+            before = os.path.getmtime(target) if os.path.exists(target) else None
+            self.cam.getCapture()
+            if not os.path.exists(target) or os.path.getmtime(target) == before:
+                return {"success": False, "error": f"码流 {stream} 未生成图片: {target}"}
+            capture_results.append({"stream": STREAM_NAMES.get(stream, str(stream)), "path": target})
+        return {"success": True, "capture_results": capture_results, "error": None}
+
+    def _restore_preview(self):
+        with self._lock:
+            if self.connected and not self._play(self.streams[0]):
+                self._disconnect()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "camera": self.camera_type,
+            "connected": self.connected,
+            "stream": self.current_stream,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "latency": self.histogram.to_dict()
+        }
+
+
+def make_handler(session: CameraSession):
+    """创建绑定到指定相机会话的请求处理器"""
+
+    class CaptureHandler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"camera": session.camera_type, "connected": session.connected})
+            elif self.path == "/stats":
+                self._send_json(200, session.stats())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/capture":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                task_no = payload["task_no"]
+                bin_location = payload["bin_location"]
+            except (ValueError, KeyError) as e:
+                self._send_json(400, {"success": False, "error": f"请求参数错误: {str(e)}"})
+                return
+
+            result = session.capture(task_no, bin_location)
+            result.update({"task_no": task_no, "bin_location": bin_location})
+            self._send_json(200, result)
+
+        def log_message(self, format, *args):
+            logger.debug(f"[{session.camera_type}] {format % args}")
+
+    return CaptureHandler
+
+
+def _handle_sigterm(signum, frame):
+    """收到 SIGTERM 时按 Ctrl+C 处理，确保退出登录并停止子进程"""
+    raise KeyboardInterrupt
+
+
+def serve(camera_type: str):
+    """启动单个相机的常驻服务"""
+    config = CAMERA_CONFIGS[camera_type]
+    # 与抓图脚本一致，图片写入脚本目录下的 output/
+    os.chdir(CURRENT_DIR)
+    session = CameraSession(camera_type, config, load_camera_api())
+
+    # 启动时即登录并打开预览，失败时在首次抓图时重试
+    while not session.connect():
+        logger.warning(f"[{camera_type}] {RECONNECT_DELAY}秒后重试登录")
+        time.sleep(RECONNECT_DELAY)
+
+    server = ThreadingHTTPServer((DAEMON_HOST, config["daemon_port"]), make_handler(session))
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    logger.info(f"[{camera_type}] 抓图服务已启动: http://{DAEMON_HOST}:{config['daemon_port']}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        session.close()
+        logger.info(f"[{camera_type}] 抓图服务已停止")
+
+
+def serve_all():
+    """每个相机启动一个子进程，主进程退出时一并停止子进程"""
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--camera", camera_type])
+        for camera_type in CAMERA_CONFIGS
+    ]
+
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def request_capture(camera_type: str, task_no: str, bin_location: str,
+                    timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+    """
+    向常驻服务请求抓图（供抓图脚本调用）
+
+    :return: 抓图结果；服务未启动时返回 None，调用方应回退为直接抓图
+    """
+    if os.environ.get("CAPTURE_DAEMON_DISABLED") == "1":
+        return None
+    port = CAMERA_CONFIGS[camera_type]["daemon_port"]
+    request = urllib.request.Request(
+        f"http://{DAEMON_HOST}:{port}/capture",
+        data=json.dumps({"task_no": task_no, "bin_location": bin_location}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, ConnectionRefusedError):
+            return None
+        return {"success": False, "error": f"抓图服务请求失败: {str(e.reason)}"}
+    except (TimeoutError, OSError) as e:
+        return {"success": False, "error": f"抓图服务请求失败: {str(e)}"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='相机常驻抓图服务')
+    parser.add_argument('--camera', type=str, default='all',
+                        choices=['all', *CAMERA_CONFIGS.keys()], help='相机类型')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.camera == 'all':
+        serve_all()
+    else:
+        serve(args.camera)
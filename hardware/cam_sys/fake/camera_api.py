@@ -0,0 +1,98 @@
+"""
+模拟 camera_api 模块（无硬件环境下使用）
+与 pybind11 编译出的 camera_api.so 接口一致，用于测试和压测抓图流程。
+
+抓图结果与真实模块相同，写入 output/任务号/库位号/相机类型/main.jpg（主码流）或 depth.jpg（第四码流）。
+
+可通过环境变量调整行为：
+- FAKE_CAMERA_LOGIN_DELAY: 登录耗时（秒），默认 0.1
+- FAKE_CAMERA_PLAY_DELAY: 开始预览耗时（秒），默认 0.5（真实模块等待码流约3秒）
+- FAKE_CAMERA_CAPTURE_DELAY: 单次抓图耗时（秒），默认 0.3
+- FAKE_CAMERA_FAIL_RATE: 登录失败概率（0~1），默认 0
+- FAKE_CAMERA_IMAGE: 作为抓图结果的图片，默认使用 tests/test_images/full/sample1.jpg
+
+使用方法：
+    CAMERA_API_PATH=hardware/cam_sys/fake python hardware/cam_sys/3d_capture.py --task-no T1 --bin-location A1
+"""
+
+import os
+import random
+import shutil
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+DEFAULT_IMAGE = PROJECT_ROOT / "tests" / "test_images" / "full" / "sample1.jpg"
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+class CamController:
+    """模拟相机控制器"""
+
+    def __init__(self):
+        self.logged_in = False
+        self.playing = False
+        self.stream_type = 0
+        self.task_id = ""
+        self.bin_code = ""
+        self.camera_type = ""
+
+    def login(self, deviceAddress: str, port: int, userName: str, password: str) -> bool:
+        time.sleep(_env_float("FAKE_CAMERA_LOGIN_DELAY", 0.1))
+        if random.random() < _env_float("FAKE_CAMERA_FAIL_RATE", 0.0):
+            print(f"模拟相机登录失败: {deviceAddress}:{port}")
+            return False
+        self.logged_in = True
+        return True
+
+    def logout(self) -> bool:
+        self.logged_in = False
+        return True
+
+    def startRealPlay(self, channel: int, streamType: int, linkMode: int, blocked: int) -> bool:
+        if not self.logged_in:
+            return False
+        time.sleep(_env_float("FAKE_CAMERA_PLAY_DELAY", 0.5))
+        self.stream_type = streamType
+        self.playing = True
+        return True
+
+    def stopRealPlay(self) -> bool:
+        self.playing = False
+        return True
+
+    def setTaskInfo(self, task_id: str, bin_code: str):
+        self.task_id = task_id
+        self.bin_code = bin_code
+
+    def setCameraType(self, camera_type: str):
+        self.camera_type = camera_type
+
+    def getCapture(self):
+        if not (self.task_id and self.bin_code and self.camera_type):
+            print("错误: task_id_, bin_code_ 或 camera_type_ 未设置!")
+            return
+        if not self.playing:
+            print("错误: 未开始预览")
+            return
+
+        time.sleep(_env_float("FAKE_CAMERA_CAPTURE_DELAY", 0.3))
+
+        base_path = Path("output") / self.task_id / self.bin_code / self.camera_type
+        base_path.mkdir(parents=True, exist_ok=True)
+        if self.stream_type == 0:
+            file_name = "main.jpg"
+        elif self.stream_type == 3:
+            file_name = "depth.jpg"
+        else:
+            file_name = "default.jpg"
+
+        source = Path(os.environ.get("FAKE_CAMERA_IMAGE", DEFAULT_IMAGE))
+        target = base_path / file_name
+        if source.exists():
+            shutil.copyfile(source, target)
+        else:
+            target.write_bytes(b"")
@@ -39,6 +39,20 @@ def main(task_no: str, bin_location: str):
     # 添加当前目录到Python路径
     sys.path.insert(0, current_dir)
 
+    # 优先调用常驻抓图服务（capture_daemon.py），服务未启动时直接调用camera_api
+    from capture_daemon import request_capture
+    daemon_result = request_capture("scan_camera_1", task_no, bin_location)
+    if daemon_result is not None:
+        print(f"常驻抓图服务结果: {daemon_result}")
+        return daemon_result
+    print("常驻抓图服务未启动，直接调用camera_api")
+
+    # 指定 CAMERA_API_PATH 时优先从该目录加载 camera_api（如无硬件环境下的 fake/camera_api.py）
+    camera_api_path = os.environ.get("CAMERA_API_PATH")
+    if camera_api_path:
+        sys.path.insert(0, os.path.abspath(camera_api_path))
+        print(f"使用指定的camera_api路径: {camera_api_path}")
+
     try:
         # 先检查模块文件是否存在
         so_file = None
@@ -48,12 +62,12 @@ def main(task_no: str, bin_location: str):
                 print(f"找到模块文件: {so_file}")
                 break
         
-        if not so_file:
+        if not so_file and not camera_api_path:
             print("❌ 未找到camera_api*.so文件")
             sys.exit(1)
         
         # 检查文件权限
-        if not os.access(so_file, os.R_OK):
+        if so_file and not os.access(so_file, os.R_OK):
             print(f"❌ 文件不可读: {so_file}")
             os.chmod(so_file, 0o644)
             print(f"✅ 已修复文件权限")
@@ -110,8 +124,7 @@ def main(task_no: str, bin_location: str):
             "task_no": task_no,
             "bin_location": bin_location,
             "capture_results": [
-                {"stream": "main", "result": capture_result},
-                {"stream": "fourth", "result": capture_result2}
+                {"stream": "main", "result": capture_result}
             ]
         }
         
@@ -0,0 +1,214 @@
+"""
+LMS 储位目录缓存
+功能：
+1. 缓存 LMS 全量储位列表，过期（TTL）后在后台刷新，刷新期间继续返回旧数据
+2. 按 binCode、areaCode、tobaccoCode、binStatus 建立内存索引
+3. 支持按条件过滤和分页查询，前端无需每次拉取全量储位
+4. 全量列表的 JSON 序列化结果随缓存一起保存，兼容接口直接返回
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 建立索引的字段
+INDEX_FIELDS = ("areaCode", "tobaccoCode", "binStatus")
+
+BinFetcher = Callable[[str], Awaitable[List[Dict[str, Any]]]]
+
+
+class BinCatalog:
+    """带索引的储位目录缓存"""
+
+    def __init__(self, fetcher: BinFetcher, ttl: float = 300):
+        """
+        :param fetcher: 拉取全量储位的协程，参数为 authToken，认证失败时应抛出异常
+        :param ttl: 储位数据有效期（秒），过期后后台刷新
+        """
+        self.fetcher = fetcher
+        self.ttl = ttl
+
+        self._bins: List[Dict[str, Any]] = []
+        self._json: bytes = b"[]"
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+        # 字段 -> 字段值 -> 储位在 _bins 中的下标
+        self._indexes: Dict[str, Dict[str, List[int]]] = {field: {} for field in INDEX_FIELDS}
+        self._loaded_at: Optional[float] = None
+
+        # 后台刷新使用最近一次拉取成功的 authToken（调用方负责校验请求的 token）
+        self._refresh_token: Optional[str] = None
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self._refreshes = 0
+        self._refresh_errors = 0
+        self._last_refresh_ms = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def age(self) -> Optional[float]:
+        """缓存数据的年龄（秒）"""
+        return None if self._loaded_at is None else time.time() - self._loaded_at
+
+    async def ensure(self, auth_token: str):
+        """
+        确保缓存可用
+
+        - 首次加载：同步拉取
+        - 数据已过期：后台刷新，本次直接使用旧数据
+
+        :raises Exception: fetcher 抛出的异常（如认证失败）
+        """
+        if not self.loaded:
+            await self.refresh(auth_token)
+        elif self.age > self.ttl:
+            self._refresh_in_background()
+
+    async def refresh(self, auth_token: Optional[str] = None):
+        """
+        拉取全量储位并重建索引
+
+        多个请求同时触发刷新时只拉取一次。
+        """
+        token = auth_token or self._refresh_token
+        if token is None:
+            return
+        started = time.time()
+        async with self._refresh_lock:
+            # 等锁期间其他请求已完成刷新
+            if self._loaded_at is not None and self._loaded_at >= started:
+                return
+            start = time.perf_counter()
+            try:
+                bins = await self.fetcher(token)
+            except Exception:
+                self._refresh_errors += 1
+                if token == self._refresh_token:
+                    self._refresh_token = None
+                raise
+            by_code, indexes, payload = await asyncio.to_thread(self._build_indexes, bins)
+            # 在事件循环中整体替换，查询不会看到新旧数据混合的状态
+            self._bins = bins
+            self._by_code = by_code
+            self._indexes = indexes
+            self._json = payload
+            self._loaded_at = time.time()
+
+            self._refresh_token = token
+            self._refreshes += 1
+            self._last_refresh_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"储位目录已刷新: {len(bins)} 个储位, 耗时 {self._last_refresh_ms:.1f}ms")
+
+    def _refresh_in_background(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+
+        async def run():
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"后台刷新储位目录失败: {str(e)}")
+
+        self._refresh_task = asyncio.create_task(run(), name="bin-catalog-refresh")
+
+    @staticmethod
+    def _build_indexes(bins: List[Dict[str, Any]]):
+        """构建索引和 JSON（在线程中执行）"""
+        by_code = {}
+        indexes: Dict[str, Dict[str, List[int]]] = {field: {} for field in INDEX_FIELDS}
+        for i, item in enumerate(bins):
+            code = item.get("binCode")
+            if code is not None:
+                by_code[str(code)] = item
+            for field in INDEX_FIELDS:
+                value = item.get(field)
+                if value is not None:
+                    indexes[field].setdefault(str(value), []).append(i)
+        payload = json.dumps(bins, ensure_ascii=False).encode("utf-8")
+        return by_code, indexes, payload
+
+    def invalidate(self):
+        """使缓存过期，下次访问时后台刷新"""
+        if self._loaded_at is not None:
+            self._loaded_at = 0.0
+
+    # ------------------------------------------------------------------ 查询
+
+    def all_json(self) -> bytes:
+        """全量储位列表的 JSON（已序列化）"""
+        return self._json
+
+    def get(self, bin_code: str) -> Optional[Dict[str, Any]]:
+        """按 binCode 查询储位"""
+        return self._by_code.get(bin_code)
+
+    def query(
+        self,
+        area_code: Optional[str] = None,
+        tobacco_code: Optional[str] = None,
+        bin_status: Optional[str] = None,
+        keyword: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 50
+    ) -> Dict[str, Any]:
+        """
+        按条件过滤并分页
+
+        :param keyword: 匹配 binDesc / binCode / tobaccoName 的关键字
+        :return: {"total", "page", "pageSize", "items"}
+        """
+        filters = {"areaCode": area_code, "tobaccoCode": tobacco_code, "binStatus": bin_status}
+        selected: Optional[Set[int]] = None
+        for field, value in filters.items():
+            if value is None:
+                continue
+            ids = set(self._indexes[field].get(value, ()))
+            selected = ids if selected is None else selected & ids
+
+        if selected is None:
+            positions = range(len(self._bins))
+        else:
+            positions = sorted(selected)
+
+        items = (self._bins[i] for i in positions)
+        if keyword:
+            items = (
+                item for item in items
+                if any(keyword in str(item.get(f, "")) for f in ("binDesc", "binCode", "tobaccoName"))
+            )
+        matched = list(items)
+
+        start = (page - 1) * page_size
+        return {
+            "total": len(matched),
+            "page": page,
+            "pageSize": page_size,
+            "items": matched[start:start + page_size]
+        }
+
+    def facets(self) -> Dict[str, Dict[str, int]]:
+        """各索引字段的取值及储位数（用于前端筛选项）"""
+        return {
+            field: {value: len(ids) for value, ids in index.items()}
+            for field, index in self._indexes.items()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存的统计信息"""
+        age = self.age
+        return {
+            "bins": len(self._bins),
+            "ageSeconds": round(age, 1) if age is not None else None,
+            "ttl": self.ttl,
+            "refreshes": self._refreshes,
+            "refreshErrors": self._refresh_errors,
+            "lastRefreshMs": round(self._last_refresh_ms, 2)
+        }
@@ -0,0 +1,262 @@
+"""
+储位处理流水线
+功能：
+1. 抓图完成后立即释放机器人，计数、条码识别、结果提交作为下游阶段异步执行
+2. 阶段之间使用有界队列，下游处理不过来时向上游施加背压；
+   每个阶段可配置多个工作协程（如计数阶段与计数进程数一致），并发处理多个储位
+3. 记录每个阶段的耗时，用于对比流水线前后的单储位周期时间
+4. 盘点任务取消时丢弃该任务排队中的储位，并取消正在执行的阶段
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field
+
+logger = logging.getLogger(__name__)
+
+
+class BinJob(BaseModel):
+    """单个储位在流水线中的处理任务"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    task_no: str
+    bin_location: str
+    robot_code: Optional[str] = None
+    images: Dict[str, List[str]] = Field(default_factory=dict)  # 相机类型 -> 图片路径列表
+    results: Dict[str, Any] = Field(default_factory=dict)  # 阶段名 -> 阶段结果
+    timings: Dict[str, float] = Field(default_factory=dict)  # 阶段名 -> 耗时（秒）
+    created_at: float = Field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancelled: bool = False  # 所属盘点任务已取消
+    done: Optional[asyncio.Future] = None
+
+    @property
+    def success(self) -> bool:
+        """所有阶段是否都执行成功"""
+        return all(
+            not isinstance(r, dict) or r.get("success", True)
+            for r in self.results.values()
+        )
+
+
+StageFunc = Callable[[BinJob], Awaitable[Any]]
+
+
+class StageTimer:
+    """按阶段记录耗时（保留最近 N 个样本）"""
+
+    def __init__(self, max_samples: int = 1000,
+                 observer: Optional[Callable[[str, float], None]] = None):
+        """
+        :param max_samples: 每个阶段保留的最近样本数
+        :param observer: 每次记录时额外回调 (阶段名, 耗时秒)，用于导出监控指标
+        """
+        self.max_samples = max_samples
+        self.observer = observer
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float):
+        """记录一次阶段耗时"""
+        self._samples.setdefault(stage, deque(maxlen=self.max_samples)).append(seconds)
+        self._counts[stage] = self._counts.get(stage, 0) + 1
+        if self.observer is not None:
+            self.observer(stage, seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """返回各阶段的耗时统计（毫秒）"""
+        result = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            result[stage] = {
+                "count": self._counts[stage],
+                "avgMs": round(sum(ordered) / n * 1000, 2),
+                "p50Ms": round(ordered[n // 2] * 1000, 2),
+                "p95Ms": round(ordered[min(n - 1, int(n * 0.95))] * 1000, 2),
+                "maxMs": round(ordered[-1] * 1000, 2)
+            }
+        return result
+
+
+class BinPipeline:
+    """多阶段有界队列流水线"""
+
+    def __init__(
+        self,
+        stages: List[Tuple[str, StageFunc]],
+        queue_size: int = 4,
+        timer: Optional[StageTimer] = None,
+        on_complete: Optional[Callable[[BinJob], None]] = None,
+        workers: Optional[Dict[str, int]] = None
+    ):
+        """
+        :param stages: 按顺序执行的阶段列表 [(阶段名, 协程函数)]
+        :param queue_size: 每个阶段输入队列的容量，队列满时 submit 会等待（背压）
+        :param timer: 阶段耗时记录器
+        :param on_complete: 储位全部阶段完成后的回调
+        :param workers: 各阶段的工作协程数 {阶段名: 数量}，未指定的阶段为 1
+        """
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.timer = timer or StageTimer()
+        self.on_complete = on_complete
+        self.workers = {name: max(1, (workers or {}).get(name, 1)) for name, _ in stages}
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        # 已提交但未完成的储位，以及正在执行的阶段（按 id(job)）
+        self._active: Dict[int, BinJob] = {}
+        self._stage_tasks: Dict[int, asyncio.Task] = {}
+        self._dropped = 0
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        """流水线是否已启动"""
+        return bool(self._workers)
+
+    async def start(self):
+        """启动每个阶段的工作协程（按 workers 配置的数量）"""
+        if self.running:
+            return
+        self._stopping = False
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._workers = [
+            asyncio.create_task(self._stage_worker(i), name=f"bin-pipeline-{name}-{n}")
+            for i, (name, _) in enumerate(self.stages)
+            for n in range(self.workers[name])
+        ]
+        logger.info(f"储位流水线已启动: {' -> '.join(f'{name}x{self.workers[name]}' for name, _ in self.stages)}")
+
+    async def stop(self):
+        """停止流水线（未完成的储位会被取消）"""
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("储位流水线已停止")
+
+    async def submit(self, job: BinJob) -> asyncio.Future:
+        """
+        提交储位到流水线
+
+        第一个阶段队列已满时会等待，从而限制机器人领先下游的储位数。
+
+        :param job: 储位任务
+        :return: 该储位全部阶段完成时结束的 future
+        """
+        if not self.running:
+            await self.start()
+        job.done = asyncio.get_running_loop().create_future()
+
+        start = time.perf_counter()
+        self._active[id(job)] = job
+        try:
+            await self._queues[0].put(job)
+        except asyncio.CancelledError:
+            self._active.pop(id(job), None)
+            raise
+        wait = time.perf_counter() - start
+        job.timings["queue_wait"] = wait
+        self.timer.record("queue_wait", wait)
+        return job.done
+
+    async def run_inline(self, job: BinJob) -> BinJob:
+        """不经过队列，在当前协程中顺序执行所有阶段（顺序模式，用于对比）"""
+        for index in range(len(self.stages)):
+            await self._run_stage(index, job)
+        self._finish(job)
+        return job
+
+    def cancel_task(self, task_no: str) -> int:
+        """
+        取消盘点任务在流水线中的所有储位：排队中的储位被丢弃，正在执行的阶段被取消
+
+        :return: 取消的储位数
+        """
+        cancelled = 0
+        for key, job in list(self._active.items()):
+            if job.task_no != task_no or job.cancelled:
+                continue
+            job.cancelled = True
+            cancelled += 1
+            stage = self._stage_tasks.get(key)
+            if stage is not None:
+                stage.cancel()
+        return cancelled
+
+    def stats(self) -> Dict[str, int]:
+        """在途和已丢弃的储位数"""
+        return {"active": len(self._active), "dropped": self._dropped}
+
+    def queue_depths(self) -> Dict[str, int]:
+        """各阶段输入队列当前长度"""
+        return {name: q.qsize() for (name, _), q in zip(self.stages, self._queues)}
+
+    async def _stage_worker(self, index: int):
+        """单个阶段的工作协程：取任务、执行、交给下一阶段"""
+        queue = self._queues[index]
+        while True:
+            job: BinJob = await queue.get()
+            try:
+                if job.cancelled or not await self._run_stage(index, job):
+                    self._drop(job)
+                elif index + 1 < len(self.stages):
+                    await self._queues[index + 1].put(job)
+                else:
+                    self._finish(job)
+            finally:
+                queue.task_done()
+
+    async def _run_stage(self, index: int, job: BinJob) -> bool:
+        """执行单个阶段并记录耗时，所属任务被取消时返回 False"""
+        name, func = self.stages[index]
+        start = time.perf_counter()
+        stage = asyncio.ensure_future(func(job))
+        self._stage_tasks[id(job)] = stage
+        try:
+            job.results[name] = await stage
+        except asyncio.CancelledError:
+            # 流水线停止时继续向上抛出；仅阶段被取消说明所属任务已取消
+            if self._stopping or not job.cancelled:
+                raise
+            return False
+        except Exception as e:
+            # 单个阶段失败不影响后续阶段（如条码识别失败时仍需提交计数结果）
+            logger.error(f"流水线阶段 {name} 处理失败 {job.bin_location}: {str(e)}")
+            job.results[name] = {"success": False, "error": str(e)}
+        finally:
+            self._stage_tasks.pop(id(job), None)
+        elapsed = time.perf_counter() - start
+        job.timings[name] = elapsed
+        self.timer.record(name, elapsed)
+        return True
+
+    def _drop(self, job: BinJob):
+        """丢弃已取消任务的储位"""
+        self._active.pop(id(job), None)
+        self._dropped += 1
+        if job.done is not None and not job.done.done():
+            job.done.cancel()
+
+    def _finish(self, job: BinJob):
+        """储位处理完成"""
+        self._active.pop(id(job), None)
+        job.finished_at = time.time()
+        total = job.finished_at - job.created_at
+        job.timings["total"] = total
+        self.timer.record("total", total)
+        if self.on_complete:
+            try:
+                self.on_complete(job)
+            except Exception as e:
+                logger.error(f"流水线完成回调失败 {job.bin_location}: {str(e)}")
+        if job.done is not None and not job.done.done():
+            job.done.set_result(job)
@@ -0,0 +1,200 @@
+"""
+多相机并发抓图编排
+功能：
+1. 同时触发所有相机的抓图脚本，不再逐个执行
+2. 每个相机独立的超时时间和重试次数，超时的脚本进程会被终止
+3. 返回结构化结果，包含每个相机的耗时、尝试次数和输出
+4. 配置了常驻抓图服务（hardware/cam_sys/capture_daemon.py）时通过 HTTP 抓图，服务不可用时回退为执行脚本
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class CameraSpec(BaseModel):
+    """单个相机的抓图配置"""
+    name: str  # 相机类型，如 3d_camera、scan_camera_1
+    script: str  # 抓图脚本路径
+    timeout: float = 30.0  # 单次执行的超时时间（秒）
+    retries: int = 1  # 失败后的重试次数
+    daemon_url: Optional[str] = None  # 常驻抓图服务地址，如 http://127.0.0.1:8101
+
+
+class CaptureOrchestrator:
+    """并发执行多个相机的抓图脚本"""
+
+    def __init__(
+        self,
+        cameras: List[CameraSpec],
+        python_cmd: List[str],
+        retry_delay: float = 0.5,
+        env: Optional[Dict[str, str]] = None
+    ):
+        """
+        :param cameras: 相机配置列表
+        :param python_cmd: 执行脚本的 Python 命令，如 ["conda", "run", "-n", "tobacco_env", "python"]
+        :param retry_delay: 重试前的等待时间（秒），每次重试翻倍
+        :param env: 额外传给脚本的环境变量
+        """
+        self.cameras = cameras
+        self.python_cmd = python_cmd
+        self.retry_delay = retry_delay
+        self.env = env or {}
+
+    async def capture(self, task_no: str, bin_location: str) -> Dict[str, Any]:
+        """
+        并发触发所有相机抓图
+
+        :param task_no: 任务编号
+        :param bin_location: 储位名称
+        :return: {"success": 是否全部成功, "latency": 总耗时（秒）, "cameras": [每个相机的结果]}
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._capture_camera(camera, task_no, bin_location) for camera in self.cameras)
+        )
+        latency = time.perf_counter() - start
+
+        success_count = sum(1 for r in results if r["success"])
+        logger.info(
+            f"抓图完成: {bin_location}, 成功 {success_count}/{len(results)}, 耗时 {latency:.2f}秒")
+
+        return {
+            "success": success_count == len(results),
+            "latency": latency,
+            "cameras": results
+        }
+
+    async def _capture_camera(self, camera: CameraSpec, task_no: str, bin_location: str) -> Dict[str, Any]:
+        """执行单个相机的抓图，失败时按配置重试"""
+        start = time.perf_counter()
+
+        if not camera.daemon_url and not os.path.exists(camera.script):
+            logger.error(f"脚本文件不存在: {camera.script}")
+            return {
+                "camera": camera.name,
+                "script": os.path.basename(camera.script),
+                "success": False,
+                "attempts": 0,
+                "latency": 0.0,
+                "returncode": -1,
+                "stdout": "",
+                "stderr": "",
+                "error": "脚本文件不存在"
+            }
+
+        result: Dict[str, Any] = {}
+        attempts = 0
+        for attempt in range(camera.retries + 1):
+            attempts = attempt + 1
+            if attempt > 0:
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                logger.warning(f"相机 {camera.name} 第 {attempt} 次重试，等待 {delay:.1f}秒")
+                await asyncio.sleep(delay)
+
+            result = await self._run_once(camera, task_no, bin_location)
+            if result["success"]:
+                break
+
+        result.update({
+            "camera": camera.name,
+            "script": os.path.basename(camera.script),
+            "attempts": attempts,
+            "latency": time.perf_counter() - start
+        })
+        return result
+
+    async def _run_once(self, camera: CameraSpec, task_no: str, bin_location: str) -> Dict[str, Any]:
+        """执行一次抓图：优先请求常驻服务，服务未启动时执行脚本"""
+        if camera.daemon_url:
+            result = await self._request_daemon(camera, task_no, bin_location)
+            if result is not None:
+                return result
+            logger.warning(f"相机 {camera.name} 常驻抓图服务不可用，改为执行抓图脚本")
+        return await self._run_script(camera, task_no, bin_location)
+
+    async def _request_daemon(self, camera: CameraSpec, task_no: str, bin_location: str) -> Optional[Dict[str, Any]]:
+        """请求常驻抓图服务，无法连接时返回 None"""
+        try:
+            async with httpx.AsyncClient(timeout=camera.timeout) as client:
+                response = await client.post(
+                    f"{camera.daemon_url.rstrip('/')}/capture",
+                    json={"task_no": task_no, "bin_location": bin_location}
+                )
+            data = response.json()
+        except httpx.ConnectError:
+            return None
+        except httpx.TimeoutException:
+            logger.error(f"相机 {camera.name} 常驻抓图服务超时 ({camera.timeout}秒)")
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": "",
+                    "error": f"抓图超时（{camera.timeout}秒）"}
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"相机 {camera.name} 常驻抓图服务请求失败: {str(e)}")
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": "",
+                    "error": f"常驻抓图服务请求失败: {str(e)}"}
+
+        success = bool(data.get("success"))
+        if not success:
+            logger.error(f"相机 {camera.name} 常驻抓图服务抓图失败: {data.get('error')}")
+        return {
+            "success": success,
+            "returncode": 0 if success else 1,
+            "stdout": "",
+            "stderr": "",
+            "error": data.get("error"),
+            "daemonLatency": data.get("latency")
+        }
+
+    async def _run_script(self, camera: CameraSpec, task_no: str, bin_location: str) -> Dict[str, Any]:
+        """执行一次抓图脚本，超时则终止进程"""
+        if not os.path.exists(camera.script):
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": "",
+                    "error": "脚本文件不存在"}
+        cmd = [*self.python_cmd, os.path.abspath(camera.script),
+               "--task-no", task_no, "--bin-location", bin_location]
+        try:
+            # 在脚本所在目录执行，抓图结果写入脚本目录下的 output/
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=os.path.dirname(os.path.abspath(camera.script)),
+                env={**os.environ, **self.env}
+            )
+        except FileNotFoundError as e:
+            logger.error(f"无法启动抓图脚本 {camera.script}: {str(e)}")
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": "",
+                    "error": f"无法启动抓图脚本: {str(e)}"}
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=camera.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.error(f"相机 {camera.name} 抓图超时 ({camera.timeout}秒)")
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": "",
+                    "error": f"抓图超时（{camera.timeout}秒）"}
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+
+        stdout_text = stdout.decode("utf-8", errors="replace") if stdout else ""
+        stderr_text = stderr.decode("utf-8", errors="replace") if stderr else ""
+        if process.returncode != 0:
+            logger.error(f"相机 {camera.name} 抓图脚本执行失败: {stderr_text[-500:]}")
+
+        return {
+            "success": process.returncode == 0,
+            "returncode": process.returncode,
+            "stdout": stdout_text,
+            "stderr": stderr_text,
+            "error": None if process.returncode == 0 else "脚本返回非零退出码"
+        }
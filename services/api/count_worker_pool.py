@@ -0,0 +1,245 @@
+"""
+箱体计数进程池
+功能：
+1. 在独立进程中运行 BoxCountService（YOLO 推理 + 分层聚类），不占用网关事件循环和 GIL
+2. 每个工作进程启动时加载一次模型并预热，之后的储位直接复用
+3. 限制同时提交的计数任务数（有界并发），超出时调用方等待
+4. 单次计数超时返回失败结果；连续超时或工作进程异常退出时重建进程池
+5. 统计每次计数的排队等待和计算耗时
+6. 图片可以是文件路径、编码后的图片字节或共享内存图片（SharedImage，只传递名称和形状），
+   后两者不经过磁盘
+"""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACTORY = "services.vision.box_count_service:BoxCountService"
+RESTART_MIN_INTERVAL = 10.0  # 两次重建进程池的最短间隔（秒），避免模型加载失败时反复重建
+
+# 工作进程内的计数服务实例（每个进程一个）
+_worker_service = None
+
+
+def _init_worker(factory: str, warmup: bool):
+    """工作进程初始化：创建计数服务并预热模型"""
+    global _worker_service
+    module_name, _, attr = factory.partition(":")
+    service_cls = getattr(importlib.import_module(module_name), attr)
+    _worker_service = service_cls()
+
+    model = getattr(_worker_service, "model", None)
+    if warmup and model is not None:
+        # 用空白图片跑一次推理，完成权重加载和算子初始化
+        try:
+            import numpy as np
+            model.predict(source=np.zeros((640, 640, 3), dtype=np.uint8), save=False, verbose=False)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"计数进程预热失败: {str(e)}")
+
+
+def _ping() -> int:
+    """确认工作进程已完成初始化"""
+    time.sleep(0.1)  # 占住当前进程，让其余预热请求分配到其他进程
+    return os.getpid()
+
+
+def _count_in_worker(image: Any, pile_id: Optional[int], task_id: Optional[str],
+                     options: Dict[str, Any]) -> Dict[str, Any]:
+    """在工作进程中执行计数，返回结果和计算耗时"""
+    start = time.perf_counter()
+    result = _worker_service.count_boxes(image, pile_id, task_id, **options)
+    result["workerPid"] = os.getpid()
+    result["computeSeconds"] = time.perf_counter() - start
+    return result
+
+
+class CountWorkerPool:
+    """箱体计数进程池"""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: Optional[int] = None,
+        timeout: float = 30.0,
+        max_consecutive_timeouts: int = 2,
+        factory: str = DEFAULT_FACTORY,
+        warmup: bool = True
+    ):
+        """
+        :param workers: 工作进程数（每个进程加载一份模型）
+        :param max_pending: 同时提交到进程池的最大任务数，默认为工作进程数的 2 倍
+        :param timeout: 单次计数超时时间（秒），包含排队时间
+        :param max_consecutive_timeouts: 连续超时达到该次数时重建进程池（工作进程可能已卡死）
+        :param factory: 计数服务类的导入路径（模块:类名），工作进程中无参数构造
+        :param warmup: 工作进程启动时是否用空白图片预热模型
+        """
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.timeout = timeout
+        self.max_consecutive_timeouts = max_consecutive_timeouts
+        self.factory = factory
+        self.warmup = warmup
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._consecutive_timeouts = 0
+        self._restarts = 0
+        self._last_restart = float("-inf")
+        self._wait_total = 0.0
+        self._compute_total = 0.0
+        self._ready = False
+
+    async def start(self):
+        """创建进程池，并在后台预热所有工作进程（不阻塞网关启动）"""
+        self._semaphore = asyncio.Semaphore(self.max_pending)
+        self._create_executor()
+        self._warmup_task = asyncio.create_task(self._warmup(), name="count-pool-warmup")
+
+    def _create_executor(self):
+        # 使用 spawn 启动，避免 fork 继承网关的事件循环和已加载的 CUDA 上下文
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.factory, self.warmup)
+        )
+        self._ready = False
+
+    async def _warmup(self):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            pids = await asyncio.gather(
+                *(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+            self._ready = True
+            logger.info(
+                f"计数进程池已就绪: {len(set(pids))} 个进程, 耗时 {time.perf_counter() - start:.1f}秒")
+        except Exception as e:
+            logger.error(f"计数进程池启动失败: {str(e)}")
+
+    async def stop(self):
+        """关闭进程池（取消未开始的任务）"""
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            await asyncio.gather(self._warmup_task, return_exceptions=True)
+        if self._executor is not None:
+            executor = self._executor
+            self._executor = None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+            logger.info("计数进程池已关闭")
+
+    async def _restart(self, reason: str):
+        """重建进程池：终止旧的工作进程（包括卡死的进程）"""
+        now = time.monotonic()
+        if now - self._last_restart < RESTART_MIN_INTERVAL:
+            return
+        self._last_restart = now
+        logger.warning(f"重建计数进程池: {reason}")
+        old = self._executor
+        self._restarts += 1
+        self._consecutive_timeouts = 0
+        self._create_executor()
+        self._warmup_task = asyncio.create_task(self._warmup(), name="count-pool-warmup")
+        if old is not None:
+            for process in list((old._processes or {}).values()):
+                process.terminate()
+            await asyncio.to_thread(old.shutdown, False, cancel_futures=True)
+
+    async def count(self, image: Any, pile_id: Optional[int] = None,
+                    task_id: Optional[str] = None, archive: bool = False,
+                    bin_code: Optional[str] = None, read_barcodes: bool = False) -> Dict[str, Any]:
+        """
+        提交一张图片进行计数
+
+        :param image: 图片路径、编码后的图片字节或共享内存图片（SharedImage）；
+            数组会被序列化后传给工作进程，大图建议放入共享内存
+        :param archive: 是否在工作进程中后台归档图片到计数工作目录
+        :param bin_code: 库位代码（归档文件命名用）
+        :param read_barcodes: 是否同时识别检测到的条码（与计数共用同一次推理，结果在 barcodes 字段）
+        :return: BoxCountService.count_boxes 的结果，额外包含
+            waitSeconds（排队等待）、computeSeconds（进程内计算）、latencySeconds（总耗时）
+        """
+        if self._executor is None:
+            raise RuntimeError("计数进程池未启动")
+
+        options: Dict[str, Any] = {"archive": True, "bin_code": bin_code} if archive else {}
+        if read_barcodes:
+            options["read_barcodes"] = True
+        submitted = time.perf_counter()
+        async with self._semaphore:
+            self._in_flight += 1
+            loop = asyncio.get_running_loop()
+            try:
+                future = loop.run_in_executor(
+                    self._executor, _count_in_worker, image, pile_id, task_id, options)
+                remaining = max(self.timeout - (time.perf_counter() - submitted), 0.001)
+                result = await asyncio.wait_for(future, timeout=remaining)
+            except asyncio.TimeoutError:
+                self._timeouts += 1
+                self._consecutive_timeouts += 1
+                self._failed += 1
+                if self._consecutive_timeouts >= self.max_consecutive_timeouts:
+                    await self._restart(f"连续 {self._consecutive_timeouts} 次计数超时")
+                return self._failure(f"计数超时（{self.timeout}秒）", submitted)
+            except BrokenProcessPool as e:
+                self._failed += 1
+                await self._restart(f"工作进程异常退出: {str(e)}")
+                return self._failure("计数进程异常退出", submitted)
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"计数任务执行失败: {str(e)}")
+                return self._failure(str(e), submitted)
+            finally:
+                self._in_flight -= 1
+
+        self._consecutive_timeouts = 0
+        self._completed += 1
+        latency = time.perf_counter() - submitted
+        compute = result.get("computeSeconds", 0.0)
+        result["latencySeconds"] = latency
+        result["waitSeconds"] = max(latency - compute, 0.0)
+        self._wait_total += result["waitSeconds"]
+        self._compute_total += compute
+        return result
+
+    @staticmethod
+    def _failure(status: str, submitted: float) -> Dict[str, Any]:
+        latency = time.perf_counter() - submitted
+        return {
+            "success": False,
+            "total_count": 0,
+            "status": status,
+            "latencySeconds": latency,
+            "waitSeconds": latency,
+            "computeSeconds": 0.0
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """返回进程池的统计信息"""
+        return {
+            "workers": self.workers,
+            "ready": self._ready,
+            "maxPending": self.max_pending,
+            "inFlight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "timeouts": self._timeouts,
+            "restarts": self._restarts,
+            "avgWaitMs": round(self._wait_total / self._completed * 1000, 2) if self._completed else 0.0,
+            "avgComputeMs": round(self._compute_total / self._completed * 1000, 2) if self._completed else 0.0
+        }
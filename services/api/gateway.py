@@ -4,17 +4,41 @@ from pathlib import Path
 from fastapi.responses import StreamingResponse
 from fastapi import FastAPI, Query, HTTPException, Depends
 from fastapi import FastAPI, Request, HTTPException, status, Header, BackgroundTasks
-from fastapi.responses import JSONResponse, Response
-import requests
+from fastapi.responses import FileResponse, JSONResponse, Response
+from contextlib import asynccontextmanager
+import httpx
 import json
 import logging
 import uvicorn
+import sys
 from fastapi.middleware.cors import CORSMiddleware
-import custom_utils
+
+# 从 services/api 目录直接启动时，把项目根目录加入 sys.path 以导入 services.utils
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from services.utils import compression  # noqa: E402
+from upstream_client import UpstreamClient, UpstreamRegistry
+from robot_event_bus import RobotEventBus
+from robot_callback_log import RobotCallbackLog
+from robot_callback_store import RobotCallbackStore
+from inventory_scheduler import InventoryScheduler, InventoryProgress, SubRoute
+from task_control import TaskControlRegistry
+from bin_pipeline import BinJob, BinPipeline, StageTimer
+from capture_orchestrator import CameraSpec, CaptureOrchestrator
+from count_worker_pool import CountWorkerPool
+from image_store import ImageStore
+from task_store import TaskStore
+from bin_catalog import BinCatalog
+from token_cache import TokenCache
+from progress_broadcaster import ProgressBroadcaster
+from metrics import MetricsRegistry, EventLoopMonitor
+from middleware.request_metrics import RequestMetricsMiddleware
+from result_outbox import ResultOutbox
+from worker_cluster import WorkerCluster
 import uuid
 import time
 import asyncio
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Tuple, Union
+from urllib.parse import quote
 import base64
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -23,6 +47,7 @@ import os
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # 屏蔽每次上游请求的INFO日志
 
 # 模拟服务的地址
 LMS_BASE_URL = "http://localhost:6000"
@@ -31,7 +56,117 @@ CAMERA_BASE_URL = "http://localhost:5000"
 RCS_PREFIX = "/rcs/rtas"
 REAL_RCS_BASE_URL = "http://10.4.180.190:80/rcs/rtas"
 
-app = FastAPI(title="Gateway", version="1.0.0")
+# 上游连接池配置
+UPSTREAM_TIMEOUT = 30  # 默认超时时间（秒）
+LMS_MAX_CONCURRENCY = 10  # LMS 最大并发请求数
+RCS_MAX_CONCURRENCY = 10  # RCS 最大并发请求数
+
+# 监控指标（/metrics，Prometheus 文本格式）
+EVENT_LOOP_LAG_INTERVAL = 0.5  # 事件循环延迟采样间隔（秒）
+
+metrics = MetricsRegistry(prefix="gateway_")
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "接口请求耗时（到响应头发出）", ("route", "method", "status"))
+upstream_request_seconds = metrics.histogram(
+    "upstream_request_duration_seconds", "上游服务请求耗时", ("upstream", "method", "outcome"))
+inventory_stage_seconds = metrics.histogram(
+    "inventory_stage_duration_seconds", "盘点流程各阶段耗时（等待机器人、各相机抓图、计数、提交等）", ("stage",))
+event_loop_lag_seconds = metrics.histogram(
+    "event_loop_lag_seconds", "事件循环调度延迟",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+event_loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "最近一次采样的事件循环延迟")
+event_loop_monitor = EventLoopMonitor(event_loop_lag_seconds, event_loop_lag_last, EVENT_LOOP_LAG_INTERVAL)
+
+
+def observe_upstream_request(upstream: str, method: str, outcome: str, seconds: float):
+    """记录上游请求耗时"""
+    upstream_request_seconds.observe(seconds, upstream=upstream, method=method, outcome=outcome)
+
+
+# 上游客户端（每个上游独立的连接池和并发上限）
+upstreams = UpstreamRegistry()
+lms_client = upstreams.register(UpstreamClient(
+    "lms", LMS_BASE_URL,
+    max_concurrency=LMS_MAX_CONCURRENCY,
+    timeout=UPSTREAM_TIMEOUT,
+    observer=observe_upstream_request
+))
+rcs_client = upstreams.register(UpstreamClient(
+    "rcs", f"{RCS_BASE_URL}{RCS_PREFIX}",
+    max_concurrency=RCS_MAX_CONCURRENCY,
+    timeout=UPSTREAM_TIMEOUT,
+    observer=observe_upstream_request
+))
+metrics.gauge(
+    "upstream_in_flight", "上游服务在途请求数", ("upstream",),
+    callback=lambda: {(name, ): stats["inFlight"] for name, stats in upstreams.stats().items()})
+
+
+# 多进程部署（uvicorn --workers N）：工作进程间广播机器人回调、盘点进度，
+# 由主进程恢复无人执行的盘点任务并提交盘点结果
+GATEWAY_WORKERS = int(os.environ.get("GATEWAY_WORKERS", 1))  # 网关工作进程数
+GATEWAY_STATE_DIR = os.environ.get("GATEWAY_STATE_DIR", "gateway_state")  # 工作进程共享的状态目录
+ORPHAN_TASK_SCAN_INTERVAL = 30  # 主进程检查执行者已退出的盘点任务的间隔（秒）
+
+worker_cluster = WorkerCluster(GATEWAY_STATE_DIR)
+# 主进程中运行的后台任务（巡检任务），退出时取消
+leader_tasks: List[asyncio.Task] = []
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """网关生命周期：启动时创建上游连接池、打开任务存储和结果发件箱并加入工作进程集群，退出时关闭"""
+    await upstreams.start_all()
+    await event_loop_monitor.start()
+    await task_store.open()
+    # 其他工作进程已先写入的回调在本进程被计为接收，写入时发现后改计为重复
+    await robot_callback_store.open(on_robot_event, lambda: worker_cluster.publish("robot", {}),
+                                    robot_callback_log.mark_duplicates)
+    await count_pool.start()
+    await asyncio.to_thread(image_store.load_index)
+    # 盘点结果只由主进程提交，成为主进程时再开始
+    await result_outbox.start(deliver=False)
+    await bin_pipeline.start()
+    await worker_cluster.start()
+    yield
+    # 网关退出导致的取消不标记任务为已取消，任务保持未完成状态，由主进程接管或重启后恢复
+    for task in leader_tasks + task_controls.tasks():
+        task.cancel()
+    await asyncio.gather(*leader_tasks, *task_controls.tasks(), return_exceptions=True)
+    await bin_pipeline.stop()
+    await count_pool.stop()
+    await result_outbox.stop()
+    await robot_callback_store.close()
+    await task_store.close()
+    # 最后退出集群：释放存活锁后，本进程的未完成任务才会被其他进程接管
+    await worker_cluster.stop()
+    await event_loop_monitor.stop()
+    await upstreams.close_all()
+
+
+async def on_become_leader():
+    """成为主进程：清理过期任务、开始提交盘点结果、接管无人执行的盘点任务"""
+    purged = await task_store.purge_before(time.time() - TASK_RETENTION_DAYS * 86400)
+    if purged:
+        logger.info(f"已清理 {purged} 个过期盘点任务")
+    result_outbox.start_delivery()
+    leader_tasks.append(asyncio.create_task(recover_orphan_tasks(), name="recover-orphan-tasks"))
+
+
+async def recover_orphan_tasks():
+    """定期恢复执行者已退出的盘点任务（网关重启、工作进程异常退出）"""
+    while True:
+        try:
+            await resume_inventory_tasks()
+        except Exception as e:
+            logger.error(f"恢复盘点任务失败: {str(e)}")
+        await asyncio.sleep(ORPHAN_TASK_SCAN_INTERVAL)
+
+
+worker_cluster.on_leader(on_become_leader)
+
+
+app = FastAPI(title="Gateway", version="1.0.0", lifespan=lifespan)
 
 # 定义允许的源列表
 origins = [
@@ -50,16 +185,25 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware, histogram=http_request_seconds)
 
-robot_status_store = {}
-status_events = {}
-task_timeouts = {}
+TASK_TIMEOUT = 300  # 超时时间（秒）
+ROBOT_EVENT_QUEUE_SIZE = 100  # 每个机器人任务缓存的最大未消费事件数
+ROBOT_EVENT_KEY_TTL = 2 * TASK_TIMEOUT  # 没有活动的机器人任务事件保留时间（秒），长于单次等待的超时
+ROBOT_EVENT_MAX_KEYS = 10000  # 最多保留事件的机器人任务数
 
+# 机器人状态事件总线（按 robotTaskCode / singleRobotCode 分键）
+robot_event_bus = RobotEventBus(max_events_per_key=ROBOT_EVENT_QUEUE_SIZE,
+                                key_ttl=ROBOT_EVENT_KEY_TTL, max_keys=ROBOT_EVENT_MAX_KEYS)
 
-STATUS_KEY = "ldui_2025"  # 固定状态键
-status_event = asyncio.Event()  # 单个事件对象
-robot_status_store: Dict[str, Any] = {}  # 状态存储
-TASK_TIMEOUT = 300  # 超时时间（秒）
+# 机器人回调去重与事件历史：RCS 重试的重复回调不会重复唤醒等待者
+ROBOT_CALLBACK_DEDUP_WINDOW = 300  # 去重时间窗口（秒）
+ROBOT_CALLBACK_HISTORY_SIZE = 500  # 每台机器人保留的最近回调事件数
+
+robot_callback_log = RobotCallbackLog(
+    dedup_window=ROBOT_CALLBACK_DEDUP_WINDOW,
+    history_per_robot=ROBOT_CALLBACK_HISTORY_SIZE
+)
 
 
 # 抓图脚本路径配置
@@ -68,61 +212,151 @@ CAPTURE_SCRIPTS = [
     "../cam_sys_ok/build/scan_1_capture.py",  # 第二个抓图脚本
     "../cam_sys_ok/build/scan_2_capture.py"   # 第三个抓图脚本
 ]
+CAPTURE_CAMERA_TYPES = ["3d_camera", "scan_camera_1", "scan_camera_2"]  # 与抓图脚本一一对应
+CAPTURE_CONDA_ENV = "tobacco_env"  # 执行抓图脚本的 Conda 环境
+CAPTURE_TIMEOUT = 30  # 单个相机抓图超时时间（秒）
+CAPTURE_RETRIES = 1  # 单个相机抓图失败后的重试次数
+# 相机常驻抓图服务地址（hardware/cam_sys/capture_daemon.py），服务未启动时回退为执行抓图脚本
+CAPTURE_DAEMON_URLS = {
+    "3d_camera": "http://127.0.0.1:8101",
+    "scan_camera_1": "http://127.0.0.1:8102",
+    "scan_camera_2": "http://127.0.0.1:8103"
+}
+# 抓图输出目录（脚本在自身目录下执行），图片按 任务号/储位/相机类型 存放
+CAPTURE_OUTPUT_DIR = os.path.join(os.path.dirname(CAPTURE_SCRIPTS[0]), "output")
+
+# 三个相机并发抓图，每个相机独立超时和重试
+capture_orchestrator = CaptureOrchestrator(
+    cameras=[
+        CameraSpec(name=camera_type, script=script,
+                   timeout=CAPTURE_TIMEOUT, retries=CAPTURE_RETRIES,
+                   daemon_url=CAPTURE_DAEMON_URLS.get(camera_type))
+        for camera_type, script in zip(CAPTURE_CAMERA_TYPES, CAPTURE_SCRIPTS)
+    ],
+    python_cmd=["conda", "run", "-n", CAPTURE_CONDA_ENV, "python"]
+)
+
+
+# 盘点任务持久化存储：任务和储位状态、储位结果写入 SQLite，重启后恢复未完成的任务
+TASK_DB_PATH = os.environ.get("TASK_DB_PATH", "inventory_tasks.db")
+TASK_DB_BATCH_SIZE = 50  # 储位状态更新批量写入的条数
+TASK_DB_FLUSH_INTERVAL = 1.0  # 储位状态更新最长延迟写入时间（秒）
+TASK_RETENTION_DAYS = 30  # 已结束任务的保留天数
+
+task_store = TaskStore(TASK_DB_PATH, TASK_DB_BATCH_SIZE, TASK_DB_FLUSH_INTERVAL)
+
+# 盘点进度推送：储位状态变化通过 SSE 推送给前端，消费慢的连接只丢弃自己的旧事件
+PROGRESS_QUEUE_SIZE = 100  # 每个连接最多缓存的未发送事件数
+PROGRESS_HISTORY_SIZE = 500  # 每个任务保留的最近事件数（新连接/重连时补发）
+
+progress_broadcaster = ProgressBroadcaster(PROGRESS_QUEUE_SIZE, PROGRESS_HISTORY_SIZE)
+
 
+def publish_progress(task_no: str, event_type: str, **data: Any):
+    """发布盘点进度事件（同时广播给其他工作进程，连接在任意进程上的 SSE 都能收到）"""
+    progress_broadcaster.publish(task_no, event_type, data)
+    worker_cluster.publish("progress", {"taskNo": task_no, "type": event_type, "data": data})
 
-class TaskStatus(BaseModel):
-    task_no: str
-    status: str  # init, running, completed, failed
-    current_step: int
-    total_steps: int
 
+worker_cluster.subscribe(
+    "progress", lambda message: progress_broadcaster.publish(message["taskNo"], message["type"], message["data"]))
 
-# 全局任务状态存储（生产环境建议使用数据库或Redis）
-inventory_tasks: Dict[str, TaskStatus] = {}
+# 多机器人调度配置
+INVENTORY_ROBOTS = ["ROBOT001"]  # 参与盘点的机器人编号
+ROBOT_ROUTE_CAPACITY = 50  # 单条子路线最多包含的储位数
+
+# 多进程部署时同一台机器人的子路线通过共享状态目录中的文件锁跨进程排队
+inventory_scheduler = InventoryScheduler(INVENTORY_ROBOTS, ROBOT_ROUTE_CAPACITY,
+                                         robot_lock=lambda robot_code: worker_cluster.lock(f"robot-{robot_code}"))
+
+# 盘点任务运行控制：每个工作流是独立的 asyncio 任务，可取消、暂停和继续
+task_controls = TaskControlRegistry()
+
+# 储位流水线配置：抓图后立即释放机器人，计数/条码识别/结果提交在下游阶段执行
+PIPELINE_MODE = True  # False 时按顺序处理完一个储位再释放机器人
+PIPELINE_QUEUE_SIZE = 4  # 每个阶段的队列容量，机器人最多领先下游的储位数
+
+# 箱体计数进程池：每个进程常驻一份 BoxCountService（YOLO 模型），计数不阻塞事件循环
+COUNT_WORKERS = int(os.environ.get("COUNT_WORKERS", 2))  # 计数进程数
+COUNT_MAX_PENDING = COUNT_WORKERS * 2  # 同时提交的最大计数任务数
+COUNT_TIMEOUT = 30.0  # 单个储位计数超时时间（秒，含排队）
+
+count_pool = CountWorkerPool(
+    workers=COUNT_WORKERS,
+    max_pending=COUNT_MAX_PENDING,
+    timeout=COUNT_TIMEOUT
+)
 
 ######################################### 盘点任务接口 #########################################
 
 
 @app.post("/api/inventory/start-inventory")
-async def start_inventory(request: Request, background_tasks: BackgroundTasks):
-    """启动盘点任务，接收任务编号和储位名称列表"""
+async def start_inventory(request: Request):
+    """
+    启动盘点任务，接收任务编号和储位名称列表
+
+    binLocations 可以是储位名称（binDesc）字符串，也可以是包含 binDesc 和 areaCode 的对象，
+    后者用于按库区分组调度
+    """
     try:
         data = await request.json()
         task_no = data.get("taskNo")
-        bin_locations = data.get("binLocations", [])
+        raw_locations = data.get("binLocations", [])
 
-        if not task_no or not bin_locations:
+        if not task_no or not raw_locations:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="任务编号和储位名称列表不能为空"
             )
 
+        # 解析储位列表
+        bin_locations = []
+        bin_areas = {}
+        for item in raw_locations:
+            if isinstance(item, dict):
+                location = item.get("binDesc") or item.get("binCode")
+                if item.get("areaCode"):
+                    bin_areas[location] = item["areaCode"]
+            else:
+                location = item
+            bin_locations.append(location)
+
         logger.info(f"启动盘点任务: {task_no}, 包含 {len(bin_locations)} 个储位")
 
-        # 检查任务是否已存在
-        target_route = []
-        for index, location in enumerate(bin_locations):
-            if location in inventory_tasks:
-                existing_task = inventory_tasks[location]
-                if existing_task.status in ["running"]:
-                    return JSONResponse(
-                        status_code=status.HTTP_200_OK,
-                        content={
-                            "code": 200,
-                            "message": "任务已在执行中",
-                            "data": {
-                                "taskNo": existing_task.task_no,
-                                "status": existing_task.status,
-                            }
-                        }
-                    )
-
-        # 在后台异步执行盘点任务
-        background_tasks.add_task(
-            execute_inventory_workflow,
-            task_no=task_no,
-            bin_locations=bin_locations
-        )
+        # 检查任务是否已存在（可能由其他工作进程执行）
+        if task_controls.get(task_no) is not None or await is_task_running_elsewhere(task_no):
+            return JSONResponse(
+                status_code=status.HTTP_200_OK,
+                content={
+                    "code": 200,
+                    "message": "任务已在执行中",
+                    "data": {
+                        "taskNo": task_no,
+                        "status": "running",
+                    }
+                }
+            )
+
+        # 已抓图但尚未提交结果（captured）的储位同样仍在盘点中
+        running_bins = (await task_store.find_bins(bin_locations, "running")
+                        or await task_store.find_bins(bin_locations, "captured"))
+        if running_bins:
+            return JSONResponse(
+                status_code=status.HTTP_200_OK,
+                content={
+                    "code": 200,
+                    "message": "任务已在执行中",
+                    "data": {
+                        "taskNo": running_bins[0]["taskNo"],
+                        "status": running_bins[0]["status"],
+                    }
+                }
+            )
+
+        await task_store.create_task(task_no, bin_locations, bin_areas, owner=worker_cluster.worker_id)
+
+        # 在后台异步执行盘点任务（登记后可取消/暂停）
+        task_controls.start(task_no, execute_inventory_workflow(task_no, bin_locations, bin_areas))
 
         # 1.调用盘点任务下发接口
 
@@ -156,28 +390,255 @@ async def start_inventory(request: Request, background_tasks: BackgroundTasks):
         )
 
 
-async def execute_inventory_workflow(task_no: str, bin_locations: List[str]):
-    """执行完整的盘点工作流"""
+async def is_task_running_elsewhere(task_no: str) -> bool:
+    """任务是否未结束且执行它的工作进程仍在运行"""
+    task = await task_store.get_task(task_no)
+    return (task is not None and task["status"] in ("init", "running")
+            and worker_cluster.is_alive(task["owner"]))
+
+
+@app.get("/api/inventory/{task_no}/progress")
+async def get_inventory_progress(task_no: str):
+    """查询盘点任务汇总进度（含每台机器人的储位/小时）"""
+    progress = inventory_scheduler.get_progress(task_no)
+    if progress is not None:
+        control = task_controls.get(task_no)
+        return {"code": 200, "data": {**progress.to_dict(), "paused": control is not None and control.paused}}
+
+    # 任务由其他工作进程执行（或网关已重启）：按任务存储中的储位状态汇总
+    task = await task_store.get_task(task_no)
+    if task is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"未找到盘点任务: {task_no}"
+        )
+    return {
+        "code": 200,
+        "data": {
+            "taskNo": task_no,
+            "status": task["status"],
+            "totalBins": task["totalBins"],
+            "completedBins": task["binCounts"].get("completed", 0),
+            "failedBins": task["binCounts"].get("failed", 0),
+            "routes": [],
+            "robots": {},
+            "paused": False
+        }
+    }
+
+
+def apply_task_control(task_no: str, action: str) -> bool:
+    """
+    在本进程中对运行中的任务执行 cancel / pause / resume
+
+    :return: 任务是否在本进程中运行
+    """
+    if action == "cancel":
+        if not task_controls.cancel(task_no):
+            return False
+        dropped = bin_pipeline.cancel_task(task_no)
+        if dropped:
+            logger.info(f"已取消流水线中的 {dropped} 个储位: {task_no}")
+    elif action == "pause":
+        if not task_controls.pause(task_no):
+            return False
+        publish_progress(task_no, "task_paused")
+    elif action == "resume":
+        if not task_controls.resume(task_no):
+            return False
+        publish_progress(task_no, "task_resumed")
+    else:
+        raise ValueError(f"未知的任务控制操作: {action}")
+    return True
+
+
+worker_cluster.subscribe("task_control", lambda message: apply_task_control(message["taskNo"], message["action"]))
+
+
+async def control_inventory_task(task_no: str, action: str) -> Dict[str, Any]:
+    """对运行中的任务执行控制操作，任务由其他工作进程执行时转发给该进程"""
+    if apply_task_control(task_no, action):
+        return {"code": 200, "data": {"taskNo": task_no, "action": action, "forwarded": False}}
+    if await is_task_running_elsewhere(task_no):
+        worker_cluster.publish("task_control", {"taskNo": task_no, "action": action})
+        return {"code": 200, "data": {"taskNo": task_no, "action": action, "forwarded": True}}
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"未找到运行中的盘点任务: {task_no}"
+    )
+
+
+@app.post("/api/inventory/{task_no}/cancel")
+async def cancel_inventory(task_no: str):
+    """取消盘点任务：立即释放等待中的机器人回调、抓图进程和排队中的计数任务，未完成的储位标记为已取消"""
+    return await control_inventory_task(task_no, "cancel")
+
+
+@app.post("/api/inventory/{task_no}/pause")
+async def pause_inventory(task_no: str):
+    """暂停盘点任务：当前储位处理完成后机器人停在原地"""
+    return await control_inventory_task(task_no, "pause")
+
+
+@app.post("/api/inventory/{task_no}/resume")
+async def resume_inventory(task_no: str):
+    """继续已暂停的盘点任务"""
+    return await control_inventory_task(task_no, "resume")
+
+
+@app.get("/api/inventory/control/stats")
+async def task_control_stats():
+    """查询本进程中运行的盘点任务及其暂停/取消状态"""
+    return {"code": 200, "data": {**task_controls.stats(), "pipeline": bin_pipeline.stats()}}
+
+
+@app.get("/api/inventory/events")
+async def inventory_events(request: Request):
+    """订阅所有盘点任务的进度事件（SSE）"""
+    return inventory_event_stream(request, None)
+
+
+@app.get("/api/inventory/{task_no}/events")
+async def inventory_task_events(task_no: str, request: Request):
+    """订阅单个盘点任务的进度事件（SSE），连接时补发该任务最近的事件"""
+    return inventory_event_stream(request, task_no)
+
+
+def inventory_event_stream(request: Request, task_no: Optional[str]) -> StreamingResponse:
+    """创建 SSE 响应，断线重连时根据 Last-Event-ID 补发遗漏的事件"""
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_event_id = 0
+    return StreamingResponse(
+        progress_broadcaster.stream(task_no, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def execute_inventory_workflow(task_no: str, bin_locations: List[str],
+                                     bin_areas: Optional[Dict[str, str]] = None):
+    """执行完整的盘点工作流：按机器人拆分子路线并发执行"""
     logger.info(f"开始执行盘点工作流: {task_no}, 共 {len(bin_locations)} 个储位")
 
-    # 初始化任务状态
-    task_status = TaskStatus(
-        task_no=task_no,
-        status="init",
-        current_step=1,
-        total_steps=len(bin_locations)
+    await task_store.set_task_status(task_no, "running")
+    publish_progress(task_no, "task_started", totalBins=len(bin_locations))
+    try:
+        progress = await inventory_scheduler.run(
+            task_no, bin_locations, execute_route_workflow, bin_areas)
+    except asyncio.CancelledError:
+        if not task_controls.is_cancelled(task_no):
+            # 网关退出，任务保持未完成状态
+            raise
+        control = task_controls.get(task_no)
+        cancelled_bins = await task_store.cancel_bins(task_no)
+        await task_store.set_task_status(task_no, "cancelled")
+        publish_progress(task_no, "task_cancelled", reason=control.cancel_reason, cancelledBins=cancelled_bins)
+        logger.info(f"盘点任务已取消: {task_no}, 释放 {cancelled_bins} 个未完成储位")
+        return
+    await task_store.set_task_status(task_no, progress.status)
+    publish_progress(task_no, "task_finished", **progress.to_dict())
+
+    if progress.status == "completed":
+        logger.info(f"盘点任务完成: {task_no}, 成功处理 {len(bin_locations)} 个储位")
+    else:
+        logger.error(f"盘点任务失败: {task_no}")
+
+
+async def resume_inventory_tasks() -> List[asyncio.Task]:
+    """恢复执行者已退出的未完成盘点任务，从未完成的储位继续执行（仅在主进程中调用）"""
+    tasks = []
+    for task in await task_store.unfinished_tasks():
+        task_no = task["taskNo"]
+        if task_controls.get(task_no) is not None or worker_cluster.is_alive(task["owner"]):
+            continue
+        # 条件更新执行者，避免与其他进程重复接管
+        if not await task_store.claim_task(task_no, worker_cluster.worker_id, task["owner"]):
+            continue
+        if not task["binLocations"]:
+            await task_store.set_task_status(task_no, "completed")
+            continue
+        logger.info(f"恢复未完成的盘点任务: {task_no}, 剩余 {len(task['binLocations'])} 个储位")
+        tasks.append(task_controls.start(
+            task_no, execute_inventory_workflow(task_no, task["binLocations"], task["binAreas"])))
+    return tasks
+
+
+@app.get("/api/inventory/tasks")
+async def list_inventory_tasks(task_status: Optional[str] = Query(None, alias="status"),
+                               limit: int = Query(100, ge=1, le=1000)):
+    """按状态查询盘点任务"""
+    return {"code": 200, "data": await task_store.list_tasks(task_status, limit)}
+
+
+@app.get("/api/inventory/tasks/{task_no}")
+async def get_inventory_task(task_no: str):
+    """查询盘点任务及各状态的储位数"""
+    task = await task_store.get_task(task_no)
+    if task is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"未找到盘点任务: {task_no}"
+        )
+    return {"code": 200, "data": task}
+
+
+@app.get("/api/inventory/tasks/{task_no}/bins")
+async def list_inventory_bins(task_no: str, bin_status: Optional[str] = Query(None, alias="status")):
+    """查询盘点任务的储位状态，可按状态过滤"""
+    return {"code": 200, "data": await task_store.list_bins(task_no, bin_status)}
+
+
+def report_bin(progress: InventoryProgress, robot_code: str, bin_location: str,
+               success: bool, error: Optional[str] = None):
+    """记录储位处理结果并推送 bin_done / bin_failed 进度事件"""
+    progress.record_bin(robot_code, success)
+    summary = progress.to_dict()
+    publish_progress(
+        progress.task_no, "bin_done" if success else "bin_failed",
+        binLocation=bin_location,
+        robotCode=robot_code,
+        error=error,
+        completedBins=summary["completedBins"],
+        failedBins=summary["failedBins"],
+        totalBins=summary["totalBins"]
     )
 
-    for index, location in enumerate(bin_locations):
-        inventory_tasks[location] = task_status
 
-    # 整体下发盘点任务
-    method = "start"
-    await update_robot_status(method)
+def report_bin_results(progress: InventoryProgress, robot_code: str, bin_location: str,
+                       results: Dict[str, Any]):
+    """储位下游阶段全部执行完后上报：结果提交成功为 bin_done，否则标记为失败"""
+    submit = results.get("submit", {})
+    if submit.get("success", False):
+        report_bin(progress, robot_code, bin_location, True)
+    else:
+        task_store.update_bin(progress.task_no, bin_location, status="failed")
+        report_bin(progress, robot_code, bin_location, False, submit.get("error"))
+
+
+async def execute_route_workflow(progress: InventoryProgress, route: SubRoute) -> bool:
+    """执行单台机器人的一条子路线，返回是否全部成功"""
+    task_no = progress.task_no
+    bin_locations = route.bin_locations
+    logger.info(f"开始执行子路线: {route.route_no} ({route.robot_code}), 共 {len(bin_locations)} 个储位")
 
-    submit_result = await submit_inventory_task(task_no, bin_locations)
+    # 记录储位所属的机器人和子路线
+    for location in bin_locations:
+        task_store.update_bin(task_no, location, status="init",
+                              robot_code=route.robot_code, route_no=route.route_no)
+
+    # 机器人任务编号由网关生成，回调事件按此编号分发
+    robot_task_code = f"{route.route_no}-{uuid.uuid4().hex[:8]}"
 
     try:
+        # 流水线中尚未处理完成的储位
+        pending_jobs = []
+
+        # 整体下发子路线
+        submit_result = await submit_inventory_task(
+            task_no, bin_locations, robot_task_code, route.robot_code)
+
         # 循环处理每个储位
         for i, bin_location in enumerate(bin_locations):
             logger.info(f"开始处理储位 {i+1}/{len(bin_locations)}: {bin_location}")
@@ -187,17 +648,39 @@ async def execute_inventory_workflow(task_no: str, bin_locations: List[str]):
                 task_no=task_no,
                 bin_location=bin_location,
                 index=i,
-                total=len(bin_locations)
+                total=len(bin_locations),
+                robot_task_code=robot_task_code,
+                robot_code=route.robot_code
             )
+            pipeline_done = result.pop("pipelineDone", None)
 
             # 保存结果
-            if (result["status"] == "success"):
-                inventory_tasks[bin_location].status = "completed"
-            else:
-                inventory_tasks[bin_location].status = "failed"
+            if result["status"] != "success":
+                report_bin(progress, route.robot_code, bin_location, False, result.get("error"))
+                task_store.update_bin(task_no, bin_location, status="failed")
                 raise Exception("储位处理失败，终止任务")
+            if pipeline_done is None:
+                # 顺序模式：下游阶段已执行完
+                report_bin_results(progress, route.robot_code, bin_location, result.get("computeResult", {}))
+            else:
+                # 流水线模式：储位目前只是 captured，提交阶段完成后才上报（任务取消导致储位被丢弃时不上报）
+                pipeline_done.add_done_callback(
+                    lambda done, location=bin_location: done.cancelled() or report_bin_results(
+                        progress, route.robot_code, location, done.result().results))
+                pending_jobs.append(pipeline_done)
 
-        logger.info(f"盘点任务完成: {task_no}, 成功处理 {len(bin_locations)} 个储位")
+        # 等待流水线处理完本子路线的所有储位
+        if pending_jobs:
+            await asyncio.gather(*pending_jobs)
+
+        logger.info(f"子路线完成: {route.route_no}, 成功处理 {len(bin_locations)} 个储位")
+        return True
+
+    except asyncio.CancelledError:
+        if task_controls.is_cancelled(task_no):
+            # 主动取消：通知RCS取消机器人任务
+            await cancel_robot_task(robot_task_code)
+        raise
 
         # 发送任务完成通知
         # try:
@@ -219,7 +702,7 @@ async def execute_inventory_workflow(task_no: str, bin_locations: List[str]):
 
     except Exception as e:
         # 任务执行过程中出现异常
-        logger.error(f"盘点任务失败: {task_no}, 错误: {str(e)}")
+        logger.error(f"子路线失败: {route.route_no}, 错误: {str(e)}")
 
         # 发送任务失败通知
         # try:
@@ -236,10 +719,19 @@ async def execute_inventory_workflow(task_no: str, bin_locations: List[str]):
         #         await client.post("/api/notification/task-error", json=error_payload)
         # except Exception as e2:
         #     logger.error(f"发送任务失败通知失败: {str(e2)}")
+        return False
+
+    finally:
+        discard_robot_events(robot_task_code)
 
 
-async def process_single_bin_location(task_no: str, bin_location: str, index: int, total: int):
-    """处理单个储位的完整流程"""
+async def process_single_bin_location(task_no: str, bin_location: str, index: int, total: int,
+                                      robot_task_code: str, robot_code: Optional[str] = None):
+    """
+    处理单个储位的完整流程
+
+    流水线模式下，返回结果中的 pipelineDone 为该储位下游处理完成时结束的 future
+    """
     result = {
         "binLocation": bin_location,
         "sequence": index + 1,
@@ -250,63 +742,110 @@ async def process_single_bin_location(task_no: str, bin_location: str, index: in
 
     try:
         # 更新任务状态
-        if bin_location in inventory_tasks:
-            inventory_tasks[bin_location].status = "running"
-            inventory_tasks[bin_location].current_step = index + 1
-
-            # 等待机器人就位
-            logger.info(f"============等待机器人就位信息: {bin_location}")
-            try:
-                ctu_status = await wait_for_robot_status("end", timeout=300)
+        task_store.update_bin(task_no, bin_location, status="running")
 
-                # 这个判断一定会执行，因为wait_for_robot_status会阻塞直到收到end状态或超时
-                if ctu_status and ctu_status.get("method") == "end":
+        # 等待机器人就位
+        logger.info(f"============等待机器人就位信息: {bin_location}")
+        cycle_start = time.perf_counter()
+        try:
+            ctu_status = await wait_for_robot_status(robot_task_code, "end", timeout=TASK_TIMEOUT)
+            arrived_at = time.perf_counter()
+            stage_timer.record("wait_robot", arrived_at - cycle_start)
+            publish_progress(task_no, "robot_arrived", binLocation=bin_location, robotCode=robot_code)
+
+            # 这个判断一定会执行，因为wait_for_robot_status会阻塞直到收到end状态或超时
+            if ctu_status and ctu_status.get("method") == "end":
+
+                # 执行抓图脚本
+                capture_results = await capture_images_with_scripts(task_no, bin_location)
+                result["captureResults"] = capture_results
+                captured_at = time.perf_counter()
+                stage_timer.record("capture", captured_at - arrived_at)
+                for camera_result in capture_results:
+                    stage_timer.record(f"capture_{camera_result['camera']}", camera_result["latency"])
+
+                # 检查抓图结果
+                successful_scripts = sum(
+                    1 for r in capture_results if r.get("success"))
+                if successful_scripts < len(CAPTURE_SCRIPTS):
+                    logger.warning(
+                        f"部分抓图脚本执行失败: {successful_scripts}/{len(CAPTURE_SCRIPTS)}")
+                else:
+                    logger.info(f"所有抓图脚本执行成功: {bin_location}")
+
+                # 抓图完成后的计数、条码识别、结果提交
+                images = find_capture_images(task_no, bin_location)
+                publish_progress(
+                    task_no, "captured",
+                    binLocation=bin_location,
+                    cameras=[
+                        {"camera": r["camera"], "success": r["success"], "latencyMs": round(r["latency"] * 1000, 1)}
+                        for r in capture_results
+                    ],
+                    images=image_urls(task_no, bin_location, images),
+                    thumbnails=image_urls(task_no, bin_location, images, PROGRESS_THUMB_WIDTH)
+                )
+                job = BinJob(
+                    task_no=task_no,
+                    bin_location=bin_location,
+                    robot_code=robot_code,
+                    images=images,
+                    timings={
+                        "wait_robot": arrived_at - cycle_start,
+                        "capture": captured_at - arrived_at
+                    }
+                )
+                if PIPELINE_MODE:
+                    # 流水线模式：交给下游阶段处理，机器人立即前往下一个储位
+                    # 先记录 captured，submit_stage 写入结果后改为 completed
+                    task_store.update_bin(task_no, bin_location, status="captured")
+                    result["pipelineDone"] = await bin_pipeline.submit(job)
+                else:
+                    # 顺序模式：当前储位处理完成后才释放机器人
+                    await bin_pipeline.run_inline(job)
+                    result["computeResult"] = job.results
 
-                    # 执行抓图脚本
-                    capture_results = await capture_images_with_scripts(task_no, bin_location)
-                    result["captureResults"] = capture_results
+                paused = 0.0
+                if ((index + 1) < total):
+                    logger.info(f"收到机器人结束状态: {bin_location}")
 
-                    # 检查抓图结果
-                    successful_scripts = sum(
-                        1 for r in capture_results if r.get("success"))
-                    if successful_scripts < len(CAPTURE_SCRIPTS):
-                        logger.warning(
-                            f"部分抓图脚本执行失败: {successful_scripts}/{len(CAPTURE_SCRIPTS)}")
-                    else:
-                        logger.info(f"所有抓图脚本执行成功: {bin_location}")
+                    # 任务暂停时机器人停在当前储位，继续后再前往下一个储位
+                    pause_start = time.perf_counter()
+                    await task_controls.checkpoint(task_no)
+                    paused = time.perf_counter() - pause_start
 
-                    if ((index + 1) < total):
-                        logger.info(f"收到机器人结束状态: {bin_location}")
+                    # 只有在收到end状态后才调用继续任务接口
+                    continue_result = await continue_inventory_task(robot_task_code)
+                    logger.info(f"继续任务接口调用结果: {continue_result}")
+                    result["continueResult"] = continue_result
 
-                        # 只有在收到end状态后才调用继续任务接口
-                        continue_result = await continue_inventory_task()
-                        logger.info(f"继续任务接口调用结果: {continue_result}")
-                        result["continueResult"] = continue_result
+                # 单储位周期：从开始等待机器人到机器人被释放（不含暂停时间）
+                stage_timer.record("robot_cycle", time.perf_counter() - cycle_start - paused)
 
-                else:
-                    # 正常情况下不会执行到这里，除非wait_for_robot_status返回了非end状态
-                    logger.warning(f"未收到预期的结束状态，当前状态: {ctu_status}")
+            else:
+                # 正常情况下不会执行到这里，除非wait_for_robot_status返回了非end状态
+                logger.warning(f"未收到预期的结束状态，当前状态: {ctu_status}")
 
-            except asyncio.TimeoutError as e:
-                logger.error(f"等待机器人结束状态超时: {str(e)}")
-                result["error"] = "等待机器人结束状态超时"
-                raise
+        except asyncio.TimeoutError as e:
+            logger.error(f"等待机器人结束状态超时: {str(e)}")
+            result["error"] = "等待机器人结束状态超时"
+            raise
 
-            # # 2. 机器人就位后调用抓图接口
-            # image_data = await capture_image(task_no, bin_location)
-            # result["imageData"] = image_data
-            # result["captureTime"] = image_data.get("captureTime")
+        # # 2. 机器人就位后调用抓图接口
+        # image_data = await capture_image(task_no, bin_location)
+        # result["imageData"] = image_data
+        # result["captureTime"] = image_data.get("captureTime")
 
-            # # 3. 抓图成功后调用计算接口
-            # compute_result = await compute_inventory(task_no, bin_location, image_data)
-            # result["computeResult"] = compute_result
-            # result["computeTime"] = datetime.now().isoformat()
+        # # 3. 抓图成功后调用计算接口
+        # compute_result = await compute_inventory(task_no, bin_location, image_data)
+        # result["computeResult"] = compute_result
+        # result["computeTime"] = datetime.now().isoformat()
 
-            # # 4. 向前端发送图片和计算结果
-            # await send_to_frontend(task_no, bin_location, image_data, compute_result)
+        # # 4. 向前端发送图片和计算结果
+        # await send_to_frontend(task_no, bin_location, image_data, compute_result)
 
-            result["status"] = "success"
-            result["endTime"] = datetime.now().isoformat()
+        result["status"] = "success"
+        result["endTime"] = datetime.now().isoformat()
 
     except Exception as e:
         result["status"] = "failed"
@@ -352,12 +891,11 @@ async def login(request: Request):
             )
 
         # 调用LMS的login接口
-        lms_login_url = f"{LMS_BASE_URL}/login"
         headers = {
             "userCode": username,
             "password": password
         }
-        response = requests.get(lms_login_url, headers=headers)
+        response = await lms_client.get("/login", headers=headers)
 
         if response.status_code == 200:
             # 获取LMS返回的token
@@ -370,6 +908,9 @@ async def login(request: Request):
                     detail="登录成功但未返回authToken"
                 )
 
+            # 登录成功的 token 直接写入校验缓存，后续 /auth/token 无需访问LMS
+            token_cache.put(token, {k: v for k, v in lms_response.items() if k != "authToken"})
+
             # 返回给前端的响应
             return {
                 "success": True,
@@ -393,86 +934,200 @@ async def login(request: Request):
         )
 
 
+# authToken 校验缓存：有效 token 缓存 TOKEN_CACHE_TTL 秒，无效 token 缓存 TOKEN_NEGATIVE_TTL 秒
+TOKEN_CACHE_SIZE = 1000  # 最多缓存的 token 数
+TOKEN_CACHE_TTL = 300  # 有效 token 的缓存时间（秒）
+TOKEN_NEGATIVE_TTL = 30  # 无效 token 的缓存时间（秒）
+
+
+async def validate_lms_token(token: str) -> Tuple[int, Any]:
+    """调用LMS的authToken接口校验token，返回 (状态码, 用户信息或错误信息)"""
+    response = await lms_client.get("/auth/token", params={"token": token})
+    if response.status_code == 200:
+        return response.status_code, response.json()
+    return response.status_code, response.text
+
+
+token_cache = TokenCache(
+    validate_lms_token,
+    max_size=TOKEN_CACHE_SIZE,
+    ttl=TOKEN_CACHE_TTL,
+    negative_ttl=TOKEN_NEGATIVE_TTL
+)
+
+
+async def require_auth_token(token: Optional[str]) -> Dict[str, Any]:
+    """
+    校验 authToken（优先使用缓存），返回用户信息
+
+    :raises HTTPException: token 为空或无效时返回 401，LMS 不可用时返回 500
+    """
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized"
+        )
+    try:
+        entry = await token_cache.validate(token)
+    except Exception as e:
+        logger.error(f"校验authToken失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取用户信息请求处理失败"
+        )
+    if not entry.valid:
+        raise HTTPException(
+            status_code=entry.status_code,
+            detail=f"LMS获取用户信息失败: {entry.data}"
+        )
+    return entry.data
+
+
 @app.get("/auth/token")
 async def auth_token(token: str):
-    """处理前端获取用户信息请求，调用LMS的authToken接口"""
+    """处理前端获取用户信息请求（校验结果有缓存，未命中时调用LMS的authToken接口）"""
+    return await require_auth_token(token)
+
+
+async def fetch_lms_bins(auth_token: str) -> List[Dict[str, Any]]:
+    """从LMS拉取全量库位信息（供储位目录缓存使用）"""
+    lms_bin_path = "/third/api/v1/lmsToRcsService/getLmsBin"
+    headers = {
+        "authToken": auth_token
+    }
+    response = await lms_client.get(lms_bin_path, headers=headers)
+
+    if response.status_code != 200:
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            token_cache.invalidate(auth_token)
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"LMS获取库位信息失败: {response.text}"
+        )
+
+    # 处理LMS返回的压缩编码数据，数据量大时解压较慢，放到线程中执行
+    # 直接流式解码原始字节，不再生成完整的响应文本和解压文本
     try:
-        # 调用LMS的authToken接口
-        lms_auth_url = f"{LMS_BASE_URL}/auth/token?token={token}"
-        response = requests.get(lms_auth_url)
+        bins = await asyncio.to_thread(compression.decompress_and_decode, response.content)
+    except Exception as e:
+        logger.error(f"解压缩库位数据失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="库位数据解压缩失败"
+        )
+    logger.info("成功解压缩并解析库位数据")
+    return bins
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"LMS获取用户信息失败: {response.text}"
-            )
+
+# 储位目录缓存：全量储位带 TTL 缓存，按 binCode/areaCode/tobaccoCode/binStatus 建索引
+BIN_CATALOG_TTL = 300  # 储位数据有效期（秒），过期后后台刷新
+
+bin_catalog = BinCatalog(fetch_lms_bins, ttl=BIN_CATALOG_TTL)
+
+
+async def ensure_bin_catalog(auth_token: str):
+    """校验 authToken 并确保储位目录可用，LMS 返回的错误原样抛出"""
+    await require_auth_token(auth_token)
+    try:
+        await bin_catalog.ensure(auth_token)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"获取用户信息请求失败: {str(e)}")
+        logger.error(f"获取库位信息请求失败: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="获取用户信息请求处理失败"
+            detail="获取库位信息请求处理失败"
         )
 
 
 @app.get("/lms/getLmsBin")
 async def get_lms_bin(authToken: str):
-    """获取库位信息，调用LMS的getLmsBin接口"""
-    try:
-        # 调用LMS的getLmsBin接口
-        lms_bin_url = f"{LMS_BASE_URL}/third/api/v1/lmsToRcsService/getLmsBin"
-        headers = {
-            "authToken": authToken
-        }
-        response = requests.get(lms_bin_url, headers=headers)
+    """获取全量库位信息（来自储位目录缓存，新页面请使用 /lms/bins 分页查询）"""
+    await ensure_bin_catalog(authToken)
+    return Response(content=bin_catalog.all_json(), media_type="application/json")
+
+
+@app.get("/lms/bins")
+async def query_lms_bins(
+    authToken: str,
+    areaCode: Optional[str] = None,
+    tobaccoCode: Optional[str] = None,
+    binStatus: Optional[str] = None,
+    keyword: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(50, ge=1, le=1000)
+):
+    """分页查询库位，可按库区、品规、储位状态和关键字过滤"""
+    await ensure_bin_catalog(authToken)
+    return {
+        "code": 200,
+        "data": bin_catalog.query(areaCode, tobaccoCode, binStatus, keyword, page, pageSize)
+    }
 
-        if response.status_code == 200:
-            # 关键修复：处理LMS返回的压缩编码字符串
-            try:
-                uncompressed_data = custom_utils.decompress_and_decode(
-                    response.text)
 
-                logger.info("成功解压缩并解析库位数据")
-                return JSONResponse(uncompressed_data)
-            except Exception as e:
-                logger.error(f"解压缩库位数据失败: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="库位数据解压缩失败"
-                )
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"LMS获取库位信息失败: {response.text}"
-            )
+@app.get("/lms/bins/facets")
+async def lms_bin_facets(authToken: str):
+    """查询库区、品规、储位状态的取值及储位数（用于筛选项）"""
+    await ensure_bin_catalog(authToken)
+    return {"code": 200, "data": bin_catalog.facets()}
+
+
+@app.get("/lms/bins/stats")
+async def lms_bin_stats():
+    """查询储位目录缓存状态"""
+    return {"code": 200, "data": bin_catalog.stats()}
+
+
+@app.post("/lms/bins/refresh")
+async def refresh_lms_bins(authToken: str):
+    """立即从LMS刷新储位目录"""
+    await require_auth_token(authToken)
+    try:
+        await bin_catalog.refresh(authToken)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"获取库位信息请求失败: {str(e)}")
+        logger.error(f"刷新库位信息失败: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="获取库位信息请求处理失败"
+            detail="刷新库位信息失败"
         )
+    return {"code": 200, "data": bin_catalog.stats()}
+
+
+@app.get("/lms/bins/{bin_code}")
+async def get_lms_bin_by_code(bin_code: str, authToken: str):
+    """按 binCode 查询单个库位"""
+    await ensure_bin_catalog(authToken)
+    item = bin_catalog.get(bin_code)
+    if item is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"未找到库位: {bin_code}"
+        )
+    return {"code": 200, "data": item}
 
 
 @app.get("/lms/getCountTasks")
 async def get_count_tasks(authToken: str):
     """获取盘点任务，调用LMS的getCountTasks接口"""
+    await require_auth_token(authToken)
     try:
         logger.info(f"收到获取盘点任务请求，authToken: {authToken[:20]}...")
 
-        lms_tasks_url = f"{LMS_BASE_URL}/third/api/v1/lmsToRcsService/getCountTasks"
-        logger.info(f"准备调用LMS接口: {lms_tasks_url}")
+        lms_tasks_path = "/third/api/v1/lmsToRcsService/getCountTasks"
+        logger.info(f"准备调用LMS接口: {LMS_BASE_URL}{lms_tasks_path}")
 
         headers = {"authToken": authToken}
         logger.info("发送请求到LMS服务...")
-        response = requests.get(lms_tasks_url, headers=headers, timeout=30)
+        response = await lms_client.get(lms_tasks_path, headers=headers, timeout=30)
         logger.info(f"LMS响应状态码: {response.status_code}")
 
         if response.status_code == 200:
             # 关键修复：处理LMS返回的压缩编码字符串
             try:
-                uncompressed_data = custom_utils.decompress_and_decode(
-                    response.text)
+                uncompressed_data = await asyncio.to_thread(
+                    compression.decompress_and_decode, response.content)
 
                 logger.info("成功解压缩并解析盘点任务数据")
                 return JSONResponse(uncompressed_data)
@@ -485,17 +1140,21 @@ async def get_count_tasks(authToken: str):
         else:
             logger.error(
                 f"LMS获取盘点任务失败: {response.status_code} - {response.text}")
+            if response.status_code == status.HTTP_401_UNAUTHORIZED:
+                token_cache.invalidate(authToken)
             raise HTTPException(
                 status_code=response.status_code,
                 detail=f"LMS获取盘点任务失败: {response.text}"
             )
-    except requests.exceptions.Timeout:
+    except HTTPException:
+        raise
+    except httpx.TimeoutException:
         logger.error("LMS服务请求超时")
         raise HTTPException(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail="LMS服务响应超时"
         )
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         logger.error("无法连接到LMS服务")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -509,40 +1168,85 @@ async def get_count_tasks(authToken: str):
         )
 
 
+# 盘点结果发件箱：结果先写入 SQLite 再返回，后台按条数或时间窗口合并提交，失败指数退避重试
+OUTBOX_DB_PATH = os.environ.get("OUTBOX_DB_PATH", TASK_DB_PATH)
+OUTBOX_BATCH_SIZE = 200  # 单次 setTaskResults 提交的最大条数
+OUTBOX_MAX_WAIT = 2.0  # 结果最长等待合并的时间（秒）
+OUTBOX_RETRY_BASE_DELAY = 1.0  # 首次重试等待时间（秒），之后每次翻倍
+OUTBOX_RETRY_MAX_DELAY = 60.0  # 重试等待时间上限（秒）
+OUTBOX_MAX_ATTEMPTS = 20  # 单条结果最大提交次数，超过后转为死信，需调用 retry-dead 接口重新提交
+
+
+async def send_task_results(auth_token: str, items: List[Dict[str, Any]]):
+    """向LMS提交一批盘点结果（发件箱后台调用），失败时抛出异常由发件箱重试"""
+    encoded_data = await asyncio.to_thread(compression.compress_and_encode, items)
+    lms_results_path = "/third/api/v1/RcsToLmsService/setTaskResults"
+    headers = {
+        "authToken": auth_token,  # 传递给LMS的认证令牌
+        "Content-Type": "text/plain"  # 关键：必须是text/plain
+    }
+
+    # 发送压缩后的base64字符串
+    response = await lms_client.post(
+        lms_results_path, content=encoded_data, headers=headers)
+    if response.status_code != 200:
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            token_cache.invalidate(auth_token)
+        raise RuntimeError(f"LMS提交盘点结果失败，状态码 {response.status_code}: {response.text}")
+
+    # 盘点结果会改变LMS中的库存数量，储位目录下次访问时后台刷新（所有工作进程）
+    bin_catalog.invalidate()
+    worker_cluster.publish("bin_catalog_invalidate", {})
+
+
+result_outbox = ResultOutbox(
+    OUTBOX_DB_PATH,
+    send_task_results,
+    batch_size=OUTBOX_BATCH_SIZE,
+    max_wait=OUTBOX_MAX_WAIT,
+    base_delay=OUTBOX_RETRY_BASE_DELAY,
+    max_delay=OUTBOX_RETRY_MAX_DELAY,
+    max_attempts=OUTBOX_MAX_ATTEMPTS
+)
+# 其他工作进程写入结果后唤醒主进程的提交
+worker_cluster.subscribe("outbox", lambda message: result_outbox.wake())
+worker_cluster.subscribe("bin_catalog_invalidate", lambda message: bin_catalog.invalidate())
+
+
 @app.post("/lms/setTaskResults")
 async def set_task_results(request: Request):
-    """提交盘点任务结果，调用LMS的setTaskResults接口"""
+    """提交盘点任务结果：写入发件箱后立即返回，由后台批量调用LMS的setTaskResults接口"""
     try:
         # 1. 从请求头获取authToken
         auth_token = request.headers.get('authToken')
-        if not auth_token:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Unauthorized"
-            )
+        await require_auth_token(auth_token)
 
         # 2. 从请求体获取JSON数据（前端发送的是标准JSON）
         data = await request.json()
-        encoded_data = custom_utils.compress_and_encode(data)
-
-        # 6. 调用LMS接口（使用压缩后的数据）
-        lms_results_url = f"{LMS_BASE_URL}/third/api/v1/RcsToLmsService/setTaskResults"
-        headers = {
-            "authToken": auth_token,  # 传递给LMS的认证令牌
-            "Content-Type": "text/plain"  # 关键：必须是text/plain
-        }
-
-        # 发送压缩后的base64字符串
-        response = requests.post(
-            lms_results_url, data=encoded_data, headers=headers)
-
-        if response.status_code == 200:
-            return {"success": True, "message": "盘点结果已提交"}
-        else:
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list):
             raise HTTPException(
-                status_code=response.status_code,
-                detail=f"LMS提交盘点结果失败: {response.text}"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="盘点结果格式错误，应为结果列表"
+            )
+        if not all(isinstance(item, dict) for item in data):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="盘点结果格式错误，每条结果应为对象"
             )
+
+        # 3. 持久化到发件箱，LMS暂时不可用时后台重试
+        queued = await result_outbox.enqueue(auth_token, data)
+        worker_cluster.publish("outbox", {})
+        backlog = await result_outbox.backlog()
+        return {
+            "success": True,
+            "message": "盘点结果已提交",
+            "data": {"queued": queued, "pending": backlog["pending"]}
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"提交盘点结果请求失败: {str(e)}")
         raise HTTPException(
@@ -550,18 +1254,34 @@ async def set_task_results(request: Request):
             detail="提交盘点结果请求处理失败"
         )
 
+
+@app.get("/lms/setTaskResults/stats")
+async def result_outbox_stats():
+    """查询盘点结果发件箱的积压数量、提交吞吐量和失败次数"""
+    return {"code": 200, "data": await result_outbox.stats()}
+
+
+@app.post("/lms/setTaskResults/retry-dead")
+async def retry_dead_task_results(request: Request, authToken: Optional[str] = None):
+    """把提交次数已达上限的盘点结果（死信）重新放回发件箱（authToken 从请求头或查询参数获取）"""
+    await require_auth_token(request.headers.get('authToken') or authToken)
+    requeued = await result_outbox.requeue_dead()
+    worker_cluster.publish("outbox", {})
+    return {"code": 200, "data": {"requeued": requeued}}
+
 ######################################### RCS #########################################
 # @app.post("/api/inventory/submit-task")
 # async def submit_inventory_task(request: Request):
 
 
-async def submit_inventory_task(task_no: str, bin_locations: List[str]):
-    """下发盘点任务，接收任务编号和储位名称列表"""
+async def submit_inventory_task(task_no: str, bin_locations: List[str], robot_task_code: str,
+                                robot_code: Optional[str] = None):
+    """下发盘点任务，接收任务编号、储位名称列表、机器人任务编号和指定执行的机器人编号"""
     try:
 
         logger.info(f"下发盘点任务: {task_no}, 储位: {bin_locations}")
 
-        url = f"{RCS_BASE_URL}{RCS_PREFIX}/api/robot/controller/task/submit"
+        path = "/api/robot/controller/task/submit"
         headers = {
             "X-lr-request-id": "ldui",
             "Content-Type": "application/json"
@@ -580,11 +1300,14 @@ async def submit_inventory_task(task_no: str, bin_locations: List[str]):
         # 构建请求体 - 单个任务对象
         request_body = {
             "taskType": "PF-CTU-COMMON-TEST",
+            "robotTaskCode": robot_task_code,
             "targetRoute": target_route
         }
+        if robot_code:
+            request_body["robotCode"] = robot_code
 
-        response = requests.post(
-            url, json=request_body, headers=headers, timeout=30)
+        response = await rcs_client.post(
+            path, json=request_body, headers=headers, timeout=30)
 
         if response.status_code == 200:
             response_data = response.json()
@@ -605,12 +1328,12 @@ async def submit_inventory_task(task_no: str, bin_locations: List[str]):
 
 # @app.post("/api/inventory/continue-task")
 # async def continue_inventory_task(request: Request):
-async def continue_inventory_task():
+async def continue_inventory_task(robot_task_code: str):
     """继续盘点任务"""
     try:
-        logger.info(f"继续执行盘点任务")
+        logger.info(f"继续执行盘点任务: {robot_task_code}")
 
-        url = f"{RCS_BASE_URL}{RCS_PREFIX}/api/robot/controller/task/extend/continue"
+        path = "/api/robot/controller/task/extend/continue"
         headers = {
             "X-lr-request-id": "ldui",
             "Content-Type": "application/json"
@@ -619,11 +1342,11 @@ async def continue_inventory_task():
         # 构建请求体
         request_body = {
             "triggerType": "TASK",
-            "triggerCode": "001"
+            "triggerCode": robot_task_code
         }
 
-        response = requests.post(
-            url, json=request_body, headers=headers, timeout=30)
+        response = await rcs_client.post(
+            path, json=request_body, headers=headers, timeout=30)
 
         if response.status_code == 200:
             response_data = response.json()
@@ -642,15 +1365,44 @@ async def continue_inventory_task():
         )
 
 
+async def cancel_robot_task(robot_task_code: str):
+    """通知RCS取消机器人任务（盘点任务取消时调用，失败只记录日志）"""
+    try:
+        response = await rcs_client.post(
+            "/api/robot/controller/task/cancel",
+            json={"robotTaskCode": robot_task_code, "cancelType": "CANCEL"},
+            headers={"X-lr-request-id": "ldui", "Content-Type": "application/json"},
+            timeout=10
+        )
+        if response.status_code == 200 and response.json().get("code") == "SUCCESS":
+            logger.info(f"已取消机器人任务: {robot_task_code}")
+        else:
+            logger.warning(f"取消机器人任务失败: {robot_task_code}, 状态码 {response.status_code}")
+    except Exception as e:
+        logger.warning(f"取消机器人任务失败: {robot_task_code}, {str(e)}")
+
+
+# 机器人回调在接收进程内去重并直接唤醒等待者，同时由后台批量写入 SQLite（按去重键唯一）；
+# 其他工作进程从数据库读取后唤醒各自的等待者，广播只用于提前唤醒读取，
+# 广播丢失时最迟 ROBOT_CALLBACK_POLL_INTERVAL 秒后读取到
+ROBOT_CALLBACK_DB_PATH = os.environ.get("ROBOT_CALLBACK_DB_PATH", TASK_DB_PATH)
+ROBOT_CALLBACK_POLL_INTERVAL = 1.0  # 没有广播唤醒时读取新回调的间隔（秒）
+
+robot_callback_store = RobotCallbackStore(
+    ROBOT_CALLBACK_DB_PATH,
+    worker_cluster.worker_id,
+    dedup_window=ROBOT_CALLBACK_DEDUP_WINDOW,
+    poll_interval=ROBOT_CALLBACK_POLL_INTERVAL
+)
+
+
 @app.post("/api/robot/reporter/task")
 async def task_status(request: Request):
+    """接收RCS的任务状态回调：去重后分发给等待者，并记录到机器人事件历史"""
     try:
         # 获取请求数据
-        request_data = await request.json()
-
-        logger.info("反馈任务状态")
-        logger.info(
-            f"请求数据: {json.dumps(request_data, indent=2, ensure_ascii=False)}")
+        request_data = json.loads(await request.body())
+        logger.debug(f"反馈任务状态: {request_data}")
 
         # 提取任务信息
         robot_task_code = request_data.get("robotTaskCode")
@@ -661,231 +1413,395 @@ async def task_status(request: Request):
         if extra:
             try:
                 extra_list = json.loads(extra)
-                if isinstance(extra_list, list):
-                    for item in extra_list:
-                        method = item.get("method", "")
-                        logger.info(f"处理method: {method}")
-                        await update_robot_status(method, item)
-
-                        if method == "start":
-                            logger.info("任务开始")
-
-                        elif method == "outbin":
-                            logger.info("走出储位")
-
-                        elif method == "end":
-                            logger.info("任务完成")
-
-                        # 根据不同的method更新您的任务状态...
             except json.JSONDecodeError:
                 logger.error(f"无法解析extra字段: {extra}")
-
-        # 返回响应
-        return {
+                extra_list = None
+            if isinstance(extra_list, list):
+                for item in extra_list:
+                    if not isinstance(item, dict):
+                        continue
+                    method = item.get("method", "")
+                    # RCS 重试的重复回调只记录次数，不再唤醒等待者
+                    if robot_callback_log.record(robot_task_code, single_robot_code, method, item) is None:
+                        logger.debug(f"忽略重复回调: {robot_task_code}/{single_robot_code} -> {method}")
+                        continue
+                    robot_event_bus.publish([robot_task_code, single_robot_code], method, item)
+                    # 后台批量写入，写入后通知其他工作进程读取
+                    robot_callback_store.append(
+                        robot_task_code, single_robot_code, method, item,
+                        RobotCallbackLog.dedup_key(robot_task_code, method, item))
+
+        # 返回响应（直接构造 JSONResponse，跳过 FastAPI 的返回值编码）
+        return JSONResponse({
             "code": "SUCCESS",
             "message": "成功",
             "data": {
-                "robotTaskCode": "ctu001"
+                "robotTaskCode": robot_task_code
             }
-        }
+        })
 
     except Exception as e:
         logger.error(f"处理状态反馈失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理状态反馈失败: {str(e)}")
 
 
-async def update_robot_status(method: str, data: Optional[Dict] = None):
-    """更新机器人状态并触发事件"""
-    # 保存状态信息
-    robot_status_store[STATUS_KEY] = {
-        "method": method,
-        "timestamp": time.time(),
-        "data": data or {}
+def on_robot_event(event: Dict[str, Any]):
+    """从回调存储读取到的其他工作进程接收的回调：记录事件历史，按任务编号和机器人编号唤醒等待者"""
+    robot_task_code = event["robotTaskCode"]
+    robot_code = event["robotCode"]
+    method = event["method"]
+    if robot_callback_log.record(robot_task_code, robot_code, method, event["data"], remote=True) is None:
+        # 本进程也收到过同一回调（RCS 重试落到不同工作进程），已分发过
+        return
+    robot_event_bus.publish([robot_task_code, robot_code], method, event["data"])
+    logger.debug(f"更新机器人状态: {robot_task_code}/{robot_code} -> {method}")
+
+
+def discard_robot_events(robot_task_code: str):
+    """子路线结束后清理机器人任务的事件缓存（所有工作进程）"""
+    robot_event_bus.discard(robot_task_code)
+    worker_cluster.publish("robot_discard", {"robotTaskCode": robot_task_code})
+
+
+worker_cluster.subscribe("robot", lambda message: robot_callback_store.wake())
+worker_cluster.subscribe("robot_discard", lambda message: robot_event_bus.discard(message["robotTaskCode"]))
+
+
+@app.get("/api/robot/events")
+async def robot_events(
+    robot_code: Optional[str] = Query(None, alias="robotCode"),
+    robot_task_code: Optional[str] = Query(None, alias="robotTaskCode"),
+    method: Optional[str] = None,
+    after_id: int = Query(0, alias="afterId", ge=0),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """查询机器人最近的回调事件（已去重），可按机器人、任务、method 过滤，afterId 用于增量拉取"""
+    return {
+        "code": 200,
+        "data": robot_callback_log.query(robot_code, robot_task_code, method, after_id, limit)
     }
 
-    logger.info(f"更新机器人状态: {method}")
 
-    # 设置事件，通知等待的进程
-    status_event.set()
+@app.get("/api/robot/events/stats")
+async def robot_event_stats():
+    """查询机器人回调的接收、去重统计"""
+    return {"code": 200, "data": {
+        **robot_callback_log.stats(),
+        "bus": robot_event_bus.stats(),
+        "store": robot_callback_store.stats()
+    }}
 
 
-async def wait_for_robot_status(expected_method: str, timeout: int = 300):
+async def wait_for_robot_status(robot_task_code: str, expected_method: str, timeout: int = 300):
     """
-    等待特定机器人状态的同步函数
+    等待特定机器人任务的状态
 
-    这个函数会阻塞直到收到期望的状态或超时
+    这个函数会挂起直到收到期望的状态或超时；在两次等待之间到达的事件会被缓存，不会丢失
     """
-    logger.info(f"开始等待机器人状态: {expected_method}, 超时: {timeout}秒")
-
-    start_time = time.time()
-
-    # 清除事件，确保我们等待的是新的事件
-    status_event.clear()
-
-    # 检查是否已经有期望的状态
-    if STATUS_KEY in robot_status_store:
-        current_status = robot_status_store[STATUS_KEY]
-        if current_status.get("method") == expected_method:
-            logger.info(f"已存在期望状态: {expected_method}")
-            return current_status
-
-    while True:
-        try:
-            # 等待事件被设置
-            await asyncio.wait_for(status_event.wait(), timeout=1.0)
-
-            # 检查状态
-            if STATUS_KEY in robot_status_store:
-                current_status = robot_status_store[STATUS_KEY]
-                logger.info(f"收到机器人状态: {current_status.get('method')}")
-
-                if current_status.get("method") == expected_method:
-                    logger.info(f"收到期望状态: {expected_method}")
-                    return current_status
-
-            # 重置事件，准备下一次等待
-            status_event.clear()
+    logger.info(f"开始等待机器人状态: {robot_task_code} -> {expected_method}, 超时: {timeout}秒")
 
-        except asyncio.TimeoutError:
-            # 检查是否总时间超时
-            elapsed_time = time.time() - start_time
-            if elapsed_time >= timeout:
-                logger.error(f"等待机器人状态超时: {expected_method}")
-                raise asyncio.TimeoutError(f"等待 {expected_method} 状态超时")
+    try:
+        current_status = await robot_event_bus.wait_for(robot_task_code, expected_method, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"等待机器人状态超时: {robot_task_code} -> {expected_method}")
+        raise
 
-            # 继续等待
-            continue
+    logger.info(f"收到期望状态: {robot_task_code} -> {expected_method}")
+    return current_status
 
 ######################################### 抓图 #########################################
 
 
-async def execute_capture_script(script_path: str, task_no: str, bin_location: str) -> Dict[str, Any]:
+async def capture_images_with_scripts(task_no: str, bin_location: str) -> List[Dict[str, Any]]:
     """
-    在指定 Conda 环境中执行单个抓图脚本
+    并发执行三个相机的抓图脚本
 
     Args:
-        script_path: 脚本路径
         task_no: 任务编号
         bin_location: 储位名称
-        conda_env: Conda 环境名称，默认为 'your_env_name'
 
     Returns:
-        脚本执行结果
+        每个相机的执行结果（含 success、attempts、latency 等字段）
     """
-    conda_env = "tobacco_env"
-    try:
-        logger.info(f"在 Conda 环境 '{conda_env}' 中执行抓图脚本: {script_path}")
-
-        # 方法1: 使用 conda run 命令
-        # 构建命令行参数
-        cmd = ["conda", "run", "-n", conda_env, "python", script_path,
-               "--task-no", task_no, "--bin-location", bin_location]
-
-        # 方法2: 直接使用 conda 环境中的 python 路径（如果知道路径）
-        # 假设你的 conda 环境路径是已知的
-        # conda_python_path = f"/home/user/anaconda3/envs/{conda_env}/bin/python"
-        # cmd = [conda_python_path, script_path, "--task-no", task_no, "--bin-location", bin_location]
-
-        # 执行脚本
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+    report = await capture_orchestrator.capture(task_no, bin_location)
+    return report["cameras"]
+
+
+######################################### 储位流水线 #########################################
+
+
+def find_capture_images(task_no: str, bin_location: str) -> Dict[str, List[str]]:
+    """查找储位抓取的图片，按相机类型分组"""
+    images: Dict[str, List[str]] = {}
+    bin_dir = Path(CAPTURE_OUTPUT_DIR) / task_no / bin_location
+    if not bin_dir.is_dir():
+        return images
+
+    for camera_dir in sorted(p for p in bin_dir.iterdir() if p.is_dir()):
+        files = sorted(
+            str(f) for f in camera_dir.iterdir()
+            if f.suffix.lower() in (".jpg", ".jpeg", ".png", ".bmp")
         )
+        if files:
+            images[camera_dir.name] = files
+    return images
+
+
+# 盘点图片访问：原图由服务器直接发送文件（支持 Range / 条件请求），缩略图按需生成并缓存到磁盘
+PROJECT_OUTPUT_DIR = Path(__file__).resolve().parents[2] / "output"
+POSTPROCESS_OUTPUT_DIR = os.environ.get("POSTPROCESS_OUTPUT_DIR", str(PROJECT_OUTPUT_DIR / "postprocess"))  # 后处理（标注）图片目录
+THUMB_CACHE_DIR = os.environ.get("THUMB_CACHE_DIR", str(PROJECT_OUTPUT_DIR / "thumbnails"))
+THUMB_CACHE_BUDGET_MB = 512  # 缩略图缓存总大小上限
+THUMB_WIDTHS = (160, 320, 640)  # 允许的缩略图宽度
+PROGRESS_THUMB_WIDTH = 640  # 盘点进度页使用的缩略图宽度
+IMAGE_CACHE_MAX_AGE = 86400  # 浏览器缓存图片的时间（秒），图片变化时 ETag 随之变化
+
+image_store = ImageStore(
+    roots={"capture": CAPTURE_OUTPUT_DIR, "postprocess": POSTPROCESS_OUTPUT_DIR},
+    thumb_dir=THUMB_CACHE_DIR,
+    thumb_budget_bytes=THUMB_CACHE_BUDGET_MB * 1024 * 1024,
+    thumb_widths=THUMB_WIDTHS
+)
 
-        # 等待脚本完成
-        stdout, stderr = await process.communicate()
-
-        # 解析结果
-        result = {
-            "script": os.path.basename(script_path),
-            "conda_env": conda_env,
-            "returncode": process.returncode,
-            "stdout": stdout.decode('utf-8') if stdout else "",
-            "stderr": stderr.decode('utf-8') if stderr else "",
-            "success": process.returncode == 0
-        }
 
-        if process.returncode == 0:
-            logger.info(f"脚本执行成功: {script_path} (环境: {conda_env})")
-        else:
-            logger.error(
-                f"脚本执行失败: {script_path}, 错误: {stderr.decode('utf-8')}")
+def image_urls(task_no: str, bin_location: str, images: Dict[str, List[str]],
+               width: Optional[int] = None) -> Dict[str, List[str]]:
+    """把抓图路径转换为网关的图片访问地址，指定 width 时返回缩略图地址"""
+    query = f"?w={width}" if width else ""
+    return {
+        camera: [
+            f"/api/images/capture/{quote(task_no)}/{quote(bin_location)}/{quote(camera)}/{quote(os.path.basename(p))}{query}"
+            for p in paths
+        ]
+        for camera, paths in images.items()
+    }
 
-        return result
 
-    except FileNotFoundError as e:
-        logger.error(f"conda 命令未找到或 Conda 环境 '{conda_env}' 不存在: {str(e)}")
-        return {
-            "script": os.path.basename(script_path),
-            "conda_env": conda_env,
-            "returncode": -1,
-            "stdout": "",
-            "stderr": f"Conda 环境 '{conda_env}' 未找到或 conda 命令不可用",
-            "success": False
-        }
-    except Exception as e:
-        logger.error(f"执行脚本失败 {script_path}: {str(e)}")
-        return {
-            "script": os.path.basename(script_path),
-            "conda_env": conda_env,
-            "returncode": -1,
-            "stdout": "",
-            "stderr": str(e),
-            "success": False
+async def image_response(request: Request, kind: str, parts: List[str], width: Optional[int]) -> Response:
+    """返回图片（或缩略图），客户端缓存仍有效时返回 304"""
+    source = image_store.resolve(kind, *parts)
+    if source is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="图片不存在"
+        )
+    path, stat = source, None
+    # 缩略图可能在返回前被其他请求触发的淘汰删除，此时重新生成一次
+    for _ in range(2):
+        if width:
+            try:
+                path = await image_store.thumbnail(source, image_store.thumb_width(width))
+            except Exception as e:
+                logger.error(f"生成缩略图失败 {source}: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="生成缩略图失败"
+                )
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+            break
+        except FileNotFoundError:
+            continue
+    if stat is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="图片不存在"
+        )
+
+    etag, last_modified = image_store.validators(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}"
+    }
+    if image_store.not_modified(request.headers, etag, stat.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # FileResponse 处理 Range/If-Range；服务器支持 pathsend 扩展时由服务器直接发送文件
+    return FileResponse(path, headers=headers, stat_result=stat)
+
+
+@app.get("/api/images/stats")
+async def image_cache_stats():
+    """查询缩略图缓存的命中率、占用空间和淘汰次数"""
+    return {"code": 200, "data": image_store.stats()}
+
+
+@app.get("/api/images/{kind}/{image_path:path}")
+async def get_image(kind: str, image_path: str, request: Request,
+                    w: Optional[int] = Query(None, ge=1, description="缩略图宽度，不传时返回原图")):
+    """获取图片：kind 为 capture（抓图原图，路径为 任务号/储位/相机类型/文件名）或 postprocess（后处理图片）"""
+    return await image_response(request, kind, image_path.split("/"), w)
+
+
+@app.get("/api/inventory/{task_no}/images/{bin_location}/{camera_type}/{file_name}")
+async def get_capture_image(task_no: str, bin_location: str, camera_type: str, file_name: str,
+                            request: Request, w: Optional[int] = Query(None, ge=1)):
+    """获取储位抓取的图片（兼容旧地址）"""
+    return await image_response(request, "capture", [task_no, bin_location, camera_type, file_name], w)
+
+
+# 计数时同时识别3D相机图片中检测到的条码：与计数共用同一次 YOLO 推理，条码识别与计数后处理并行，
+# 结果与扫码相机识别结果合并
+COUNT_READ_BARCODES = os.environ.get("COUNT_READ_BARCODES", "1") != "0"
+
+
+async def count_stage(job: BinJob) -> Dict[str, Any]:
+    """计数阶段：对3D相机图片进行箱体计数（同一次推理的条码区域同时识别）"""
+    images = job.images.get("3d_camera", [])
+    if not images:
+        return {"success": False, "total_count": 0, "status": "未找到3D相机图片"}
+
+    # 在计数进程池中执行，YOLO 推理和聚类不占用事件循环
+    result = await count_pool.count(images[0], None, job.task_no, read_barcodes=COUNT_READ_BARCODES)
+    stage_timer.record("count_wait", result["waitSeconds"])
+    stage_timer.record("count_compute", result["computeSeconds"])
+    publish_progress(job.task_no, "counted", binLocation=job.bin_location,
+                     totalCount=result.get("total_count", 0), status=result.get("status"),
+                     latencyMs=round(result["latencySeconds"] * 1000, 2))
+    return result
+
+
+async def barcode_stage(job: BinJob) -> Dict[str, Any]:
+    """条码识别阶段：识别扫码相机图片中的条码，并合并计数阶段从3D相机图片检测结果中识别出的条码"""
+    detected = job.results.get("count", {}).get("barcodes", [])
+    scan_dirs = sorted({
+        os.path.dirname(path)
+        for camera, paths in job.images.items() if camera.startswith("scan_camera")
+        for path in paths
+    })
+    if not scan_dirs and not detected:
+        return {"success": False, "barcodes": [], "error": "未找到扫码相机图片"}
+
+    from core.vision.barcode_recognizer import BarcodeRecognizer
+
+    barcodes = []
+    for scan_dir in scan_dirs:
+        recognizer = BarcodeRecognizer()
+        results = await asyncio.to_thread(recognizer.process_folder, scan_dir)
+        barcodes.extend(r["output"] for r in results if r["output"])
+    barcodes.extend(code for code in detected if code not in barcodes)
+    publish_progress(job.task_no, "barcode_read", binLocation=job.bin_location, barcodes=barcodes)
+    return {"success": bool(barcodes), "barcodes": barcodes}
+
+
+async def submit_stage(job: BinJob) -> Dict[str, Any]:
+    """结果提交阶段：保存储位的盘点结果"""
+    count_result = job.results.get("count", {})
+    barcode_result = job.results.get("barcode", {})
+    result = {
+        "binLocation": job.bin_location,
+        "robotCode": job.robot_code,
+        "countQty": count_result.get("total_count", 0),
+        "countStatus": count_result.get("status"),
+        "barcodes": barcode_result.get("barcodes", []),
+        "timings": {k: round(v * 1000, 2) for k, v in job.timings.items()},
+        "finishTime": datetime.now().isoformat()
+    }
+    # 这里不写入盘点结果发件箱：储位任务没有 LMS 的 taskDetailId/itemId 和操作员的 authToken，
+    # 计数结果由操作员在盘点进度页核对后通过 /lms/setTaskResults 提交，那条路径经过发件箱
+    # 结果和完成状态一起写入，恢复任务时只跳过已提交结果的储位
+    task_store.update_bin(job.task_no, job.bin_location, status="completed", result=result)
+    publish_progress(job.task_no, "submitted", **result)
+    return {"success": True}
+
+
+stage_timer = StageTimer(observer=lambda stage, seconds: inventory_stage_seconds.observe(seconds, stage=stage))
+bin_pipeline = BinPipeline(
+    stages=[
+        ("count", count_stage),
+        ("barcode", barcode_stage),
+        ("submit", submit_stage),
+    ],
+    queue_size=PIPELINE_QUEUE_SIZE,
+    timer=stage_timer,
+    # 计数阶段的并发数与计数进程数一致，否则只有一个进程在工作
+    workers={"count": count_pool.workers}
+)
+
+
+@app.get("/api/inventory/pipeline/stats")
+async def pipeline_stats():
+    """查询储位流水线各阶段耗时统计和队列深度"""
+    return {
+        "code": 200,
+        "data": {
+            "mode": "pipeline" if PIPELINE_MODE else "sequential",
+            "stages": stage_timer.stats(),
+            "queues": bin_pipeline.queue_depths(),
+            "countPool": count_pool.stats(),
+            "progressStream": progress_broadcaster.stats()
         }
+    }
 
 
-async def capture_images_with_scripts(task_no: str, bin_location: str) -> List[Dict[str, Any]]:
-    """
-    按顺序执行三个抓图脚本
+@app.get("/api/inventory/{task_no}/results")
+async def get_inventory_results(task_no: str):
+    """查询盘点任务已完成储位的计数结果"""
+    return {"code": 200, "data": await task_store.get_results(task_no)}
 
-    Args:
-        task_no: 任务编号
-        bin_location: 储位名称
 
-    Returns:
-        所有脚本的执行结果
-    """
-    results = []
+######################################### 上游状态 #########################################
 
-    for i, script_path in enumerate(CAPTURE_SCRIPTS, 1):
-        logger.info(f"开始执行第 {i} 个抓图脚本: {script_path}")
 
-        try:
-            # 检查脚本文件是否存在
-            if not os.path.exists(script_path):
-                logger.error(f"脚本文件不存在: {script_path}")
-                results.append({
-                    "script": script_path,
-                    "success": False,
-                    "error": "脚本文件不存在"
+# 在途工作流和队列深度在抓取时取值
+metrics.gauge("inventory_running_tasks", "正在执行的盘点任务数",
+              callback=lambda: {(): inventory_scheduler.running_tasks()})
+metrics.gauge("inventory_paused_tasks", "已暂停的盘点任务数",
+              callback=lambda: {(): task_controls.stats()["paused"]})
+metrics.gauge("inventory_running_routes", "每台机器人正在执行的子路线数", ("robot",),
+              callback=lambda: {(robot,): n for robot, n in inventory_scheduler.running_routes().items()})
+metrics.gauge("pipeline_queue_depth", "储位流水线各阶段输入队列深度", ("stage",),
+              callback=lambda: {(stage,): n for stage, n in bin_pipeline.queue_depths().items()})
+metrics.gauge("count_pool_in_flight", "计数进程池中排队和执行中的储位数",
+              callback=lambda: {(): count_pool.stats()["inFlight"]})
+metrics.counter("robot_callbacks_total", "收到的机器人回调事件数（result=accepted/duplicate）", ("result",),
+                callback=lambda: {
+                    ("accepted",): robot_callback_log.stats()["accepted"],
+                    ("duplicate",): robot_callback_log.stats()["duplicates"]
                 })
-                continue
+metrics.gauge("progress_subscribers", "盘点进度 SSE 连接数",
+              callback=lambda: {(): progress_broadcaster.stats()["subscribers"]})
+metrics.gauge("task_store_pending_updates", "尚未写入数据库的储位状态更新数",
+              callback=lambda: {(): task_store.stats()["pendingUpdates"]})
+result_outbox_pending = metrics.gauge("result_outbox_pending", "待提交到LMS的盘点结果条数")
+result_outbox_dead = metrics.gauge("result_outbox_dead", "提交次数已达上限、不再自动重试的盘点结果条数")
+metrics.counter("result_outbox_sent_items_total", "已提交到LMS的盘点结果条数",
+                callback=lambda: {(): result_outbox.counters()["sentItems"]})
+metrics.counter("result_outbox_failed_batches_total", "提交到LMS失败的批次数",
+                callback=lambda: {(): result_outbox.counters()["failedBatches"]})
 
-            # 执行脚本
-            result = await execute_capture_script(script_path, task_no, bin_location)
-            results.append(result)
 
-            # 如果脚本执行失败，可以选择是否继续执行后续脚本
-            if not result["success"]:
-                logger.warning(f"第 {i} 个抓图脚本执行失败，继续执行下一个脚本")
-                # 可以根据业务需求决定是否中断
-                # continue
+@app.get("/metrics")
+async def metrics_endpoint():
+    """导出网关监控指标（Prometheus 文本格式）"""
+    backlog = await result_outbox.backlog()
+    result_outbox_pending.set(backlog["pending"])
+    result_outbox_dead.set(backlog["dead"])
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-            # 脚本之间的短暂延迟（可选）
-            if i < len(CAPTURE_SCRIPTS):
-                await asyncio.sleep(0.5)
 
-        except Exception as e:
-            logger.error(f"执行第 {i} 个抓图脚本时发生异常: {str(e)}")
-            results.append({
-                "script": script_path,
-                "success": False,
-                "error": str(e)
-            })
 
-    return results
+@app.get("/api/upstreams/stats")
+async def upstream_stats():
+    """查询各上游服务的连接池统计（在途请求数、总请求数、错误数）"""
+    return {"code": 200, "data": upstreams.stats()}
+
+
+@app.get("/api/cluster/stats")
+async def cluster_stats():
+    """查询当前工作进程在集群中的状态（是否主进程、其他进程数、广播消息数）"""
+    return {"code": 200, "data": worker_cluster.stats()}
+
+
+@app.get("/api/auth/cache/stats")
+async def auth_cache_stats():
+    """查询 authToken 校验缓存的命中/未命中统计"""
+    return {"code": 200, "data": token_cache.stats()}
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    if GATEWAY_WORKERS > 1:
+        # 多进程需要以导入路径启动，每个工作进程各自导入本模块
+        uvicorn.run("gateway:app", host="0.0.0.0", port=8000, log_level="info", workers=GATEWAY_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
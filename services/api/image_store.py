@@ -0,0 +1,261 @@
+"""
+盘点图片访问与缩略图缓存
+功能：
+1. 按图片类别（抓图原图、后处理图）和相对路径定位图片，拒绝越出根目录的路径
+2. 生成 ETag / Last-Modified，支持 If-None-Match、If-Modified-Since 条件请求（304）
+3. 缩略图按需生成（大图 JPEG 解码时直接按比例缩小），缓存到磁盘，同一缩略图并发请求只生成一次
+4. 缩略图缓存按总大小上限进行 LRU 淘汰，网关重启后从磁盘恢复缓存索引
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 缩略图文件扩展名
+THUMB_SUFFIX = ".jpg"
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """从 JPEG 的 SOF 段读取 (宽, 高)，无需解码图片；不是 JPEG 时返回 None"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        # SOF0-SOF15（不含 DHT 0xC4、JPG 0xC8、DAC 0xCC）
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + length
+    return None
+
+
+class ImageStore:
+    """图片定位、条件请求判断和缩略图磁盘缓存"""
+
+    def __init__(
+        self,
+        roots: Dict[str, str],
+        thumb_dir: str,
+        thumb_budget_bytes: int = 256 * 1024 * 1024,
+        thumb_widths: Sequence[int] = (160, 320, 640),
+        jpeg_quality: int = 80
+    ):
+        """
+        :param roots: 图片类别 -> 根目录，如 {"capture": 抓图输出目录}
+        :param thumb_dir: 缩略图缓存目录
+        :param thumb_budget_bytes: 缩略图缓存总大小上限（字节），超出时淘汰最久未访问的缩略图
+        :param thumb_widths: 允许的缩略图宽度，请求的宽度向上取整到其中一档，避免缓存碎片
+        :param jpeg_quality: 缩略图 JPEG 质量
+        """
+        self.roots = {kind: Path(root).resolve() for kind, root in roots.items()}
+        self.thumb_dir = Path(thumb_dir)
+        self.thumb_budget_bytes = thumb_budget_bytes
+        self.thumb_widths = tuple(sorted(thumb_widths))
+        self.jpeg_quality = jpeg_quality
+
+        # 缩略图文件名 -> 文件大小，按最近访问排序
+        self._thumbs: "OrderedDict[str, int]" = OrderedDict()
+        self._thumb_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._generate_seconds = 0.0
+
+    def load_index(self):
+        """扫描缓存目录，按文件修改时间（即最近访问时间）恢复 LRU 顺序"""
+        self.thumb_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.thumb_dir.glob(f"*/*{THUMB_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, self._thumb_name(path), stat.st_size))
+        entries.sort()
+        self._thumbs = OrderedDict((name, size) for _, name, size in entries)
+        self._thumb_bytes = sum(size for _, _, size in entries)
+        self._evict()
+        logger.info(f"缩略图缓存已加载: {len(self._thumbs)} 个, {self._thumb_bytes / 1024 / 1024:.1f}MB")
+
+    # ------------------------------------------------------------------ 原图
+
+    def resolve(self, kind: str, *parts: str) -> Optional[Path]:
+        """
+        定位图片文件
+
+        :return: 图片的绝对路径，类别不存在、路径越出根目录或文件不存在时返回 None
+        """
+        root = self.roots.get(kind)
+        if root is None:
+            return None
+        path = root.joinpath(*parts).resolve()
+        if root not in path.parents or not path.is_file():
+            return None
+        return path
+
+    @staticmethod
+    def validators(stat: os.stat_result) -> Tuple[str, str]:
+        """根据文件的修改时间和大小生成 (ETag, Last-Modified)"""
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        return etag, formatdate(stat.st_mtime, usegmt=True)
+
+    @staticmethod
+    def not_modified(headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+        """判断条件请求是否可以返回 304（If-None-Match 优先于 If-Modified-Since）"""
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    # ------------------------------------------------------------------ 缩略图
+
+    def thumb_width(self, requested: int) -> int:
+        """把请求的宽度向上取整到允许的一档"""
+        for width in self.thumb_widths:
+            if requested <= width:
+                return width
+        return self.thumb_widths[-1]
+
+    async def thumbnail(self, source: Path, width: int) -> Path:
+        """
+        获取原图的缩略图（不存在时生成）
+
+        缓存键包含原图路径、修改时间和大小，原图被覆盖后会生成新的缩略图。
+
+        :param source: 原图绝对路径（需已通过 resolve 校验）
+        :param width: 缩略图宽度（需为 thumb_width 的返回值）
+        """
+        stat = source.stat()
+        key = hashlib.sha1(
+            f"{source}|{stat.st_mtime_ns}|{stat.st_size}|{width}".encode("utf-8")).hexdigest()
+        name = f"{key[:2]}/{key}{THUMB_SUFFIX}"
+        path = self.thumb_dir / name
+
+        if path.is_file():
+            self._hits += 1
+            if name not in self._thumbs:
+                # 由其他网关工作进程生成的缩略图，加入本进程的索引
+                size = path.stat().st_size
+                self._thumb_bytes += size
+                self._thumbs[name] = size
+            self._thumbs.move_to_end(name)
+            # 文件修改时间记录最近访问时间，重启后用于恢复 LRU 顺序
+            os.utime(path)
+            return path
+
+        inflight = self._inflight.get(name)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        self._misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            start = time.perf_counter()
+            size = await asyncio.to_thread(self._generate, source, path, width)
+            self._generate_seconds += time.perf_counter() - start
+            self._thumb_bytes += size - self._thumbs.pop(name, 0)
+            self._thumbs[name] = size
+            self._evict()
+            future.set_result(path)
+            return path
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(name, None)
+
+    def _generate(self, source: Path, target: Path, width: int) -> int:
+        """生成缩略图并写入缓存目录（在线程中执行），返回文件大小"""
+        # 延迟导入，未使用缩略图时网关不依赖 OpenCV
+        import cv2
+        import numpy as np
+
+        data = source.read_bytes()
+        # JPEG 大图解码时直接按 1/2、1/4、1/8 缩小，减少解码耗时和内存
+        flags = cv2.IMREAD_COLOR
+        size = jpeg_size(data)
+        if size is not None:
+            for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                 (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if size[0] / factor >= width:
+                    flags = flag
+                    break
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if image is None:
+            raise ValueError(f"无法读取图片: {source}")
+
+        height, current_width = image.shape[:2]
+        if current_width > width:
+            image = cv2.resize(image, (width, max(1, round(height * width / current_width))),
+                               interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(THUMB_SUFFIX, image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError(f"缩略图编码失败: {source}")
+
+        # 先写临时文件再替换，避免并发读取到不完整的文件
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(encoded.tobytes())
+        os.replace(tmp, target)
+        return len(encoded)
+
+    def _evict(self):
+        """超出缓存大小上限时删除最久未访问的缩略图（保留最近访问的一个）"""
+        while self._thumb_bytes > self.thumb_budget_bytes and len(self._thumbs) > 1:
+            name, size = self._thumbs.popitem(last=False)
+            self._thumb_bytes -= size
+            self._evictions += 1
+            try:
+                (self.thumb_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _thumb_name(self, path: Path) -> str:
+        return path.relative_to(self.thumb_dir).as_posix()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缩略图缓存的统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "thumbnails": len(self._thumbs),
+            "bytes": self._thumb_bytes,
+            "budgetBytes": self.thumb_budget_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hitRate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "avgGenerateMs": round(self._generate_seconds / self._misses * 1000, 2) if self._misses else 0.0
+        }
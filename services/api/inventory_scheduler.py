@@ -0,0 +1,312 @@
+"""
+多机器人盘点调度
+功能：
+1. 按库区（areaCode）和巷道（binDesc 前两段，如 LY-02）对储位分组
+2. 将分组按储位数量均衡分配给各机器人，形成每台机器人的子路线
+3. 每台机器人的子路线受容量上限约束，超出时拆分为多段顺序执行
+4. 各机器人并发执行，进度统一汇总到原始 taskNo 下，并统计每台机器人的 储位/小时
+5. 同一台机器人同一时间只执行一条子路线（多个任务、多个工作进程并发时按顺序等待）；
+   某条子路线失败后，该机器人剩余的子路线标记为已跳过
+6. 只在内存中保留最近结束的任务进度，更早的进度从任务存储查询
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class SubRoute(BaseModel):
+    """分配给单台机器人的一段子路线"""
+    route_no: str
+    robot_code: str
+    bin_locations: List[str]
+    status: str = "pending"  # pending, running, completed, failed, skipped, cancelled
+
+
+class RobotProgress(BaseModel):
+    """单台机器人的执行进度"""
+    robot_code: str
+    total_bins: int = 0
+    completed_bins: int = 0
+    failed_bins: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def bins_per_hour(self) -> float:
+        """计算该机器人的盘点速度（储位/小时）"""
+        if self.started_at is None or self.completed_bins == 0:
+            return 0.0
+        end = self.finished_at or time.time()
+        elapsed = max(end - self.started_at, 1e-6)
+        return self.completed_bins * 3600 / elapsed
+
+
+class InventoryProgress(BaseModel):
+    """整个盘点任务（原始 taskNo）的汇总进度"""
+    task_no: str
+    status: str = "init"  # init, running, completed, failed, cancelled
+    total_bins: int = 0
+    started_at: float = Field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    routes: List[SubRoute] = Field(default_factory=list)
+    robots: Dict[str, RobotProgress] = Field(default_factory=dict)
+
+    def record_bin(self, robot_code: str, success: bool):
+        """记录一个储位的处理结果"""
+        robot = self.robots[robot_code]
+        if success:
+            robot.completed_bins += 1
+        else:
+            robot.failed_bins += 1
+
+    def to_dict(self) -> Dict:
+        """转换为接口返回格式"""
+        completed = sum(r.completed_bins for r in self.robots.values())
+        failed = sum(r.failed_bins for r in self.robots.values())
+        return {
+            "taskNo": self.task_no,
+            "status": self.status,
+            "totalBins": self.total_bins,
+            "completedBins": completed,
+            "failedBins": failed,
+            "routes": [
+                {
+                    "routeNo": route.route_no,
+                    "robotCode": route.robot_code,
+                    "binCount": len(route.bin_locations),
+                    "status": route.status
+                }
+                for route in self.routes
+            ],
+            "robots": {
+                code: {
+                    "totalBins": robot.total_bins,
+                    "completedBins": robot.completed_bins,
+                    "failedBins": robot.failed_bins,
+                    "binsPerHour": round(robot.bins_per_hour(), 2)
+                }
+                for code, robot in self.robots.items()
+            }
+        }
+
+
+def aisle_key(bin_location: str, area_code: Optional[str] = None) -> str:
+    """
+    计算储位所属的分组键
+
+    binDesc 形如 LY-02-04-03（库区-巷道-列-层），取前两段作为巷道；
+    提供 areaCode 时以 areaCode 作为前缀，避免不同库区的同名巷道合并
+    """
+    parts = bin_location.split("-")
+    aisle = "-".join(parts[:2]) if len(parts) >= 2 else bin_location
+    return f"{area_code}:{aisle}" if area_code else aisle
+
+
+def group_bins(bin_locations: List[str], bin_areas: Optional[Dict[str, str]] = None) -> "OrderedDict[str, List[str]]":
+    """按库区/巷道对储位分组，保持原始顺序"""
+    bin_areas = bin_areas or {}
+    groups: "OrderedDict[str, List[str]]" = OrderedDict()
+    for location in bin_locations:
+        key = aisle_key(location, bin_areas.get(location))
+        groups.setdefault(key, []).append(location)
+    return groups
+
+
+def plan_routes(
+    task_no: str,
+    bin_locations: List[str],
+    robots: List[str],
+    robot_capacity: int,
+    bin_areas: Optional[Dict[str, str]] = None
+) -> List[SubRoute]:
+    """
+    生成子路线
+
+    同一巷道的储位始终分配给同一台机器人；巷道按储位数从多到少依次分配给当前负载最小的机器人，
+    每台机器人的储位再按 robot_capacity 切分为若干段子路线。
+
+    :param task_no: 原始任务编号
+    :param bin_locations: 储位列表
+    :param robots: 机器人编号列表
+    :param robot_capacity: 单条子路线的最大储位数
+    :param bin_areas: 储位到 areaCode 的映射（可选）
+    :return: 子路线列表
+    """
+    if not robots:
+        raise ValueError("机器人列表不能为空")
+    if robot_capacity <= 0:
+        raise ValueError("机器人容量必须大于0")
+
+    groups = group_bins(bin_locations, bin_areas)
+    assigned: Dict[str, List[str]] = {robot: [] for robot in robots}
+
+    for key in sorted(groups, key=lambda k: len(groups[k]), reverse=True):
+        robot = min(robots, key=lambda r: len(assigned[r]))
+        assigned[robot].extend(groups[key])
+
+    routes = []
+    for robot in robots:
+        bins = assigned[robot]
+        for start in range(0, len(bins), robot_capacity):
+            routes.append(SubRoute(
+                route_no=f"{task_no}-{len(routes) + 1:02d}",
+                robot_code=robot,
+                bin_locations=bins[start:start + robot_capacity]
+            ))
+    return routes
+
+
+RouteRunner = Callable[[InventoryProgress, SubRoute], Awaitable[bool]]
+# 跨进程机器人锁：参数为机器人编号，返回执行子路线期间持有的异步上下文管理器
+RobotLock = Callable[[str], AsyncContextManager]
+
+
+class InventoryScheduler:
+    """多机器人盘点调度器"""
+
+    def __init__(self, robots: List[str], robot_capacity: int = 50, max_finished: int = 100,
+                 robot_lock: Optional[RobotLock] = None):
+        """
+        :param robots: 参与盘点的机器人编号列表
+        :param robot_capacity: 单条子路线的最大储位数
+        :param max_finished: 内存中保留的已结束任务进度数，超出时删除最早结束的
+        :param robot_lock: 跨进程机器人锁（多进程部署时必须提供），不提供时只在本进程内互斥
+        """
+        self.robots = robots
+        self.robot_capacity = robot_capacity
+        self.max_finished = max_finished
+        self.robot_lock = robot_lock
+        self._progress: Dict[str, InventoryProgress] = {}
+        # 每台机器人一把锁，执行子路线期间持有，不同任务的子路线不会同时占用同一台机器人；
+        # 本进程内先在这里排队，再竞争跨进程锁
+        self._robot_locks: Dict[str, asyncio.Lock] = {}
+
+    def get_progress(self, task_no: str) -> Optional[InventoryProgress]:
+        """查询任务汇总进度"""
+        return self._progress.get(task_no)
+
+    def is_running(self, task_no: str) -> bool:
+        """任务是否正在执行"""
+        progress = self._progress.get(task_no)
+        return progress is not None and progress.status == "running"
+
+    def running_tasks(self) -> int:
+        """正在执行的任务数"""
+        return sum(1 for progress in self._progress.values() if progress.status == "running")
+
+    def running_routes(self) -> Dict[str, int]:
+        """每台机器人正在执行的子路线数"""
+        counts = {robot_code: 0 for robot_code in self.robots}
+        for progress in self._progress.values():
+            for route in progress.routes:
+                if route.status == "running":
+                    counts[route.robot_code] = counts.get(route.robot_code, 0) + 1
+        return counts
+
+    async def run(
+        self,
+        task_no: str,
+        bin_locations: List[str],
+        route_runner: RouteRunner,
+        bin_areas: Optional[Dict[str, str]] = None
+    ) -> InventoryProgress:
+        """
+        拆分并执行盘点任务
+
+        :param task_no: 原始任务编号
+        :param bin_locations: 储位列表
+        :param route_runner: 执行单条子路线的协程，返回子路线是否成功
+        :param bin_areas: 储位到 areaCode 的映射（可选）
+        :return: 汇总进度
+        """
+        routes = plan_routes(task_no, bin_locations, self.robots, self.robot_capacity, bin_areas)
+        progress = InventoryProgress(
+            task_no=task_no,
+            status="running",
+            total_bins=len(bin_locations),
+            routes=routes
+        )
+        for route in routes:
+            robot = progress.robots.setdefault(
+                route.robot_code, RobotProgress(robot_code=route.robot_code))
+            robot.total_bins += len(route.bin_locations)
+        self._progress[task_no] = progress
+
+        logger.info(
+            f"盘点任务 {task_no} 拆分为 {len(routes)} 条子路线，"
+            f"分配给 {len(progress.robots)} 台机器人")
+
+        try:
+            results = await asyncio.gather(
+                *(self._run_robot(progress, robot_code, route_runner) for robot_code in progress.robots),
+                return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            progress.finished_at = time.time()
+            progress.status = "cancelled"
+            for route in progress.routes:
+                if route.status in ("pending", "running"):
+                    route.status = "cancelled"
+            self._evict_finished()
+            raise
+
+        progress.finished_at = time.time()
+        progress.status = "completed" if all(r is True for r in results) else "failed"
+        self._evict_finished()
+
+        for code, robot in progress.robots.items():
+            logger.info(
+                f"机器人 {code}: 完成 {robot.completed_bins}/{robot.total_bins} 个储位, "
+                f"{robot.bins_per_hour():.1f} 储位/小时")
+        return progress
+
+    def _evict_finished(self):
+        """已结束的任务进度超过 max_finished 时删除最早结束的"""
+        finished = [task_no for task_no, progress in self._progress.items() if progress.finished_at is not None]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda task_no: self._progress[task_no].finished_at)
+        for task_no in finished[:len(finished) - self.max_finished]:
+            del self._progress[task_no]
+
+    async def _run_robot(self, progress: InventoryProgress, robot_code: str, route_runner: RouteRunner) -> bool:
+        """
+        顺序执行分配给同一台机器人的子路线（每条子路线执行期间持有该机器人的锁）
+
+        某条子路线失败后不再执行该机器人剩余的子路线，并将其标记为 skipped
+        """
+        robot = progress.robots[robot_code]
+        lock = self._robot_locks.setdefault(robot_code, asyncio.Lock())
+        success = True
+        try:
+            for route in progress.routes:
+                if route.robot_code != robot_code:
+                    continue
+                if not success:
+                    route.status = "skipped"
+                    continue
+                if lock.locked():
+                    logger.info(f"机器人 {robot_code} 正在执行其他子路线，{route.route_no} 等待")
+                async with lock, (self.robot_lock(robot_code) if self.robot_lock else nullcontext()):
+                    if robot.started_at is None:
+                        robot.started_at = time.time()
+                    route.status = "running"
+                    try:
+                        ok = await route_runner(progress, route)
+                    except Exception as e:
+                        logger.error(f"子路线执行异常 {route.route_no}: {str(e)}")
+                        ok = False
+                route.status = "completed" if ok else "failed"
+                if not ok:
+                    success = False
+                    logger.warning(f"子路线 {route.route_no} 失败，跳过机器人 {robot_code} 剩余的子路线")
+        finally:
+            robot.finished_at = time.time()
+        return success
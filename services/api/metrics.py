@@ -0,0 +1,196 @@
+"""
+网关运行指标（Prometheus 文本格式）
+功能：
+1. 提供 Counter、Gauge、Histogram 三种指标，按标签分组，记录开销为常数级（无锁、无采样排序）
+2. Counter、Gauge 支持在导出时通过回调取值（如队列深度、在途任务数、已有模块的统计计数）
+3. 事件循环延迟监测：定时 sleep 并测量实际唤醒的延迟
+4. 导出为 Prometheus text exposition format（0.0.4），供 /metrics 抓取
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时分桶（秒）：覆盖毫秒级接口到数十秒的机器人移动/抓图
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _ValueMetric(Metric):
+    """单值指标，可在导出时通过回调取值"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        """
+        :param callback: 导出时调用，返回 {标签值元组: 数值}；无标签时键为空元组
+        """
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+
+    def samples(self) -> Iterable[str]:
+        values = dict(self._values)
+        if self.callback is not None:
+            try:
+                values.update(self.callback())
+            except Exception as e:
+                logger.warning(f"指标 {self.name} 取值失败: {str(e)}")
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Counter(_ValueMetric):
+    """只增计数器"""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_ValueMetric):
+    """瞬时值，可直接设置或在导出时通过回调取值"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """固定分桶的直方图（记录时只做一次二分查找和加法）"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数（非累计）..., +Inf 分桶计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        bounds = self.buckets + (math.inf,)
+        for key, counts in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{labels} {_format_value(cumulative)}"
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = (),
+                callback: Optional[Callable[[], Dict[LabelValues, float]]] = None) -> Counter:
+        return self._register(Counter(self.prefix + name, help_text, labels, callback))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (),
+              callback: Optional[Callable[[], Dict[LabelValues, float]]] = None) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help_text, labels, callback))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        """导出全部指标（Prometheus 文本格式）"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+class EventLoopMonitor:
+    """事件循环延迟监测：每隔 interval 秒 sleep 一次，实际唤醒时间与预期的差值即为延迟"""
+
+    def __init__(self, histogram: Histogram, gauge: Gauge, interval: float = 0.5):
+        """
+        :param histogram: 记录每次延迟的直方图
+        :param gauge: 记录最近一次延迟的 Gauge
+        :param interval: 采样间隔（秒）
+        """
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="event-loop-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.histogram.observe(lag)
+            self.gauge.set(lag)
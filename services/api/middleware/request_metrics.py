@@ -0,0 +1,55 @@
+"""
+接口请求耗时统计中间件
+功能：
+1. 按路由模板（如 /api/inventory/{task_no}/progress）、方法和状态码记录请求耗时，避免路径参数导致标签膨胀
+2. 纯 ASGI 实现，不包装请求/响应体，对 SSE、文件下载等流式响应无额外开销
+3. 耗时计算到响应头发出为止（流式响应的持续时间不计入）
+"""
+
+import time
+
+from metrics import Histogram
+
+
+class RequestMetricsMiddleware:
+    """记录每个 HTTP 请求的耗时"""
+
+    def __init__(self, app, histogram: Histogram, exclude_paths: tuple = ("/metrics",)):
+        """
+        :param histogram: 请求耗时直方图，标签为 (route, method, status)
+        :param exclude_paths: 不统计的路径（如指标抓取本身）
+        """
+        self.app = app
+        self.histogram = histogram
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status_code: int):
+            route = scope.get("route")
+            # 未匹配到路由（404）时统一记为 unmatched
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(
+                time.perf_counter() - start,
+                route=path, method=scope["method"], status=str(status_code))
+
+        async def send_wrapper(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not recorded:
+                recorded = True
+                record(500)
+            raise
@@ -0,0 +1,146 @@
+"""
+盘点进度推送
+功能：
+1. 盘点流程中的状态变化（机器人到位、抓图完成、计数完成、结果提交等）发布为事件
+2. 事件分发给所有订阅者（浏览器通过 SSE 订阅），可按 taskNo 过滤
+3. 每个订阅者使用独立的有界队列，消费慢的订阅者只会丢弃自己的旧事件，不会阻塞盘点流程
+4. 每个任务保留最近的事件，新连接或断线重连（Last-Event-ID）时补发
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """单个订阅者（一个浏览器连接）"""
+
+    def __init__(self, task_no: Optional[str], queue_size: int):
+        self.task_no = task_no  # 为 None 时接收所有任务的事件
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, event: Dict[str, Any]):
+        """非阻塞投递，队列满时丢弃最旧的事件"""
+        if self.task_no is not None and event["taskNo"] != self.task_no:
+            return
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+
+class ProgressBroadcaster:
+    """盘点进度事件广播"""
+
+    def __init__(self, queue_size: int = 100, history_size: int = 500, max_tasks: int = 50,
+                 heartbeat: float = 15.0):
+        """
+        :param queue_size: 每个订阅者最多缓存的未发送事件数
+        :param history_size: 每个任务保留的最近事件数（用于补发）
+        :param max_tasks: 最多保留历史事件的任务数，超出时清理最早的任务
+        :param heartbeat: 无事件时发送心跳的间隔（秒），防止代理断开空闲连接
+        """
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.max_tasks = max_tasks
+        self.heartbeat = heartbeat
+        self._subscribers: List[Subscriber] = []
+        self._history: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._next_id = 1
+        self._published = 0
+
+    def publish(self, task_no: str, event_type: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        发布事件（同步、非阻塞，可在盘点流程中直接调用）
+
+        :param task_no: 任务编号
+        :param event_type: 事件类型，如 robot_arrived、captured、counted、submitted
+        :param data: 事件数据
+        :return: 发布的事件
+        """
+        event = {
+            "id": self._next_id,
+            "type": event_type,
+            "taskNo": task_no,
+            "timestamp": time.time(),
+            "data": data or {}
+        }
+        self._next_id += 1
+        self._published += 1
+
+        if task_no not in self._history:
+            self._history[task_no] = deque(maxlen=self.history_size)
+            while len(self._history) > self.max_tasks:
+                self._history.popitem(last=False)
+        self._history[task_no].append(event)
+        for subscriber in self._subscribers:
+            subscriber.offer(event)
+        return event
+
+    def history(self, task_no: Optional[str] = None, after_id: int = 0) -> List[Dict[str, Any]]:
+        """查询最近的事件（id 大于 after_id）"""
+        if task_no is not None:
+            events = list(self._history.get(task_no, ()))
+        else:
+            events = sorted((e for h in self._history.values() for e in h), key=lambda e: e["id"])
+        return [e for e in events if e["id"] > after_id]
+
+    def discard(self, task_no: str):
+        """清理任务的事件历史"""
+        self._history.pop(task_no, None)
+
+    async def stream(self, task_no: Optional[str] = None, last_event_id: int = 0) -> AsyncIterator[str]:
+        """
+        以 SSE 格式持续输出事件，客户端断开时结束
+
+        :param task_no: 只订阅该任务的事件，为 None 时订阅所有任务
+        :param last_event_id: 客户端已收到的最后一个事件 id，之后的历史事件会先补发
+        """
+        subscriber = Subscriber(task_no, self.queue_size)
+        self._subscribers.append(subscriber)
+        try:
+            # 先补发历史事件（订阅后再取历史，期间发布的事件按 id 去重）
+            # 订阅全部任务且不是断线重连时不补发，避免一次推送大量旧事件
+            sent_id = last_event_id
+            if task_no is not None or last_event_id > 0:
+                for event in self.history(task_no, last_event_id):
+                    sent_id = event["id"]
+                    yield self._format(event)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event["id"] <= sent_id:
+                    continue
+                sent_id = event["id"]
+                yield self._format(event)
+        finally:
+            self._subscribers.remove(subscriber)
+            if subscriber.dropped:
+                logger.warning(f"进度订阅者消费过慢，共丢弃 {subscriber.dropped} 个事件")
+
+    @staticmethod
+    def _format(event: Dict[str, Any]) -> str:
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    def stats(self) -> Dict[str, Any]:
+        """返回广播的统计信息"""
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self._published,
+            "dropped": sum(s.dropped for s in self._subscribers),
+            "tasks": len(self._history)
+        }
@@ -0,0 +1,361 @@
+"""
+盘点结果提交发件箱（setTaskResults）
+功能：
+1. 盘点结果先持久化到 SQLite，接口立即返回，LMS 不可用时结果不丢失
+2. 按条数或时间窗口合并为一次 setTaskResults 批量提交
+3. 提交失败按指数退避重试，网关重启后继续提交未完成的结果；
+   多次失败的结果改为逐条提交，避免一条错误数据拖住整批，超过最大次数或格式错误的结果转为死信（dead）保留待人工处理
+4. 每条结果保存写入时的 authToken，按 token 分批提交
+5. 统计积压数量、死信数量、提交吞吐量和失败次数
+6. 多进程部署时所有进程都可写入，只由一个进程（主进程）负责提交
+
+储位流水线的计数结果不直接写入发件箱，由操作员核对后通过 /lms/setTaskResults 提交。
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item TEXT NOT NULL,
+    auth_token TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON result_outbox(next_attempt_at);
+
+-- 旧版本所有结果共用一个 authToken，只在升级时读取
+CREATE TABLE IF NOT EXISTS result_outbox_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 提交函数：参数为 (authToken, 结果列表)，失败时抛出异常
+ResultSender = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+THROUGHPUT_WINDOW = 60  # 吞吐量统计窗口（秒）
+
+
+class ResultOutbox:
+    """setTaskResults 发件箱"""
+
+    def __init__(
+        self,
+        db_path: str,
+        sender: ResultSender,
+        batch_size: int = 100,
+        max_wait: float = 2.0,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_attempts: int = 20,
+        isolate_after: int = 3
+    ):
+        """
+        :param db_path: SQLite 数据库文件路径
+        :param sender: 向 LMS 提交一批结果的协程
+        :param batch_size: 单次提交的最大条数，积压达到该数量时立即提交
+        :param max_wait: 结果最长等待合并的时间（秒）
+        :param base_delay: 首次重试的等待时间（秒），之后每次翻倍
+        :param max_delay: 重试等待时间上限（秒）
+        :param max_attempts: 单条结果的最大提交次数，超过后转为死信不再重试
+        :param isolate_after: 失败达到该次数的结果单独提交
+        """
+        self.db_path = db_path
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.isolate_after = isolate_after
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self._sent_items = 0
+        self._sent_batches = 0
+        self._failed_batches = 0
+        self._dead_items = 0
+        self._last_error: Optional[str] = None
+        self._recent: Deque[Tuple[float, int]] = deque()  # (提交时间, 条数)
+
+    async def start(self, deliver: bool = True):
+        """
+        打开数据库并启动后台提交
+
+        :param deliver: 是否在当前进程提交，为 False 时只写入，之后可调用 start_delivery 开始提交
+        """
+        await asyncio.to_thread(self._open)
+        self._wakeup = asyncio.Event()
+        if deliver:
+            self.start_delivery()
+        backlog = await self.backlog()
+        logger.info(f"盘点结果发件箱已启动: {self.db_path}, 待提交 {backlog['pending']} 条")
+
+    def start_delivery(self):
+        """启动后台提交（已启动时忽略）"""
+        if self._worker is None and self._conn is not None:
+            self._worker = asyncio.create_task(self._run(), name="result-outbox")
+
+    def wake(self):
+        """唤醒后台提交（其他进程写入了新结果）"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        # 旧版本数据库没有 auth_token、status 列，未提交的结果沿用旧版本保存的 authToken
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(result_outbox)")}
+        if "auth_token" not in columns:
+            conn.execute("ALTER TABLE result_outbox ADD COLUMN auth_token TEXT")
+            conn.execute(
+                "UPDATE result_outbox SET auth_token = "
+                "(SELECT value FROM result_outbox_meta WHERE key = 'auth_token')"
+            )
+        if "status" not in columns:
+            conn.execute("ALTER TABLE result_outbox ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON result_outbox(status, next_attempt_at)")
+        conn.commit()
+        self._conn = conn
+
+    async def stop(self):
+        """停止后台提交（未提交的结果保留在数据库中）"""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        if self._conn is not None:
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+        logger.info("盘点结果发件箱已停止")
+
+    async def _execute(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        def run():
+            with self._db_lock:
+                rows = self._conn.execute(sql, params).fetchall()
+                self._conn.commit()
+                return rows
+        return await asyncio.to_thread(run)
+
+    async def enqueue(self, auth_token: str, items: List[Dict[str, Any]]) -> int:
+        """
+        写入待提交的结果（持久化后返回）
+
+        :param auth_token: 提交和之后重试这些结果使用的 authToken
+        :param items: 结果列表，如 [{"taskDetailId", "itemId", "countQty"}]
+        :return: 写入的条数
+        """
+        now = time.time()
+
+        def run():
+            with self._db_lock:
+                self._conn.executemany(
+                    "INSERT INTO result_outbox (item, auth_token, created_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+                    [(json.dumps(item, ensure_ascii=False), auth_token, now, now) for item in items]
+                )
+                self._conn.commit()
+
+        await asyncio.to_thread(run)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return len(items)
+
+    async def _run(self):
+        """后台提交循环"""
+        while True:
+            try:
+                delay = await self._flush_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"盘点结果发件箱处理异常: {str(e)}")
+                delay = self.base_delay
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush_once(self) -> float:
+        """
+        提交一批到期的结果
+
+        :return: 距离下次需要检查的时间（秒）
+        """
+        now = time.time()
+        rows = await self._execute(
+            "SELECT id, item, created_at, auth_token, attempts FROM result_outbox "
+            "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (now, self.batch_size)
+        )
+        if not rows:
+            return await self._next_due(now)
+
+        # 不足一批且最早的结果未等满时间窗口，继续等待合并
+        oldest = min(row[2] for row in rows)
+        if len(rows) < self.batch_size and now - oldest < self.max_wait:
+            return self.max_wait - (now - oldest)
+
+        first = rows[0]
+        auth_token = first[3]
+        if not auth_token:
+            await self._mark_dead([first[0]], "缺少 authToken")
+            return 0
+        if first[4] >= self.isolate_after:
+            # 多次失败的结果单独提交，不影响其他结果
+            rows = [first]
+        else:
+            # 同一批只包含使用同一 authToken 且未多次失败的结果，其余留到下一批
+            rows = [row for row in rows if row[3] == auth_token and row[4] < self.isolate_after]
+
+        ids = []
+        bad = []
+        # 同一储位任务明细多次提交时只保留最新的结果
+        items: Dict[Any, Dict[str, Any]] = {}
+        for row in rows:
+            try:
+                item = json.loads(row[1])
+                items[item.get("taskDetailId", row[0])] = item
+            except (ValueError, AttributeError):
+                # 无法解析的结果（如不是对象）重试也不会成功，直接转为死信，不阻塞后续结果
+                bad.append(row[0])
+                continue
+            ids.append(row[0])
+        if bad:
+            await self._mark_dead(bad, "盘点结果格式错误")
+        if not ids:
+            return 0
+
+        try:
+            await self.sender(auth_token, list(items.values()))
+        except Exception as e:
+            await self._mark_failed(ids, str(e))
+            return await self._next_due(time.time())
+
+        placeholders = ", ".join("?" * len(ids))
+        await self._execute(f"DELETE FROM result_outbox WHERE id IN ({placeholders})", tuple(ids))
+        self._sent_items += len(items)
+        self._sent_batches += 1
+        self._recent.append((time.time(), len(items)))
+        logger.info(f"盘点结果已批量提交: {len(items)} 条")
+        # 可能还有积压，立即检查下一批
+        return 0
+
+    async def _mark_failed(self, ids: List[int], error: str):
+        """提交失败：按重试次数指数退避，达到最大次数的结果转为死信"""
+        self._failed_batches += 1
+        self._last_error = error
+        now = time.time()
+        placeholders = ", ".join("?" * len(ids))
+        rows = await self._execute(
+            f"SELECT id, attempts FROM result_outbox WHERE id IN ({placeholders})", tuple(ids))
+        updates = []
+        dead = []
+        for row_id, attempts in rows:
+            if attempts + 1 >= self.max_attempts:
+                dead.append(row_id)
+                continue
+            delay = min(self.base_delay * (2 ** attempts), self.max_delay)
+            updates.append((attempts + 1, now + delay, error, row_id))
+
+        def run():
+            with self._db_lock:
+                self._conn.executemany(
+                    "UPDATE result_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    updates
+                )
+                self._conn.commit()
+
+        await asyncio.to_thread(run)
+        if dead:
+            await self._mark_dead(dead, error)
+        if updates:
+            retry_in = min(u[1] for u in updates) - now
+            logger.warning(f"盘点结果提交失败，{retry_in:.1f}秒后重试 ({len(updates)} 条): {error}")
+
+    async def _mark_dead(self, ids: List[int], error: str):
+        """结果转为死信：不再自动重试，保留在数据库中供查询和重新提交"""
+        placeholders = ", ".join("?" * len(ids))
+        await self._execute(
+            f"UPDATE result_outbox SET status = 'dead', attempts = attempts + 1, last_error = ? "
+            f"WHERE id IN ({placeholders})",
+            (error, *ids)
+        )
+        self._dead_items += len(ids)
+        logger.error(f"盘点结果转为死信 ({len(ids)} 条): {error}")
+
+    async def requeue_dead(self) -> int:
+        """把死信重新放回待提交队列（重置提交次数），返回放回的条数"""
+        def run():
+            with self._db_lock:
+                cursor = self._conn.execute(
+                    "UPDATE result_outbox SET status = 'pending', attempts = 0, next_attempt_at = ? "
+                    "WHERE status = 'dead'",
+                    (time.time(),)
+                )
+                self._conn.commit()
+                return cursor.rowcount
+
+        count = await asyncio.to_thread(run)
+        if count and self._wakeup is not None:
+            self._wakeup.set()
+        return count
+
+    async def _next_due(self, now: float) -> float:
+        rows = await self._execute("SELECT MIN(next_attempt_at) FROM result_outbox WHERE status = 'pending'")
+        next_at = rows[0][0] if rows else None
+        if next_at is None:
+            return self.max_delay
+        return max(0.0, min(next_at - now, self.max_delay))
+
+    async def backlog(self) -> Dict[str, Any]:
+        """查询积压情况（pending 不含死信）"""
+        rows = await self._execute(
+            "SELECT COUNT(*), MIN(created_at), MAX(attempts) FROM result_outbox WHERE status = 'pending'")
+        count, oldest, max_attempts = rows[0]
+        dead = await self._execute("SELECT COUNT(*) FROM result_outbox WHERE status = 'dead'")
+        return {
+            "pending": count,
+            "dead": dead[0][0],
+            "oldestAgeSeconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "maxAttempts": max_attempts or 0
+        }
+
+    def counters(self) -> Dict[str, Any]:
+        """返回提交计数（不查询数据库）"""
+        now = time.time()
+        while self._recent and self._recent[0][0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+        recent_items = sum(n for _, n in self._recent)
+        return {
+            "delivering": self._worker is not None,
+            "sentItems": self._sent_items,
+            "sentBatches": self._sent_batches,
+            "failedBatches": self._failed_batches,
+            "deadItems": self._dead_items,
+            "itemsPerMinute": recent_items * 60 / THROUGHPUT_WINDOW,
+            "lastError": self._last_error
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        """返回发件箱的统计信息"""
+        return {**await self.backlog(), **self.counters()}
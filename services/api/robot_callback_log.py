@@ -0,0 +1,170 @@
+"""
+机器人回调去重与事件记录
+功能：
+1. RCS 重试导致的重复回调按 (robotTaskCode, method, seq/timestamp) 去重，重复回调不会再次唤醒等待者
+2. 去重窗口按时间和条数双重限制，内存占用有上限
+3. 每台机器人的回调事件保存在固定长度的环形缓冲区中，可按机器人、任务、method 查询
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 回调条目中可作为序号的字段（按优先级）
+SEQ_FIELDS = ("seq", "sequence", "eventSeq", "timestamp")
+
+
+class RobotCallbackLog:
+    """机器人回调去重与按机器人的环形事件记录"""
+
+    def __init__(
+        self,
+        dedup_window: float = 300.0,
+        dedup_max_keys: int = 50000,
+        history_per_robot: int = 500,
+        max_robots: int = 200
+    ):
+        """
+        :param dedup_window: 去重时间窗口（秒），窗口外的相同回调视为新事件
+        :param dedup_max_keys: 去重记录的最大条数，超出时淘汰最早的记录
+        :param history_per_robot: 每台机器人保留的最近事件数
+        :param max_robots: 最多保留事件记录的机器人数，超出时清理最久没有回调的机器人
+        """
+        self.dedup_window = dedup_window
+        self.dedup_max_keys = dedup_max_keys
+        self.history_per_robot = history_per_robot
+        self.max_robots = max_robots
+        # 去重键 -> 首次收到的时间，按时间先后排序
+        self._seen: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._history: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._next_id = 1
+
+        # 统计信息
+        self._accepted = 0
+        self._duplicates = 0
+        self._replicated = 0
+
+    @staticmethod
+    def dedup_key(robot_task_code: Optional[str], method: str, item: Dict[str, Any]) -> Tuple[str, str, str]:
+        """
+        计算去重键
+
+        回调条目中没有序号或时间戳时使用条目内容本身，相同内容的重试仍可去重。
+        """
+        for field in SEQ_FIELDS:
+            value = item.get(field)
+            if value is not None:
+                return robot_task_code or "", method, f"{field}:{value}"
+        return robot_task_code or "", method, json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+
+    def record(self, robot_task_code: Optional[str], robot_code: Optional[str],
+               method: str, item: Dict[str, Any], remote: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        记录一条回调
+
+        :param remote: 是否为其他网关工作进程转发的回调（只同步去重记录和历史，不计入接收统计）
+        :return: 新事件；重复回调返回 None
+        """
+        now = time.time()
+        key = self.dedup_key(robot_task_code, method, item)
+        self._expire(now)
+        if key in self._seen:
+            if not remote:
+                self._duplicates += 1
+            return None
+        self._seen[key] = now
+
+        event = {
+            "id": self._next_id,
+            "robotTaskCode": robot_task_code,
+            "robotCode": robot_code,
+            "method": method,
+            "receivedAt": now,
+            "data": item
+        }
+        self._next_id += 1
+        if remote:
+            self._replicated += 1
+        else:
+            self._accepted += 1
+
+        robot = robot_code or ""
+        history = self._history.get(robot)
+        if history is None:
+            history = self._history[robot] = deque(maxlen=self.history_per_robot)
+            while len(self._history) > self.max_robots:
+                self._history.popitem(last=False)
+        else:
+            self._history.move_to_end(robot)
+        history.append(event)
+        return event
+
+    def mark_duplicates(self, count: int = 1):
+        """
+        已计入接收的回调被确认为重复：其他工作进程先收到同一回调并已写入回调存储
+
+        :param count: 确认为重复的回调数
+        """
+        count = min(count, self._accepted)
+        self._accepted -= count
+        self._duplicates += count
+
+    def _expire(self, now: float):
+        """清理过期或超出条数上限的去重记录（记录按时间有序，只需检查队首）"""
+        seen = self._seen
+        cutoff = now - self.dedup_window
+        while seen:
+            key, first_seen = next(iter(seen.items()))
+            if first_seen >= cutoff and len(seen) < self.dedup_max_keys:
+                break
+            seen.popitem(last=False)
+
+    def query(
+        self,
+        robot_code: Optional[str] = None,
+        robot_task_code: Optional[str] = None,
+        method: Optional[str] = None,
+        after_id: int = 0,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        查询最近的回调事件（按 id 升序，返回最新的 limit 条）
+
+        :param robot_code: 只返回该机器人的事件
+        :param robot_task_code: 只返回该任务的事件
+        :param method: 只返回该类型的事件
+        :param after_id: 只返回 id 大于该值的事件（增量拉取）
+        """
+        if robot_code is not None:
+            sources = [self._history.get(robot_code, ())]
+        else:
+            sources = list(self._history.values())
+
+        events = [
+            event
+            for history in sources
+            for event in history
+            if event["id"] > after_id
+            and (robot_task_code is None or event["robotTaskCode"] == robot_task_code)
+            and (method is None or event["method"] == method)
+        ]
+        if len(sources) > 1:
+            events.sort(key=lambda e: e["id"])
+        return events[-limit:] if limit > 0 else events
+
+    def stats(self) -> Dict[str, Any]:
+        """返回回调记录的统计信息"""
+        total = self._accepted + self._duplicates
+        return {
+            "accepted": self._accepted,
+            "duplicates": self._duplicates,
+            "duplicateRate": round(self._duplicates / total, 4) if total else 0.0,
+            "replicated": self._replicated,
+            "dedupKeys": len(self._seen),
+            "robots": len(self._history),
+            "events": sum(len(h) for h in self._history.values())
+        }
@@ -0,0 +1,255 @@
+"""
+机器人回调持久化与跨进程分发（SQLite，WAL 模式）
+功能：
+1. 接收回调的工作进程在内存中去重并直接唤醒本进程的等待者，回调只放入待写入列表，不在请求中等待写盘
+2. 后台写入协程把积累的回调合并为一个事务写入（一次提交），按去重键唯一，
+   已被其他工作进程写入的相同回调被忽略并计为重复
+3. 各工作进程按自增 id 读取其他进程写入的回调并分发给本进程的等待者；广播消息只用于提前唤醒读取，
+   广播丢失时由定时读取补上，回调不会丢失
+4. 去重窗口之外的记录定期删除，窗口外的相同回调视为新事件
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS robot_callback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    robot_task_code TEXT,
+    robot_code TEXT,
+    method TEXT NOT NULL,
+    data TEXT,
+    worker_id TEXT,
+    received_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_robot_callback_received ON robot_callback(received_at);
+"""
+
+# 分发函数：参数为其他工作进程接收的回调事件 {"id", "robotTaskCode", "robotCode", "method", "data"}
+EventHandler = Callable[[Dict[str, Any]], None]
+# 写入完成回调：本次写入的新回调数大于 0 时调用（用于广播唤醒其他工作进程）
+PersistedHandler = Callable[[], None]
+# 重复回调：参数为本次写入中被忽略的回调数（其他工作进程已写入相同回调）
+DuplicateHandler = Callable[[int], None]
+
+PURGE_INTERVAL = 60.0  # 删除过期去重记录的间隔（秒）
+
+
+class RobotCallbackStore:
+    """机器人回调存储"""
+
+    def __init__(self, db_path: str, worker_id: str, dedup_window: float = 300.0, poll_interval: float = 1.0):
+        """
+        :param db_path: SQLite 数据库文件路径（同一网关的所有工作进程必须相同）
+        :param worker_id: 当前工作进程标识，分发时区分本进程接收和其他进程接收的回调
+        :param dedup_window: 去重时间窗口（秒）
+        :param poll_interval: 没有广播唤醒时读取新回调的间隔（秒）
+        """
+        self.db_path = db_path
+        self.worker_id = worker_id
+        self.dedup_window = dedup_window
+        self.poll_interval = poll_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._handler: Optional[EventHandler] = None
+        self._on_persisted: Optional[PersistedHandler] = None
+        self._on_duplicates: Optional[DuplicateHandler] = None
+        # 待写入的回调：(去重键, robotTaskCode, robotCode, method, data, 接收时间)
+        self._pending: List[Tuple] = []
+        self._last_id = 0
+        self._sync_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._purged_at = 0.0
+
+        # 统计信息
+        self._persisted = 0
+        self._duplicates = 0
+        self._flushes = 0
+        self._delivered = 0
+        self._polled = 0
+
+    async def open(self, handler: EventHandler, on_persisted: Optional[PersistedHandler] = None,
+                   on_duplicates: Optional[DuplicateHandler] = None):
+        """
+        打开数据库，开始后台写入和分发其他工作进程的回调（只分发打开之后写入的回调）
+
+        :param handler: 分发函数，在事件循环中同步调用
+        :param on_persisted: 写入完成回调
+        :param on_duplicates: 写入时发现重复回调的回调（用于修正接收统计）
+        """
+        self._handler = handler
+        self._on_persisted = on_persisted
+        self._on_duplicates = on_duplicates
+        self._last_id = await asyncio.to_thread(self._open)
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._poll_task = asyncio.create_task(self._poll_loop(), name="robot-callback-poll")
+        logger.info(f"机器人回调存储已打开: {self.db_path}")
+
+    def _open(self) -> int:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._conn = conn
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM robot_callback").fetchone()[0]
+
+    async def close(self):
+        """写入剩余回调，停止分发并关闭数据库"""
+        if self._poll_task is not None:
+            # 不取消后台协程：取消正在写入的批次会使写入线程继续提交而统计丢失，等它完成当前一轮后退出
+            self._closing = True
+            self._wakeup.set()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+            self._poll_task = None
+        if self._conn is not None:
+            await self.flush()
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+            logger.info("机器人回调存储已关闭")
+
+    def append(self, robot_task_code: Optional[str], robot_code: Optional[str],
+               method: str, item: Dict[str, Any], dedup_key: Tuple[str, ...]):
+        """
+        放入待写入列表（不等待写盘），由后台写入协程批量写入
+
+        调用方应已在内存中去重并唤醒本进程的等待者。
+
+        :param dedup_key: 去重键（见 RobotCallbackLog.dedup_key）
+        """
+        self._pending.append((
+            json.dumps(dedup_key, ensure_ascii=False), robot_task_code, robot_code, method,
+            json.dumps(item, ensure_ascii=False, default=str), time.time()
+        ))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def wake(self):
+        """唤醒读取（其他工作进程写入了新回调）"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """
+        把待写入的回调作为一个事务写入（一次提交）
+
+        :return: 写入的新回调数（不含已被其他工作进程写入的重复回调）
+        """
+        if not self._pending or self._conn is None:
+            return 0
+        batch, self._pending = self._pending, []
+
+        def run():
+            inserted = 0
+            with self._db_lock:
+                for key, robot_task_code, robot_code, method, data, received_at in batch:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO robot_callback "
+                        "(dedup_key, robot_task_code, robot_code, method, data, worker_id, received_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, robot_task_code, robot_code, method, data, self.worker_id, received_at)
+                    )
+                    inserted += cursor.rowcount
+                self._conn.commit()
+            return inserted
+
+        try:
+            inserted = await asyncio.to_thread(run)
+        except Exception:
+            # 写入失败时放回待写入列表，下次重试
+            self._pending = batch + self._pending
+            raise
+        duplicates = len(batch) - inserted
+        self._flushes += 1
+        self._persisted += inserted
+        self._duplicates += duplicates
+        if duplicates and self._on_duplicates is not None:
+            self._on_duplicates(duplicates)
+        if inserted and self._on_persisted is not None:
+            self._on_persisted()
+        return inserted
+
+    async def sync(self):
+        """读取上次之后其他工作进程写入的回调，按 id 顺序分发"""
+        async with self._sync_lock:
+            if self._conn is None:
+                return
+            rows = await asyncio.to_thread(self._fetch_after, self._last_id)
+            for row in rows:
+                self._last_id = row[0]
+                if row[5] == self.worker_id:
+                    # 本进程接收的回调已在接收时分发
+                    continue
+                self._delivered += 1
+                try:
+                    self._handler({
+                        "id": row[0],
+                        "robotTaskCode": row[1],
+                        "robotCode": row[2],
+                        "method": row[3],
+                        "data": json.loads(row[4]) if row[4] else {}
+                    })
+                except Exception as e:
+                    logger.error(f"分发机器人回调失败: {row[1]}/{row[2]} -> {row[3]}, {str(e)}")
+
+    def _fetch_after(self, last_id: int) -> List[Tuple]:
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT id, robot_task_code, robot_code, method, data, worker_id "
+                "FROM robot_callback WHERE id > ? ORDER BY id",
+                (last_id,)
+            ).fetchall()
+
+    async def _poll_loop(self):
+        """有新回调或广播唤醒时写入并读取，否则每隔 poll_interval 读取一次；定期删除过期记录"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                self._polled += 1
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                await self.sync()
+                if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                    await self._purge()
+            except Exception as e:
+                logger.error(f"读取机器人回调失败: {str(e)}")
+
+    async def _purge(self):
+        """删除去重窗口之外的记录"""
+        cutoff = time.time() - self.dedup_window
+
+        def run():
+            with self._db_lock:
+                cursor = self._conn.execute("DELETE FROM robot_callback WHERE received_at < ?", (cutoff,))
+                self._conn.commit()
+                return cursor.rowcount
+
+        purged = await asyncio.to_thread(run)
+        self._purged_at = time.monotonic()
+        if purged:
+            logger.debug(f"已删除 {purged} 条过期机器人回调记录")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回回调存储的统计信息"""
+        return {
+            "pending": len(self._pending),
+            "persisted": self._persisted,
+            "duplicates": self._duplicates,
+            "flushes": self._flushes,
+            "delivered": self._delivered,
+            "lastId": self._last_id,
+            "polls": self._polled
+        }
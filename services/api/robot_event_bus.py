@@ -0,0 +1,184 @@
+"""
+机器人状态事件总线
+功能：
+1. 按 robotTaskCode / singleRobotCode 分键存储机器人回调事件
+2. 每个键使用有界队列，事件在两次等待之间到达也不会丢失
+3. 等待方按 method 精确匹配，事件到达时直接唤醒，无需轮询
+4. 事件被消费且没有等待者的键立即清理；长时间没有活动或超出键数上限的键按最近活动时间淘汰（有等待者的键保留）
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RobotEventBus:
+    """按键分发的机器人状态事件总线"""
+
+    def __init__(self, max_events_per_key: int = 100, key_ttl: float = 600.0, max_keys: int = 10000):
+        """
+        :param max_events_per_key: 每个键最多缓存的未消费事件数，超出时丢弃最旧的事件
+        :param key_ttl: 键没有新事件和等待者的最长保留时间（秒）
+        :param max_keys: 最多保留的键数，超出时淘汰最久没有活动的键
+        """
+        self.max_events_per_key = max_events_per_key
+        self.key_ttl = key_ttl
+        self.max_keys = max_keys
+        # 未被消费的事件队列
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = {}
+        # 等待中的协程：(期望的method, future)
+        self._waiters: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        # 每个键最近一次的状态（仅用于查询）
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        # 每个键因队列已满丢弃的事件数
+        self._dropped: Dict[str, int] = {}
+        # 键 -> 最近活动时间（发布或开始等待），按时间先后排序
+        self._touched: "OrderedDict[str, float]" = OrderedDict()
+        self._evicted = 0
+
+    def publish(self, keys: List[Optional[str]], method: str, data: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        发布一个事件到指定的键
+
+        :param keys: 事件所属的键列表（如 robotTaskCode、singleRobotCode），空值会被忽略
+        :param method: 事件类型（start / outbin / end 等）
+        :param data: 事件附带数据
+        :return: 发布的事件
+        """
+        now = time.time()
+        event = {
+            "method": method,
+            "timestamp": now,
+            "data": data or {}
+        }
+
+        for key in keys:
+            if not key:
+                continue
+            self._touch(key, now)
+            self._latest[key] = event
+            if not self._deliver(key, event):
+                queue = self._queues.setdefault(
+                    key, deque(maxlen=self.max_events_per_key))
+                if len(queue) == queue.maxlen:
+                    # 没有等待者的键（如机器人编号）会持续溢出，只在首次和每 1000 次时记录
+                    dropped = self._dropped.get(key, 0) + 1
+                    self._dropped[key] = dropped
+                    if dropped % 1000 == 1:
+                        logger.warning(f"事件队列已满，丢弃最旧事件: {key} (累计 {dropped} 个)")
+                queue.append(event)
+
+        self._evict(now)
+        return event
+
+    def _touch(self, key: str, now: float):
+        self._touched[key] = now
+        self._touched.move_to_end(key)
+
+    def _evict(self, now: float):
+        """淘汰超过 key_ttl 没有活动或超出 max_keys 的键（按最近活动时间有序，只需检查队首）"""
+        touched = self._touched
+        cutoff = now - self.key_ttl
+        for _ in range(len(touched)):
+            key, touched_at = next(iter(touched.items()))
+            if touched_at >= cutoff and len(touched) <= self.max_keys:
+                break
+            if key in self._waiters:
+                # 仍有等待者，推迟淘汰
+                touched.move_to_end(key)
+                continue
+            self._forget(key)
+            self._evicted += 1
+
+    def _forget(self, key: str):
+        """删除键的事件队列、最近状态和活动记录"""
+        self._queues.pop(key, None)
+        self._latest.pop(key, None)
+        self._dropped.pop(key, None)
+        self._touched.pop(key, None)
+
+    def _release(self, key: str):
+        """事件被消费或等待结束后，队列已空且没有等待者的键不再保留"""
+        if not self._queues.get(key) and not self._waiters.get(key):
+            self._forget(key)
+
+    def _deliver(self, key: str, event: Dict[str, Any]) -> bool:
+        """尝试把事件直接交给匹配的等待者，成功返回 True"""
+        waiters = self._waiters.get(key)
+        if not waiters:
+            return False
+
+        for i, (expected_method, future) in enumerate(waiters):
+            if future.done():
+                continue
+            if expected_method == event["method"]:
+                future.set_result(event)
+                del waiters[i]
+                return True
+        return False
+
+    async def wait_for(self, key: str, expected_method: str, timeout: float = 300) -> Dict[str, Any]:
+        """
+        等待指定键上出现期望的事件
+
+        先检查已缓存但未消费的事件，没有则挂起直到匹配的事件到达或超时。
+
+        :param key: 事件键
+        :param expected_method: 期望的事件类型
+        :param timeout: 超时时间（秒）
+        :return: 匹配的事件
+        :raises asyncio.TimeoutError: 超时未收到期望事件
+        """
+        queue = self._queues.get(key)
+        if queue:
+            for event in queue:
+                if event["method"] == expected_method:
+                    queue.remove(event)
+                    self._release(key)
+                    return event
+
+        self._touch(key, time.time())
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(key, [])
+        entry = (expected_method, future)
+        waiters.append(entry)
+
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"等待 {key} 的 {expected_method} 状态超时")
+        finally:
+            if entry in waiters:
+                waiters.remove(entry)
+            if not waiters:
+                self._waiters.pop(key, None)
+            self._release(key)
+
+    def latest(self, key: str) -> Optional[Dict[str, Any]]:
+        """获取指定键最近一次的事件"""
+        return self._latest.get(key)
+
+    def pending(self, key: str) -> List[Dict[str, Any]]:
+        """获取指定键上尚未被消费的事件"""
+        return list(self._queues.get(key, ()))
+
+    def discard(self, key: str):
+        """清理指定键的所有缓存（任务结束后调用，避免内存增长）"""
+        self._forget(key)
+        for _, future in self._waiters.pop(key, []):
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回事件总线的统计信息"""
+        return {
+            "keys": len(self._touched),
+            "evictedKeys": self._evicted,
+            "pendingEvents": sum(len(q) for q in self._queues.values()),
+            "droppedEvents": sum(self._dropped.values()),
+            "waiters": sum(len(w) for w in self._waiters.values())
+        }
@@ -0,0 +1,148 @@
+"""
+盘点任务运行控制（取消 / 暂停 / 继续）
+功能：
+1. 每个盘点工作流作为独立的 asyncio 任务登记，取消时直接取消该任务：
+   正在等待的机器人回调、抓图子进程、排队中的计数任务随之释放，无需等待超时
+2. 暂停在储位之间生效：当前储位处理完成后机器人停在原地，继续后再前往下一个储位
+3. 区分主动取消和网关退出导致的取消，网关退出时任务保持未完成状态，重启后可恢复
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Coroutine, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TaskControl:
+    """单个盘点任务的运行控制状态"""
+
+    def __init__(self, task_no: str, task: asyncio.Task):
+        self.task_no = task_no
+        self.task = task
+        self.started_at = time.time()
+        self.cancel_reason: Optional[str] = None
+        self.paused_at: Optional[float] = None
+        self.paused_seconds = 0.0
+        # 未暂停时处于 set 状态，暂停点直接通过
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已被主动取消（网关退出导致的取消不算）"""
+        return self.cancel_reason is not None
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_at is not None
+
+    async def checkpoint(self):
+        """暂停点：暂停期间挂起，继续或取消时返回（取消时由任务取消抛出 CancelledError）"""
+        if self._resumed.is_set():
+            return
+        logger.info(f"盘点任务已暂停，等待继续: {self.task_no}")
+        await self._resumed.wait()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "taskNo": self.task_no,
+            "state": "cancelled" if self.cancelled else "paused" if self.paused else "running",
+            "startedAt": self.started_at,
+            "pausedAt": self.paused_at,
+            "pausedSeconds": round(self.paused_seconds, 1),
+            "cancelReason": self.cancel_reason
+        }
+
+
+class TaskControlRegistry:
+    """运行中的盘点任务登记表"""
+
+    def __init__(self):
+        self._controls: Dict[str, TaskControl] = {}
+        self._cancelled = 0
+
+    def start(self, task_no: str, coro: Coroutine) -> asyncio.Task:
+        """
+        以独立 asyncio 任务启动工作流并登记，工作流结束后自动移除
+
+        :raises RuntimeError: 同一任务已在运行
+        """
+        if task_no in self._controls:
+            coro.close()
+            raise RuntimeError(f"盘点任务已在执行中: {task_no}")
+        task = asyncio.create_task(coro, name=f"inventory-{task_no}")
+        control = TaskControl(task_no, task)
+        self._controls[task_no] = control
+        task.add_done_callback(lambda _: self._finished(control))
+        return task
+
+    def _finished(self, control: TaskControl):
+        if self._controls.get(control.task_no) is control:
+            del self._controls[control.task_no]
+
+    def get(self, task_no: str) -> Optional[TaskControl]:
+        return self._controls.get(task_no)
+
+    def tasks(self):
+        """所有运行中的工作流任务"""
+        return [control.task for control in self._controls.values()]
+
+    def cancel(self, task_no: str, reason: str = "手动取消") -> bool:
+        """
+        取消运行中的任务
+
+        :return: 任务是否在本进程中运行
+        """
+        control = self._controls.get(task_no)
+        if control is None:
+            return False
+        if not control.cancelled:
+            control.cancel_reason = reason
+            self._cancelled += 1
+            logger.info(f"取消盘点任务: {task_no}, 原因: {reason}")
+        control.task.cancel()
+        return True
+
+    def pause(self, task_no: str) -> bool:
+        """暂停运行中的任务（当前储位完成后生效）"""
+        control = self._controls.get(task_no)
+        if control is None:
+            return False
+        if not control.paused:
+            control.paused_at = time.time()
+            control._resumed.clear()
+            logger.info(f"暂停盘点任务: {task_no}")
+        return True
+
+    def resume(self, task_no: str) -> bool:
+        """继续已暂停的任务"""
+        control = self._controls.get(task_no)
+        if control is None:
+            return False
+        if control.paused:
+            control.paused_seconds += time.time() - control.paused_at
+            control.paused_at = None
+            control._resumed.set()
+            logger.info(f"继续盘点任务: {task_no}")
+        return True
+
+    async def checkpoint(self, task_no: str):
+        """任务的暂停点（任务未登记时直接返回）"""
+        control = self._controls.get(task_no)
+        if control is not None:
+            await control.checkpoint()
+
+    def is_cancelled(self, task_no: str) -> bool:
+        control = self._controls.get(task_no)
+        return control is not None and control.cancelled
+
+    def stats(self) -> Dict[str, Any]:
+        """返回运行控制的统计信息"""
+        return {
+            "running": len(self._controls),
+            "paused": sum(1 for c in self._controls.values() if c.paused),
+            "cancelled": self._cancelled,
+            "tasks": [c.to_dict() for c in self._controls.values()]
+        }
@@ -0,0 +1,389 @@
+"""
+盘点任务持久化存储（SQLite，WAL 模式）
+功能：
+1. 持久化盘点任务和每个储位的状态、结果，网关重启后不丢失
+2. 按 taskNo、储位、状态建立索引，状态查询无需全表扫描
+3. 储位状态更新先合并在内存中，按数量或时间批量写入，避免每次状态变化都写盘；
+   批量写入串行执行，同一储位的更新按发生顺序落盘
+4. 网关启动时找出未完成的任务，从未完成的储位继续执行
+5. 记录执行任务的网关工作进程（多进程部署时只恢复执行者已退出的任务）
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory_task (
+    task_no TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total_bins INTEGER NOT NULL,
+    bin_areas TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_task_status ON inventory_task(status);
+
+CREATE TABLE IF NOT EXISTS inventory_bin (
+    task_no TEXT NOT NULL,
+    bin_location TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    robot_code TEXT,
+    route_no TEXT,
+    result TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (task_no, bin_location)
+);
+CREATE INDEX IF NOT EXISTS idx_bin_location ON inventory_bin(bin_location, status);
+CREATE INDEX IF NOT EXISTS idx_bin_task_status ON inventory_bin(task_no, status);
+"""
+
+# 未结束的任务状态，启动时需要恢复
+UNFINISHED_STATUSES = ("init", "running")
+
+BIN_COLUMNS = ("status", "robot_code", "route_no", "result")
+
+
+class TaskStore:
+    """盘点任务存储"""
+
+    def __init__(self, db_path: str, batch_size: int = 50, flush_interval: float = 1.0):
+        """
+        :param db_path: SQLite 数据库文件路径
+        :param batch_size: 待写入的储位更新达到该数量时立即写入
+        :param flush_interval: 待写入的更新最长等待时间（秒）
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        # 所有数据库操作在线程池中执行，连接本身不是线程安全的
+        self._db_lock = threading.Lock()
+        # 待写入的储位更新：(taskNo, 储位) -> 字段
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_event: Optional[asyncio.Event] = None
+        # 同一时间只有一次批量写入，后取出的更新一定在先取出的之后写入
+        self._flush_lock = asyncio.Lock()
+
+        # 统计信息
+        self._flushes = 0
+        self._flushed_rows = 0
+
+    async def open(self):
+        """打开数据库并启动后台批量写入"""
+        await asyncio.to_thread(self._open)
+        self._flush_event = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop(), name="task-store-flush")
+        logger.info(f"任务存储已打开: {self.db_path}")
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        # 旧版本数据库没有 owner 列
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(inventory_task)")}
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE inventory_task ADD COLUMN owner TEXT")
+        conn.commit()
+        self._conn = conn
+
+    async def close(self):
+        """写入剩余更新并关闭数据库"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        if self._conn is not None:
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+            logger.info("任务存储已关闭")
+
+    async def _execute(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        def run():
+            with self._db_lock:
+                cursor = self._conn.execute(sql, params)
+                rows = cursor.fetchall()
+                self._conn.commit()
+                return rows
+        return await asyncio.to_thread(run)
+
+    # ------------------------------------------------------------------ 写入
+
+    async def create_task(self, task_no: str, bin_locations: List[str],
+                          bin_areas: Optional[Dict[str, str]] = None, owner: Optional[str] = None):
+        """创建任务及其全部储位（同一任务重复创建时覆盖），owner 为执行任务的网关工作进程"""
+        now = time.time()
+
+        def run():
+            with self._db_lock:
+                self._conn.execute("DELETE FROM inventory_bin WHERE task_no = ?", (task_no,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO inventory_task "
+                    "(task_no, status, total_bins, bin_areas, owner, created_at, updated_at) "
+                    "VALUES (?, 'init', ?, ?, ?, ?, ?)",
+                    (task_no, len(bin_locations), json.dumps(bin_areas or {}, ensure_ascii=False),
+                     owner, now, now)
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO inventory_bin (task_no, bin_location, seq, status, updated_at) "
+                    "VALUES (?, ?, ?, 'init', ?)",
+                    [(task_no, location, seq, now) for seq, location in enumerate(bin_locations)]
+                )
+                self._conn.commit()
+
+        # 等待正在进行的批量写入结束，避免旧更新覆盖重新创建的储位；并丢弃该任务尚未写入的旧更新
+        async with self._flush_lock:
+            for key in [k for k in self._pending if k[0] == task_no]:
+                del self._pending[key]
+            await asyncio.to_thread(run)
+
+    async def set_task_status(self, task_no: str, status: str):
+        """更新任务状态（立即写入）"""
+        await self.flush()
+        await self._execute(
+            "UPDATE inventory_task SET status = ?, updated_at = ? WHERE task_no = ?",
+            (status, time.time(), task_no)
+        )
+
+    async def claim_task(self, task_no: str, owner: str, previous_owner: Optional[str]) -> bool:
+        """
+        接管任务：仅当任务当前的执行者仍为 previous_owner 时改为 owner
+
+        :return: 是否接管成功（已被其他进程接管时返回 False）
+        """
+        def run():
+            with self._db_lock:
+                cursor = self._conn.execute(
+                    "UPDATE inventory_task SET owner = ?, updated_at = ? WHERE task_no = ? AND owner IS ?",
+                    (owner, time.time(), task_no, previous_owner)
+                )
+                self._conn.commit()
+                return cursor.rowcount == 1
+        return await asyncio.to_thread(run)
+
+    async def cancel_bins(self, task_no: str) -> int:
+        """把任务中尚未完成的储位标记为已取消（释放储位，可重新下发盘点），返回更新的储位数"""
+        await self.flush()
+
+        def run():
+            with self._db_lock:
+                cursor = self._conn.execute(
+                    "UPDATE inventory_bin SET status = 'cancelled', updated_at = ? "
+                    "WHERE task_no = ? AND status IN ('init', 'running', 'captured')",
+                    (time.time(), task_no)
+                )
+                self._conn.commit()
+                return cursor.rowcount
+        return await asyncio.to_thread(run)
+
+    def update_bin(self, task_no: str, bin_location: str, **fields: Any):
+        """
+        更新储位字段（status、robot_code、route_no、result），批量写入
+
+        :raises ValueError: 字段名不合法
+        """
+        unknown = set(fields) - set(BIN_COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的储位字段: {unknown}")
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False, default=str)
+
+        pending = self._pending.setdefault((task_no, bin_location), {})
+        pending.update(fields)
+        pending["updated_at"] = time.time()
+        if len(self._pending) >= self.batch_size and self._flush_event is not None:
+            self._flush_event.set()
+
+    async def flush(self):
+        """立即写入所有待写入的储位更新（多次调用按顺序执行）"""
+        async with self._flush_lock:
+            await self._flush_pending()
+
+    async def _flush_pending(self):
+        if not self._pending or self._conn is None:
+            return
+        batch, self._pending = self._pending, {}
+
+        def run():
+            with self._db_lock:
+                for (task_no, bin_location), fields in batch.items():
+                    columns = ", ".join(f"{name} = ?" for name in fields)
+                    self._conn.execute(
+                        f"UPDATE inventory_bin SET {columns} WHERE task_no = ? AND bin_location = ?",
+                        (*fields.values(), task_no, bin_location)
+                    )
+                self._conn.commit()
+
+        try:
+            await asyncio.to_thread(run)
+        except Exception as e:
+            # 写入失败时放回待写入队列，较新的更新优先
+            for key, fields in batch.items():
+                self._pending[key] = {**fields, **self._pending.get(key, {})}
+            logger.error(f"任务存储批量写入失败: {str(e)}")
+            raise
+        self._flushes += 1
+        self._flushed_rows += len(batch)
+
+    async def _flush_loop(self):
+        """后台批量写入：达到批量大小或等待超过 flush_interval 时写入"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+    async def purge_before(self, timestamp: float) -> int:
+        """删除指定时间之前已结束的任务，返回删除的任务数"""
+        rows = await self._execute(
+            "SELECT task_no FROM inventory_task WHERE updated_at < ? AND status NOT IN (?, ?)",
+            (timestamp, *UNFINISHED_STATUSES)
+        )
+        task_nos = [row["task_no"] for row in rows]
+        for task_no in task_nos:
+            await self._execute("DELETE FROM inventory_bin WHERE task_no = ?", (task_no,))
+            await self._execute("DELETE FROM inventory_task WHERE task_no = ?", (task_no,))
+        return len(task_nos)
+
+    # ------------------------------------------------------------------ 查询
+
+    async def get_task(self, task_no: str) -> Optional[Dict[str, Any]]:
+        """查询任务及各状态的储位数"""
+        await self.flush()
+        rows = await self._execute("SELECT * FROM inventory_task WHERE task_no = ?", (task_no,))
+        if not rows:
+            return None
+        counts = await self._execute(
+            "SELECT status, COUNT(*) AS n FROM inventory_bin WHERE task_no = ? GROUP BY status",
+            (task_no,)
+        )
+        task = self._task_dict(rows[0])
+        task["binCounts"] = {row["status"]: row["n"] for row in counts}
+        return task
+
+    async def list_tasks(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """按状态查询任务（按更新时间倒序）"""
+        await self.flush()
+        if status:
+            rows = await self._execute(
+                "SELECT * FROM inventory_task WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+                (status, limit)
+            )
+        else:
+            rows = await self._execute(
+                "SELECT * FROM inventory_task ORDER BY updated_at DESC LIMIT ?", (limit,))
+        return [self._task_dict(row) for row in rows]
+
+    async def list_bins(self, task_no: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """查询任务的储位（按下发顺序）"""
+        await self.flush()
+        if status:
+            rows = await self._execute(
+                "SELECT * FROM inventory_bin WHERE task_no = ? AND status = ? ORDER BY seq",
+                (task_no, status)
+            )
+        else:
+            rows = await self._execute(
+                "SELECT * FROM inventory_bin WHERE task_no = ? ORDER BY seq", (task_no,))
+        return [self._bin_dict(row) for row in rows]
+
+    async def find_bins(self, bin_locations: List[str], status: str) -> List[Dict[str, Any]]:
+        """查询指定储位中处于某状态的记录（用于检查储位是否正在盘点）"""
+        await self.flush()
+        found = []
+        # SQLite 单条语句的参数数量有限，分批查询
+        for start in range(0, len(bin_locations), 500):
+            chunk = bin_locations[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = await self._execute(
+                f"SELECT * FROM inventory_bin WHERE bin_location IN ({placeholders}) AND status = ?",
+                (*chunk, status)
+            )
+            found.extend(self._bin_dict(row) for row in rows)
+        return found
+
+    async def get_results(self, task_no: str) -> List[Dict[str, Any]]:
+        """查询任务已提交的储位结果"""
+        await self.flush()
+        rows = await self._execute(
+            "SELECT result FROM inventory_bin WHERE task_no = ? AND result IS NOT NULL ORDER BY seq",
+            (task_no,)
+        )
+        return [json.loads(row["result"]) for row in rows]
+
+    async def unfinished_tasks(self) -> List[Dict[str, Any]]:
+        """
+        查询未结束的任务及其未完成的储位（启动时恢复用）
+
+        未完成的储位包括状态不是 completed 的，以及没有提交结果的（旧版本在抓图后即标记为 completed）
+
+        :return: [{"taskNo", "binLocations": 未完成的储位（按原顺序）, "binAreas", "owner"}]
+        """
+        await self.flush()
+        rows = await self._execute(
+            "SELECT * FROM inventory_task WHERE status IN (?, ?) ORDER BY created_at",
+            UNFINISHED_STATUSES
+        )
+        tasks = []
+        for row in rows:
+            bins = await self._execute(
+                "SELECT bin_location FROM inventory_bin "
+                "WHERE task_no = ? AND (status != 'completed' OR result IS NULL) ORDER BY seq",
+                (row["task_no"],)
+            )
+            tasks.append({
+                "taskNo": row["task_no"],
+                "binLocations": [b["bin_location"] for b in bins],
+                "binAreas": json.loads(row["bin_areas"] or "{}"),
+                "owner": row["owner"]
+            })
+        return tasks
+
+    def stats(self) -> Dict[str, Any]:
+        """返回存储的统计信息"""
+        return {
+            "dbPath": self.db_path,
+            "pendingUpdates": len(self._pending),
+            "flushes": self._flushes,
+            "flushedRows": self._flushed_rows
+        }
+
+    @staticmethod
+    def _task_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "taskNo": row["task_no"],
+            "status": row["status"],
+            "totalBins": row["total_bins"],
+            "owner": row["owner"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"]
+        }
+
+    @staticmethod
+    def _bin_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "taskNo": row["task_no"],
+            "binLocation": row["bin_location"],
+            "seq": row["seq"],
+            "status": row["status"],
+            "robotCode": row["robot_code"],
+            "routeNo": row["route_no"],
+            "updatedAt": row["updated_at"]
+        }
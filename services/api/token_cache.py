@@ -0,0 +1,138 @@
+"""
+authToken 校验缓存
+功能：
+1. 缓存 LMS /auth/token 的校验结果（LRU + TTL），同一 token 在有效期内无需再次访问 LMS
+2. 无效 token 也会缓存一段较短的时间（负缓存），避免重复请求 LMS
+3. 同一 token 并发校验时只请求一次 LMS
+4. 统计命中、未命中次数
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 校验函数：返回 (HTTP 状态码, 用户信息或错误信息)
+TokenValidator = Callable[[str], Awaitable[Tuple[int, Any]]]
+
+# 视为 token 无效、可以负缓存的状态码
+INVALID_STATUS_CODES = (401, 403)
+
+
+class TokenEntry:
+    """单个 token 的校验结果"""
+    __slots__ = ("valid", "status_code", "data", "expires_at")
+
+    def __init__(self, valid: bool, status_code: int, data: Any, expires_at: float):
+        self.valid = valid
+        self.status_code = status_code
+        self.data = data  # 有效时为用户信息，无效时为 LMS 返回的错误信息
+        self.expires_at = expires_at
+
+
+class TokenCache:
+    """authToken 校验缓存"""
+
+    def __init__(
+        self,
+        validator: TokenValidator,
+        max_size: int = 1000,
+        ttl: float = 300,
+        negative_ttl: float = 30
+    ):
+        """
+        :param validator: 向 LMS 校验 token 的协程
+        :param max_size: 最多缓存的 token 数，超出时淘汰最久未使用的
+        :param ttl: 有效 token 的缓存时间（秒）
+        :param negative_ttl: 无效 token 的缓存时间（秒）
+        """
+        self.validator = validator
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, TokenEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # 统计信息
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    async def validate(self, token: str) -> TokenEntry:
+        """
+        校验 token，优先使用缓存
+
+        :raises Exception: LMS 不可用或返回非认证类错误时抛出（不缓存）
+        """
+        entry = self._entries.get(token)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(token)
+                if entry.valid:
+                    self._hits += 1
+                else:
+                    self._negative_hits += 1
+                return entry
+            del self._entries[token]
+
+        self._misses += 1
+        inflight = self._inflight.get(token)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[token] = future
+        try:
+            status_code, data = await self.validator(token)
+            if status_code == 200:
+                entry = self.put(token, data)
+            elif status_code in INVALID_STATUS_CODES:
+                entry = self._store(token, TokenEntry(
+                    False, status_code, data, time.monotonic() + self.negative_ttl))
+            else:
+                raise RuntimeError(f"LMS校验token失败，状态码 {status_code}: {data}")
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(token, None)
+
+    def put(self, token: str, user_info: Any) -> TokenEntry:
+        """写入一个有效 token（如登录成功后）"""
+        return self._store(token, TokenEntry(True, 200, user_info, time.monotonic() + self.ttl))
+
+    def invalidate(self, token: str):
+        """移除 token（如退出登录或上游返回 401）"""
+        self._entries.pop(token, None)
+
+    def _store(self, token: str, entry: TokenEntry) -> TokenEntry:
+        self._entries[token] = entry
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存的统计信息"""
+        lookups = self._hits + self._negative_hits + self._misses
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "hits": self._hits,
+            "negativeHits": self._negative_hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hitRate": round((self._hits + self._negative_hits) / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,206 @@
+"""
+上游服务异步客户端
+功能：
+1. 为每个上游服务（LMS、RCS）维护独立的 keep-alive 连接池
+2. 限制每个上游服务的并发请求数，避免慢上游拖垮网关
+3. 支持按调用设置超时时间，等待并发名额的时间也计入超时
+4. 每次请求完成后回调耗时记录器（用于导出监控指标）
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 请求耗时记录器：参数为 (上游名称, HTTP 方法, 结果, 耗时秒)，结果为状态码或 timeout / error
+RequestObserver = Callable[[str, str, str, float], None]
+
+
+class UpstreamClient:
+    """单个上游服务的异步HTTP客户端（连接池 + 并发上限 + 超时）"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        max_concurrency: int = 10,
+        timeout: float = 30.0,
+        headers: Optional[Dict[str, str]] = None,
+        observer: Optional[RequestObserver] = None
+    ):
+        """
+        :param name: 上游名称（用于日志和统计）
+        :param base_url: 上游服务基础地址
+        :param max_connections: 连接池最大连接数
+        :param max_keepalive_connections: 连接池保持的空闲长连接数
+        :param max_concurrency: 同时在途的最大请求数
+        :param timeout: 默认超时时间（秒），可在单次调用中覆盖
+        :param headers: 每次请求默认携带的请求头
+        :param observer: 请求耗时记录器
+        """
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self._headers = headers or {}
+        self.observer = observer
+        self._client: Optional[httpx.AsyncClient] = None
+        # 并发名额与连接池的生命周期无关，关闭后重新创建连接池时在途请求仍受同一上限约束
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # 统计信息
+        self._in_flight = 0
+        self._total = 0
+        self._errors = 0
+        self._timeouts = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """获取底层 AsyncClient，未启动时自动创建"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self._limits,
+                timeout=self.timeout,
+                headers=self._headers
+            )
+            logger.info(
+                f"上游客户端已创建: {self.name} ({self.base_url}), 并发上限: {self.max_concurrency}")
+        return self._client
+
+    async def start(self):
+        """预先创建连接池"""
+        _ = self.client
+
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info(f"上游客户端已关闭: {self.name}")
+        self._client = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> httpx.Response:
+        """
+        发送请求到上游服务
+
+        :param method: HTTP 方法
+        :param path: 相对于 base_url 的路径（也可以是完整URL）
+        :param timeout: 本次调用的超时时间（秒），为 None 时使用默认值
+        :param kwargs: 透传给 httpx 的参数（headers、params、json、content 等）
+        :return: httpx.Response
+        :raises httpx.TimeoutException: 请求超时（等待并发名额超时时为 httpx.PoolTimeout）
+        :raises httpx.HTTPError: 连接失败等网络错误
+        """
+        client = self.client
+        call_timeout = self.timeout if timeout is None else timeout
+        start_time = time.perf_counter()
+
+        # 等待并发名额的时间计入本次调用的超时，上游变慢时排队的请求不会无限等待
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), call_timeout)
+        except asyncio.TimeoutError:
+            self._total += 1
+            self._timeouts += 1
+            self._errors += 1
+            if self.observer is not None:
+                self.observer(self.name, method, "timeout", time.perf_counter() - start_time)
+            logger.error(
+                f"上游请求排队超时: {self.name} {method} {path} "
+                f"(并发上限 {self.max_concurrency}, {call_timeout}秒)")
+            raise httpx.PoolTimeout(f"等待 {self.name} 并发名额超时") from None
+
+        remaining = None if call_timeout is None else max(call_timeout - (time.perf_counter() - start_time), 0.0)
+        self._in_flight += 1
+        self._total += 1
+        outcome = "error"
+        try:
+            response = await client.request(method, path, timeout=remaining, **kwargs)
+            outcome = str(response.status_code)
+            return response
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            self._timeouts += 1
+            self._errors += 1
+            logger.error(
+                f"上游请求超时: {self.name} {method} {path} ({call_timeout}秒)")
+            raise
+        except httpx.HTTPError as e:
+            self._errors += 1
+            logger.error(f"上游请求失败: {self.name} {method} {path}: {str(e)}")
+            raise
+        finally:
+            self._semaphore.release()
+            self._in_flight -= 1
+            elapsed = time.perf_counter() - start_time
+            if self.observer is not None:
+                self.observer(self.name, method, outcome, elapsed)
+            logger.debug(
+                f"上游请求完成: {self.name} {method} {path} 耗时 {elapsed * 1000:.1f}ms")
+
+    async def get(self, path: str, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        """发送 GET 请求"""
+        return await self.request("GET", path, timeout=timeout, **kwargs)
+
+    async def post(self, path: str, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        """发送 POST 请求"""
+        return await self.request("POST", path, timeout=timeout, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回该上游的统计信息"""
+        return {
+            "name": self.name,
+            "baseUrl": self.base_url,
+            "maxConcurrency": self.max_concurrency,
+            "inFlight": self._in_flight,
+            "total": self._total,
+            "errors": self._errors,
+            "timeouts": self._timeouts
+        }
+
+
+class UpstreamRegistry:
+    """管理所有上游客户端，统一启动和关闭"""
+
+    def __init__(self):
+        self._clients: Dict[str, UpstreamClient] = {}
+
+    def register(self, client: UpstreamClient) -> UpstreamClient:
+        """注册上游客户端"""
+        self._clients[client.name] = client
+        return client
+
+    def get(self, name: str) -> UpstreamClient:
+        """按名称获取上游客户端"""
+        if name not in self._clients:
+            raise KeyError(f"未注册的上游服务: {name}")
+        return self._clients[name]
+
+    async def start_all(self):
+        """启动所有上游客户端"""
+        for client in self._clients.values():
+            await client.start()
+
+    async def close_all(self):
+        """关闭所有上游客户端"""
+        for client in self._clients.values():
+            await client.close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回所有上游的统计信息"""
+        return {name: client.stats() for name, client in self._clients.items()}
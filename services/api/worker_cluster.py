@@ -0,0 +1,311 @@
+"""
+多进程网关协调（uvicorn --workers N）
+功能：
+1. 同一台机器上的网关工作进程通过共享状态目录互相发现，每个进程绑定一个 Unix 数据报套接字
+2. 按频道向其他工作进程广播消息（盘点进度、任务控制、新机器人回调的唤醒通知等），收到即分发，无需轮询；
+   数据报在对方接收缓冲区满时会被丢弃，不能丢失的数据（如机器人回调）需另行持久化，广播只作通知
+3. 通过文件锁选出一个主进程，只在主进程中执行恢复未完成任务、提交盘点结果等单例工作；
+   主进程退出后其余进程自动接替
+4. 每个进程在存活期间持有自己的存活锁，其他进程据此判断某个任务的执行者是否还在运行
+5. 提供跨进程命名锁（如每台机器人一把），等待期间不阻塞事件循环，持有进程退出时锁自动释放
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 数据报最大长度，超出的消息不广播（受内核 net.core.wmem_default 限制，约 200KB）
+MAX_MESSAGE_BYTES = 200 * 1024
+# 接收缓冲区大小（实际值受 net.core.rmem_max 限制），突发的回调和进度事件在此排队
+RECV_BUFFER_BYTES = 4 * 1024 * 1024
+# 新进程加入时发送的频道，其他进程收到后立即刷新进程列表
+HELLO_CHANNEL = "_hello"
+# 存活锁文件创建后到加锁前有短暂间隙，清理残留文件时跳过最近创建的文件
+STALE_MIN_AGE = 10.0
+# 跨进程命名锁被占用时重试加锁的间隔（秒）
+LOCK_POLL_INTERVAL = 0.2
+
+MessageHandler = Callable[[Dict[str, Any]], None]
+LeaderHandler = Callable[[], Awaitable[None]]
+
+
+class WorkerCluster:
+    """网关工作进程间的广播与主进程选举"""
+
+    def __init__(self, state_dir: str, peer_refresh: float = 1.0, leader_retry: float = 2.0):
+        """
+        :param state_dir: 共享状态目录（同一网关的所有工作进程必须相同）
+        :param peer_refresh: 进程列表的缓存时间（秒）
+        :param leader_retry: 非主进程尝试接替主进程的间隔（秒）
+        """
+        self.state_dir = Path(state_dir)
+        self.peer_refresh = peer_refresh
+        self.leader_retry = leader_retry
+        # 进程标识：pid + 随机后缀，pid 被复用时也不会与已退出的进程混淆
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._sock: Optional[socket.socket] = None
+        self._sock_path: Optional[Path] = None
+        self._alive_fd: Optional[int] = None
+        self._leader_fd: Optional[int] = None
+        self._leader_task: Optional[asyncio.Task] = None
+        self._handlers: Dict[str, List[MessageHandler]] = {}
+        self._leader_handlers: List[LeaderHandler] = []
+        self._peers: List[str] = []
+        self._peers_at = float("-inf")
+
+        # 统计信息
+        self._sent = 0
+        self._received = 0
+        self._dropped = 0
+
+    @property
+    def peers_dir(self) -> Path:
+        return self.state_dir / "peers"
+
+    @property
+    def alive_dir(self) -> Path:
+        return self.state_dir / "alive"
+
+    @property
+    def locks_dir(self) -> Path:
+        return self.state_dir / "locks"
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_fd is not None
+
+    # ------------------------------------------------------------------ 生命周期
+
+    async def start(self):
+        """加入集群：绑定广播套接字、持有存活锁，并尝试成为主进程"""
+        self.peers_dir.mkdir(parents=True, exist_ok=True)
+        self.alive_dir.mkdir(parents=True, exist_ok=True)
+
+        self._alive_fd = os.open(self.alive_dir / f"{self.worker_id}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        fcntl.flock(self._alive_fd, fcntl.LOCK_EX)
+
+        self._sock_path = self.peers_dir / f"{self.worker_id}.sock"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+        sock.bind(str(self._sock_path))
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+        self._cleanup_stale()
+        self.publish(HELLO_CHANNEL, {})
+        await self._try_become_leader()
+        if not self.is_leader:
+            self._leader_task = asyncio.create_task(self._leader_loop(), name="cluster-leader")
+        logger.info(f"网关工作进程已加入集群: {self.worker_id}, "
+                    f"{'主进程' if self.is_leader else '从进程'}, 其他进程 {len(self._refresh_peers())} 个")
+
+    async def stop(self):
+        """退出集群：释放主进程锁和存活锁，删除广播套接字"""
+        if self._leader_task is not None:
+            self._leader_task.cancel()
+            await asyncio.gather(self._leader_task, return_exceptions=True)
+            self._leader_task = None
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            self._unlink(self._sock_path)
+        for fd in (self._leader_fd, self._alive_fd):
+            if fd is not None:
+                os.close(fd)
+        self._leader_fd = None
+        self._alive_fd = None
+        self._unlink(self.alive_dir / f"{self.worker_id}.lock")
+
+    # ------------------------------------------------------------------ 主进程选举
+
+    def on_leader(self, handler: LeaderHandler):
+        """注册成为主进程时执行的回调（启动时或接替退出的主进程时）"""
+        self._leader_handlers.append(handler)
+
+    async def _try_become_leader(self):
+        fd = os.open(self.state_dir / "leader.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return
+        self._leader_fd = fd
+        os.ftruncate(fd, 0)
+        os.write(fd, self.worker_id.encode("utf-8"))
+        for handler in self._leader_handlers:
+            try:
+                await handler()
+            except Exception as e:
+                logger.error(f"主进程任务启动失败: {str(e)}")
+
+    async def _leader_loop(self):
+        """从进程定期尝试获取主进程锁（主进程退出时锁随之释放）"""
+        while not self.is_leader:
+            await asyncio.sleep(self.leader_retry)
+            await self._try_become_leader()
+            if self.is_leader:
+                logger.info(f"主进程已退出，由当前进程接替: {self.worker_id}")
+
+    def is_alive(self, worker_id: Optional[str]) -> bool:
+        """判断指定工作进程是否仍在运行（其存活锁是否仍被持有）"""
+        if not worker_id:
+            return False
+        if worker_id == self.worker_id:
+            return True
+        path = self.alive_dir / f"{worker_id}.lock"
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    # ------------------------------------------------------------------ 跨进程锁
+
+    @asynccontextmanager
+    async def lock(self, name: str) -> AsyncIterator[None]:
+        """
+        跨进程命名锁：同一名称同一时间只有一个持有者（包括同一进程内的其他协程）
+
+        被占用时每隔 LOCK_POLL_INTERVAL 秒重试，等待期间不阻塞事件循环；持有进程异常退出时锁随之释放。
+
+        :param name: 锁名称（用作文件名）
+        """
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.locks_dir / f"{name}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            waiting = False
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if not waiting:
+                        waiting = True
+                        logger.info(f"跨进程锁 {name} 被其他进程持有，等待释放")
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    # ------------------------------------------------------------------ 广播
+
+    def subscribe(self, channel: str, handler: MessageHandler):
+        """订阅频道，handler 在事件循环中同步调用，参数为消息内容"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, payload: Dict[str, Any]) -> int:
+        """
+        向其他工作进程广播消息（不发给自己，非阻塞）
+
+        :return: 成功发送的进程数
+        """
+        if self._sock is None:
+            return 0
+        data = json.dumps({"c": channel, "p": payload}, ensure_ascii=False, default=str).encode("utf-8")
+        if len(data) > MAX_MESSAGE_BYTES:
+            logger.warning(f"广播消息过大，未发送: {channel} ({len(data)} 字节)")
+            self._dropped += 1
+            return 0
+
+        sent = 0
+        for peer in self._refresh_peers():
+            try:
+                self._sock.sendto(data, peer)
+                sent += 1
+            except (FileNotFoundError, ConnectionRefusedError):
+                # 进程已退出，套接字文件残留
+                self._unlink(Path(peer))
+                self._peers_at = float("-inf")
+            except BlockingIOError:
+                # 对方接收缓冲区已满
+                self._dropped += 1
+            except OSError as e:
+                self._dropped += 1
+                logger.warning(f"广播消息失败: {peer}, {str(e)}")
+        self._sent += sent
+        return sent
+
+    def _on_readable(self):
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(MAX_MESSAGE_BYTES)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._received += 1
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            channel = message.get("c")
+            if channel == HELLO_CHANNEL:
+                self._peers_at = float("-inf")
+                continue
+            for handler in self._handlers.get(channel, ()):
+                try:
+                    handler(message.get("p") or {})
+                except Exception as e:
+                    logger.error(f"处理广播消息失败: {channel}, {str(e)}")
+
+    def _refresh_peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at >= self.peer_refresh:
+            own = str(self._sock_path)
+            self._peers = [str(path) for path in self.peers_dir.glob("*.sock") if str(path) != own]
+            self._peers_at = now
+        return self._peers
+
+    def _cleanup_stale(self):
+        """删除已退出进程残留的存活锁文件"""
+        now = time.time()
+        for path in self.alive_dir.glob("*.lock"):
+            if path.stem == self.worker_id:
+                continue
+            try:
+                if now - path.stat().st_mtime < STALE_MIN_AGE:
+                    continue
+            except FileNotFoundError:
+                continue
+            if not self.is_alive(path.stem):
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: Optional[Path]):
+        if path is None:
+            return
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """返回集群的统计信息"""
+        return {
+            "workerId": self.worker_id,
+            "leader": self.is_leader,
+            "peers": len(self._refresh_peers()),
+            "sent": self._sent,
+            "received": self._received,
+            "dropped": self._dropped
+        }
@@ -0,0 +1,8 @@
+"""本地推理服务：多进程模型副本 + 动态合批，计数、条码裁剪和离线重算共用"""
+
+from services.inference.client import InferenceClient, get_inference_client
+
+__all__ = [
+    "InferenceClient",
+    "get_inference_client",
+]
@@ -0,0 +1,355 @@
+"""
+推理请求动态批处理
+功能：
+1. 推理请求进入等待队列，按"最大批大小 / 最长等待时间"合并为一批，一次前向推理处理整批图片
+2. 每个工作进程持有一份模型副本，每个进程同时只处理一批；所有进程忙时请求继续排队，
+   空出进程后取走队列中已有的请求（最多 max_batch 张），负载越高批越大
+3. 同一批中置信度阈值不同的请求按最低阈值推理，返回前按各自阈值过滤
+4. 统计队列深度、批大小分布、排队/推理耗时和请求延迟 p50/p99
+"""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACTORY = "core.vision.model_backend:load_model"
+LATENCY_WINDOW = 10000  # 计算延迟分位数时保留的最近请求数
+RESTART_MIN_INTERVAL = 10.0  # 两次重建进程池的最短间隔（秒），避免模型加载失败时反复重建
+
+
+class QueueFullError(Exception):
+    """等待队列已满"""
+
+
+# 工作进程内的模型副本（每个进程一个）
+_worker_model = None
+_worker_names: Dict[int, str] = {}
+
+
+def _init_worker(factory: str, weights_path: str, backend: Optional[str], warmup: bool):
+    """工作进程初始化：加载模型副本并预热"""
+    global _worker_model, _worker_names
+    module_name, _, attr = factory.partition(":")
+    loaded = getattr(importlib.import_module(module_name), attr)(weights_path, backend)
+    # load_model 返回 (模型, 后端)
+    _worker_model = loaded[0] if isinstance(loaded, tuple) else loaded
+    names = getattr(_worker_model, "names", None) or {}
+    _worker_names = names if isinstance(names, dict) else dict(enumerate(names))
+
+    if warmup:
+        try:
+            import numpy as np
+            _worker_model.predict(source=[np.zeros((640, 640, 3), dtype=np.uint8)], save=False, verbose=False)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"推理进程预热失败: {str(e)}")
+
+
+def _ping() -> int:
+    time.sleep(0.1)  # 占住当前进程，让其余预热请求分配到其他进程
+    return os.getpid()
+
+
+def _predict_batch(images: List[Any], conf: float) -> Dict[str, Any]:
+    """在工作进程中对一批图片执行一次推理，返回每张图片的检测框列表"""
+    from core.vision.detections import results_to_detections
+    from services.vision.image_input import load_image
+
+    start = time.perf_counter()
+    arrays = []
+    errors: Dict[int, str] = {}
+    for index, image in enumerate(images):
+        try:
+            arrays.append(load_image(image))
+        except Exception as e:
+            errors[index] = str(e)
+    decoded = time.perf_counter()
+
+    results = iter(_worker_model.predict(
+        source=arrays, save=False, conf=conf, batch=len(arrays), verbose=False
+    ) if arrays else [])
+    detections: List[Any] = []
+    for index in range(len(images)):
+        if index in errors:
+            detections.append(errors[index])
+            continue
+        detections.append(results_to_detections([next(results)], _worker_names))
+    return {
+        "detections": detections,
+        "decodeSeconds": decoded - start,
+        "inferSeconds": time.perf_counter() - decoded,
+        "workerPid": os.getpid()
+    }
+
+
+class _Request:
+    __slots__ = ("image", "conf", "future", "enqueued")
+
+    def __init__(self, image: Any, conf: float, future: asyncio.Future):
+        self.image = image
+        self.conf = conf
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class DynamicBatcher:
+    """动态批处理推理调度器"""
+
+    def __init__(
+        self,
+        weights_path: str,
+        backend: Optional[str] = None,
+        workers: int = 2,
+        max_batch: int = 8,
+        max_wait: float = 0.01,
+        max_queue: int = 1000,
+        timeout: float = 30.0,
+        factory: str = DEFAULT_FACTORY,
+        warmup: bool = True
+    ):
+        """
+        :param weights_path: 模型权重路径
+        :param backend: 推理后端（见 core.vision.model_backend），默认读取环境变量 YOLO_BACKEND
+        :param workers: 工作进程数（模型副本数）
+        :param max_batch: 单批最大图片数
+        :param max_wait: 凑批的最长等待时间（秒），从批中第一个请求入队开始计算
+        :param max_queue: 等待队列上限，超出时拒绝请求
+        :param timeout: 单批推理超时时间（秒）
+        :param factory: 模型加载函数（"模块:函数"，参数为权重路径和后端）
+        """
+        self.weights_path = weights_path
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.factory = factory
+        self.warmup = warmup
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Deque[_Request] = deque()
+        self._arrived: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._batch_tasks = set()
+
+        # 统计信息
+        self._batch_sizes: Counter = Counter()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._waits: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._infers: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._requests = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._restarts = 0
+        self._last_restart = 0.0
+        self._started_at = time.time()
+
+    # ------------------------------------------------------------------ 生命周期
+
+    async def start(self):
+        """创建工作进程并等待模型加载完成"""
+        self._arrived = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._create_executor()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        # 每个进程执行一次 _ping，确保所有副本都已完成加载
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+        self._loop_task = asyncio.create_task(self._batch_loop(), name="inference-batcher")
+        logger.info(f"推理服务已启动: {self.workers} 个工作进程, 批大小上限 {self.max_batch}, "
+                    f"凑批等待 {self.max_wait * 1000:.0f}ms, 加载耗时 {time.perf_counter() - start:.1f}秒")
+
+    def _create_executor(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.factory, self.weights_path, self.backend, self.warmup)
+        )
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        for request in self._pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("推理服务已停止"))
+        self._pending.clear()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+            self._executor = None
+        logger.info("推理服务已停止")
+
+    # ------------------------------------------------------------------ 请求
+
+    async def submit(self, image: Any, conf: float = 0.25) -> Dict[str, Any]:
+        """
+        提交一张图片，等待所在批次推理完成
+
+        :param image: 图片路径、编码后的图片字节或共享内存图片（SharedImage）
+        :param conf: 置信度阈值
+        :return: {"detections": [...], "batchSize", "waitMs", "inferMs", "latencyMs", "workerPid"}
+        :raises QueueFullError: 等待队列已满
+        :raises ValueError: 图片无法读取
+        """
+        if self._executor is None:
+            raise RuntimeError("推理服务未启动")
+        if len(self._pending) >= self.max_queue:
+            self._rejected += 1
+            raise QueueFullError(f"推理队列已满（{self.max_queue}）")
+        self._requests += 1
+        request = _Request(image, conf, asyncio.get_running_loop().create_future())
+        self._pending.append(request)
+        self._arrived.set()
+        return await request.future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+
+            # 等待空闲的工作进程，期间新请求继续进入队列
+            await self._slots.acquire()
+            deadline = self._pending[0].enqueued + self.max_wait if self._pending else 0
+            while self._pending and len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                request = self._pending.popleft()
+                if not request.future.done():  # 跳过已取消的请求（客户端断开）
+                    batch.append(request)
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[_Request]):
+        loop = asyncio.get_running_loop()
+        dispatched = time.perf_counter()
+        executor = self._executor
+        try:
+            future = loop.run_in_executor(
+                executor, _predict_batch, [r.image for r in batch], min(r.conf for r in batch))
+            output = await asyncio.wait_for(future, timeout=self.timeout)
+        except (BrokenProcessPool, asyncio.TimeoutError) as e:
+            reason = "推理超时" if isinstance(e, asyncio.TimeoutError) else f"工作进程异常退出: {str(e)}"
+            self._fail(batch, RuntimeError(reason))
+            await self._restart(reason, executor)
+            return
+        except Exception as e:
+            logger.error(f"批量推理失败: {str(e)}")
+            self._fail(batch, e)
+            return
+        finally:
+            self._slots.release()
+
+        done = time.perf_counter()
+        self._batch_sizes[len(batch)] += 1
+        infer_ms = output["inferSeconds"] * 1000
+        for request, detections in zip(batch, output["detections"]):
+            if request.future.done():
+                continue
+            if isinstance(detections, str):
+                self._failed += 1
+                request.future.set_exception(ValueError(detections))
+                continue
+            latency = (done - request.enqueued) * 1000
+            wait = (dispatched - request.enqueued) * 1000
+            self._completed += 1
+            self._latencies.append(latency)
+            self._waits.append(wait)
+            self._infers.append(infer_ms)
+            request.future.set_result({
+                "detections": [d for d in detections if d["conf"] >= request.conf],
+                "batchSize": len(batch),
+                "waitMs": round(wait, 2),
+                "inferMs": round(infer_ms, 2),
+                "latencyMs": round(latency, 2),
+                "workerPid": output["workerPid"]
+            })
+
+    def _fail(self, batch: List[_Request], error: Exception):
+        for request in batch:
+            if not request.future.done():
+                self._failed += 1
+                request.future.set_exception(error)
+
+    async def _restart(self, reason: str, failed: Optional[ProcessPoolExecutor]):
+        """
+        工作进程异常或卡死时重建进程池
+
+        :param failed: 出错批次使用的进程池；已被其他批次重建过（不是当前进程池）时不再重建
+        """
+        if failed is not self._executor:
+            return
+        now = time.monotonic()
+        if now - self._last_restart < RESTART_MIN_INTERVAL:
+            return
+        self._last_restart = now
+        logger.error(f"重建推理进程池: {reason}")
+        self._restarts += 1
+        old = self._executor
+        self._create_executor()
+        if old is not None:
+            for process in list((old._processes or {}).values()):
+                process.terminate()
+            await asyncio.to_thread(old.shutdown, False, cancel_futures=True)
+
+    # ------------------------------------------------------------------ 统计
+
+    @staticmethod
+    def _percentile(values, pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 2)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列深度、批大小分布和延迟分位数"""
+        batches = sum(self._batch_sizes.values())
+        images = sum(size * count for size, count in self._batch_sizes.items())
+        return {
+            "workers": self.workers,
+            "maxBatch": self.max_batch,
+            "maxWaitMs": self.max_wait * 1000,
+            "queueDepth": len(self._pending),
+            "busyWorkers": self.workers - self._slots._value if self._slots else 0,
+            "requests": self._requests,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "failed": self._failed,
+            "restarts": self._restarts,
+            "batches": batches,
+            "avgBatchSize": round(images / batches, 2) if batches else 0.0,
+            "batchSizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "latencyMs": {"p50": self._percentile(self._latencies, 50), "p99": self._percentile(self._latencies, 99)},
+            "waitMs": {"p50": self._percentile(self._waits, 50), "p99": self._percentile(self._waits, 99)},
+            "inferMs": {"p50": self._percentile(self._infers, 50), "p99": self._percentile(self._infers, 99)},
+            "uptimeSeconds": round(time.time() - self._started_at, 1)
+        }
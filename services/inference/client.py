@@ -0,0 +1,104 @@
+"""
+本地推理服务客户端
+功能：
+1. 同步调用推理服务 POST /predict，返回检测框列表（字段同 extract_yolo_detections，另含类别编号 cls_id）
+2. 文件路径只传路径、共享内存图片只传名称和形状，由推理服务直接读取；
+   BGR 数组临时写入共享内存，请求完成后释放，不做有损编码
+3. 每个客户端维护一个 keep-alive 连接池，可在多个线程中共用
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from services.vision.image_input import ImageInput, SharedImage
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceClient:
+    """推理服务同步客户端"""
+
+    def __init__(self, base_url: str, timeout: float = 30.0, max_connections: int = 32):
+        """
+        :param base_url: 推理服务地址（如 http://127.0.0.1:8200）
+        :param timeout: 单次请求超时（秒），包含排队时间
+        :param max_connections: 连接池最大连接数（并发请求数）
+        """
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.Client(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def detect(self, image: ImageInput, conf: float = 0.25) -> List[Dict[str, Any]]:
+        """
+        检测单张图片
+
+        :param image: 图片路径、编码后的图片字节、BGR 数组或共享内存图片
+        :param conf: 置信度阈值
+        :return: 检测框列表 [{"cls", "cls_id", "conf", "x1", "y1", "x2", "y2"}, ...]
+        :raises RuntimeError: 推理服务返回错误
+        """
+        return self.predict(image, conf)["detections"]
+
+    def predict(self, image: ImageInput, conf: float = 0.25) -> Dict[str, Any]:
+        """检测单张图片，返回检测框和合批信息（batchSize、waitMs、inferMs、latencyMs）"""
+        shm = None
+        try:
+            if isinstance(image, np.ndarray):
+                image, shm = SharedImage.create(image)
+            if isinstance(image, SharedImage):
+                payload = {"shm": {"name": image.name, "shape": list(image.shape), "dtype": image.dtype}, "conf": conf}
+                response = self._client.post("/predict", json=payload)
+            elif isinstance(image, (str, Path)):
+                response = self._client.post("/predict", json={"path": os.path.abspath(image), "conf": conf})
+            else:
+                response = self._client.post(
+                    "/predict", params={"conf": conf}, content=bytes(image),
+                    headers={"Content-Type": "application/octet-stream"}
+                )
+        finally:
+            if shm is not None:
+                SharedImage.release(shm)
+
+        if response.status_code != 200:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise RuntimeError(f"推理服务返回 {response.status_code}: {detail}")
+        return response.json()["data"]
+
+    def stats(self) -> Dict[str, Any]:
+        """推理服务统计信息（队列深度、批大小分布、延迟分位数）"""
+        response = self._client.get("/stats")
+        response.raise_for_status()
+        return response.json()["data"]
+
+    def close(self):
+        self._client.close()
+
+
+_clients: Dict[str, InferenceClient] = {}
+
+
+def get_inference_client(base_url: Optional[str] = None) -> Optional[InferenceClient]:
+    """
+    获取推理服务客户端（同一地址共用一个实例）
+
+    :param base_url: 推理服务地址，默认读取环境变量 INFERENCE_SERVER_URL
+    :return: 未配置推理服务时返回 None（调用方在本进程加载模型）
+    """
+    base_url = base_url or os.environ.get("INFERENCE_SERVER_URL")
+    if not base_url:
+        return None
+    if base_url not in _clients:
+        logger.info(f"使用推理服务: {base_url}")
+        _clients[base_url] = InferenceClient(base_url)
+    return _clients[base_url]
@@ -0,0 +1,141 @@
+"""
+本地 YOLO 推理服务
+功能：
+1. 计数（BoxCountService）、条码裁剪（YoloDetection）和离线重算共用的推理服务，
+   多个工作进程各持有一份模型副本，调用方不再各自加载模型
+2. 推理请求动态合批：凑满 max_batch 张或第一个请求等待超过 max_wait 即送入推理，
+   工作进程忙时请求继续排队，空出后整批取走
+3. 图片可以上传编码后的字节，也可以只传本机文件路径或共享内存图片（SharedImage）
+4. GET /stats 返回队列深度、批大小分布、排队/推理耗时和请求延迟 p50/p99
+
+接口：
+    POST /predict?conf=0.65         请求体为编码后的图片（image/jpeg、image/png、application/octet-stream）
+    POST /predict                   {"path": "/abs/image.jpg", "conf": 0.65}
+                                    {"shm": {"name": "...", "shape": [h, w, 3], "dtype": "uint8"}, "conf": 0.65}
+    GET  /stats
+    GET  /health
+
+使用方法：
+    python -m services.inference.inference_server --workers 2 --max-batch 8 --max-wait-ms 10
+    # 调用方通过环境变量 INFERENCE_SERVER_URL=http://127.0.0.1:8200 启用
+"""
+
+import argparse
+import logging
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+
+from services.inference.batcher import DEFAULT_FACTORY, DynamicBatcher, QueueFullError
+from services.vision.image_input import SharedImage
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_PORT = 8200
+
+# 推理服务配置（命令行参数优先，其次环境变量）
+config = {
+    "weights_path": os.environ.get("INFERENCE_MODEL", str(PROJECT_ROOT / "shared" / "models" / "yolo" / "best.pt")),
+    "backend": os.environ.get("YOLO_BACKEND") or None,
+    "workers": int(os.environ.get("INFERENCE_WORKERS", 2)),  # 工作进程数（模型副本数）
+    "max_batch": int(os.environ.get("INFERENCE_MAX_BATCH", 8)),  # 单批最大图片数
+    "max_wait": float(os.environ.get("INFERENCE_MAX_WAIT_MS", 10)) / 1000,  # 凑批最长等待时间
+    "max_queue": int(os.environ.get("INFERENCE_MAX_QUEUE", 1000)),  # 等待队列上限，超出返回 503
+    "timeout": float(os.environ.get("INFERENCE_TIMEOUT", 30)),  # 单批推理超时（秒）
+    "factory": os.environ.get("INFERENCE_MODEL_FACTORY", DEFAULT_FACTORY),
+}
+
+batcher: Optional[DynamicBatcher] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """推理服务生命周期：启动时创建工作进程并加载模型，退出时关闭"""
+    global batcher
+    batcher = DynamicBatcher(**config)
+    await batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(title="Inference Server", version="1.0.0", lifespan=lifespan)
+
+
+@app.post("/predict")
+async def predict(request: Request, conf: Optional[float] = None):
+    """
+    检测单张图片（与同时到达的其他请求合批推理）
+
+    :return: {"code": 200, "data": {"detections": [{"cls", "cls_id", "conf", "x1", "y1", "x2", "y2"}, ...],
+              "batchSize", "waitMs", "inferMs", "latencyMs", "workerPid"}}
+    """
+    content_type = request.headers.get("Content-Type", "")
+    if content_type.startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="请求体不是有效的JSON")
+        conf = body.get("conf", conf)
+        if body.get("path"):
+            image = str(body["path"])
+        elif body.get("shm"):
+            shm = body["shm"]
+            image = SharedImage(name=shm["name"], shape=tuple(shm["shape"]), dtype=shm.get("dtype", "uint8"))
+        else:
+            raise HTTPException(status_code=400, detail="缺少图片：需要 path 或 shm")
+    else:
+        image = await request.body()
+        if not image:
+            raise HTTPException(status_code=400, detail="请求体为空")
+
+    try:
+        data = await batcher.submit(image, 0.25 if conf is None else float(conf))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (ValueError, FileNotFoundError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"图片无法读取: {str(e)}")
+    except Exception as e:
+        logger.error(f"推理失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"推理失败: {str(e)}")
+    return {"code": 200, "data": data}
+
+
+@app.get("/stats")
+async def stats():
+    """队列深度、批大小分布和延迟分位数"""
+    return {"code": 200, "data": batcher.stats()}
+
+
+@app.get("/health")
+async def health():
+    return {"code": 200, "data": {"status": "ok", "workers": batcher.workers}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 YOLO 推理服务（动态合批）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("INFERENCE_PORT", DEFAULT_PORT)))
+    parser.add_argument("--model", default=config["weights_path"], help="模型权重路径")
+    parser.add_argument("--backend", default=config["backend"], help="推理后端（pytorch / onnx / openvino ...）")
+    parser.add_argument("--workers", type=int, default=config["workers"], help="工作进程数（模型副本数）")
+    parser.add_argument("--max-batch", type=int, default=config["max_batch"], help="单批最大图片数")
+    parser.add_argument("--max-wait-ms", type=float, default=config["max_wait"] * 1000, help="凑批最长等待时间（毫秒）")
+    parser.add_argument("--max-queue", type=int, default=config["max_queue"], help="等待队列上限")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    config.update(
+        weights_path=args.model,
+        backend=args.backend,
+        workers=args.workers,
+        max_batch=args.max_batch,
+        max_wait=args.max_wait_ms / 1000,
+        max_queue=args.max_queue
+    )
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
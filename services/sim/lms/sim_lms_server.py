@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Request, HTTPException, status
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
+import asyncio
 import json
 import zlib
 import base64
@@ -14,13 +15,18 @@ from datetime import datetime
 from typing import List, Dict, Any
 from fastapi.middleware.cors import CORSMiddleware
 
-import custom_utils
+# 与网关共用 services/utils 中的压缩编码模块
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from services.utils import compression  # noqa: E402
 
 # LMS模拟服务配置
 USER_CODE = "admin"
 PASSWORD = "admin"
 AUTH_TOKEN = "d7e8d8fe17fbfcdb6e41efbfbd6d6befbfbd7aefbfbd53634fefbfbd1a7e050c16e3b"
 
+# 模拟响应延迟（秒），用于测试网关在LMS变慢时的表现，可通过 /sim/delay 动态调整
+SIM_DELAY = float(os.environ.get("LMS_SIM_DELAY", "0"))
+
 app = FastAPI(title="LMS Mock Service", version="1.0.0")
 # 定义允许的源列表
 origins = [
@@ -37,6 +43,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def simulate_delay(request: Request, call_next):
+    """按 SIM_DELAY 人为延迟所有业务接口的响应"""
+    if SIM_DELAY > 0 and not request.url.path.startswith("/sim/"):
+        await asyncio.sleep(SIM_DELAY)
+    return await call_next(request)
+
+
+@app.post("/sim/delay")
+async def set_sim_delay(seconds: float):
+    """设置模拟响应延迟（秒）"""
+    global SIM_DELAY
+    SIM_DELAY = max(0.0, seconds)
+    return {"delay": SIM_DELAY}
+
+
 # 定义Excel文件路径 - 使用基于脚本位置的绝对路径
 SCRIPT_DIR = Path(__file__).parent.absolute()
 EXCEL_FILE_PATH = SCRIPT_DIR / "bins_data.xlsx"
@@ -247,8 +270,8 @@ async def get_lms_bin(request: Request):
         )
 
     # 返回储位信息（从已加载的数据中获取）
-    encoded_data = custom_utils.compress_and_encode(bins_data)
-    return Response(content=encoded_data, media_type="text/plain")
+    # 储位数据量大，流式压缩编码，不在内存中生成完整的响应体
+    return StreamingResponse(compression.iter_encode(bins_data), media_type="text/plain")
 
 
 @app.get("/third/api/v1/lmsToRcsService/getCountTasks")
@@ -263,7 +286,7 @@ async def get_count_tasks(request: Request):
         )
 
     # 返回盘点任务
-    encoded_data = custom_utils.compress_and_encode(tasks_data)
+    encoded_data = compression.compress_and_encode(tasks_data)
     return Response(content=encoded_data, media_type="text/plain")
 
 
@@ -287,8 +310,7 @@ async def set_task_results(request: Request):
     try:
         # 解码并解析请求体
         encoded_data = await request.body()
-        encoded_data_str = encoded_data.decode('utf-8')
-        task_data = custom_utils.decompress_and_decode(encoded_data_str)
+        task_data = compression.decompress_and_decode(encoded_data)
         return "update countQty success"
 
     except Exception as e:
@@ -71,13 +71,15 @@ class RobotTaskSimulator:
     callback_url = "http://localhost:8000/api/robot/reporter/task"
 
     @classmethod
-    async def simulate_task_execution(cls, robot_task_code: str, target_route: List[dict], task_type: str):
+    async def simulate_task_execution(cls, robot_task_code: str, target_route: List[dict], task_type: str,
+                                      robot_code: str = "ROBOT001"):
         """
         模拟机器人任务执行
         """
         if robot_task_code not in cls.task_groups:
             cls.task_groups[robot_task_code] = {
                 "robot_task_code": robot_task_code,
+                "robot_code": robot_code,
                 "target_route": target_route,
                 "task_type": task_type,
                 "current_index": 0,
@@ -217,9 +219,10 @@ class RobotTaskSimulator:
             "data": data
         }
 
+        task_group = cls.task_groups.get(robot_task_code, {})
         callback_payload = {
             "robotTaskCode": robot_task_code,
-            "singleRobotCode": "ROBOT001",  # 模拟机器人编号
+            "singleRobotCode": task_group.get("robot_code", "ROBOT001"),  # 模拟机器人编号
             "extra": json.dumps([extra_data])
         }
 
@@ -278,6 +281,7 @@ async def submit_inventory_task(request: Request):
         # 提取任务信息 - 单个任务对象
         task_type = request_data.get("taskType", "")
         target_route = request_data.get("targetRoute", [])
+        robot_code = request_data.get("robotCode") or "ROBOT001"
 
         if not target_route:
             raise HTTPException(status_code=400, detail="targetRoute不能为空")
@@ -285,16 +289,16 @@ async def submit_inventory_task(request: Request):
         # 模拟处理延时
         logger.info(
             f"处理盘点任务: taskType={task_type}, 包含 {len(target_route)} 个储位")
-        # 生成唯一的机器人任务代码
+        # 优先使用调用方指定的机器人任务代码，否则生成唯一代码
         timestamp = int(time.time())
-        robot_task_code = f"ROBOT-TASK-{timestamp}"
+        robot_task_code = request_data.get("robotTaskCode") or f"ROBOT-TASK-{timestamp}"
 
         logger.info(f"生成机器人任务代码: {robot_task_code}")
 
         # 异步启动任务模拟
         asyncio.create_task(
             RobotTaskSimulator.simulate_task_execution(
-                robot_task_code, target_route, task_type)
+                robot_task_code, target_route, task_type, robot_code)
         )
 
         # 返回响应
@@ -302,7 +306,7 @@ async def submit_inventory_task(request: Request):
             "code": "SUCCESS",
             "message": "成功",
             "data": {
-                "robotTaskCode": "ctu001",
+                "robotTaskCode": robot_task_code,
                 "extra": None
             }
         }
@@ -327,7 +331,7 @@ async def continue_inventory_task(request: Request):
             "code": "SUCCESS",
             "message": "成功",
             "data": {
-                "robotTaskCode": "ctu001",
+                "robotTaskCode": request_data.get("triggerCode", "ctu001"),
                 "nextSeq": 1,
                 "extra": None
             }
@@ -338,6 +342,29 @@ async def continue_inventory_task(request: Request):
         raise HTTPException(status_code=500, detail=f"继续盘点任务失败: {str(e)}")
 
 
+@app.post(service_prefix + "/api/robot/controller/task/cancel")
+async def cancel_inventory_task(request: Request):
+    """取消机器人任务"""
+    request_data = await request.json()
+    robot_task_code = request_data.get("robotTaskCode", "")
+    logger.info(f"收到任务取消请求: {robot_task_code}")
+
+    task_group = RobotTaskSimulator.task_groups.get(robot_task_code)
+    if task_group is not None:
+        task_group["status"] = "cancelled"
+    RobotTaskSimulator.active_tasks.pop(robot_task_code, None)
+    RobotTaskSimulator.paused_tasks.pop(robot_task_code, None)
+
+    return {
+        "code": "SUCCESS",
+        "message": "成功",
+        "data": {
+            "robotTaskCode": robot_task_code,
+            "extra": None
+        }
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=4001)
@@ -1,28 +1,202 @@
-'''
-Author: big box big box@qq.com
-Date: 2025-10-21 20:38:50
-LastEditors: big box big box@qq.com
-LastEditTime: 2025-10-21 20:39:14
-FilePath: /app/utils.py
-Description: 
-
-Copyright (c) 2025 by lizh, All Rights Reserved. 
-'''
+"""
+LMS 数据压缩编码（JSON → zlib → base64）
+功能：
+1. compress_and_encode / decompress_and_decode：与 LMS 约定的编码格式，网关和 LMS 模拟服务共用
+2. 流式编码：顶层数组逐项序列化后分块压缩、分块 base64 编码，不生成完整的 JSON 字符串和压缩缓冲区
+3. 流式解码：分块 base64 解码 + zlib.decompressobj 增量解压，顶层数组按批解析输出元素，
+   不生成完整的解压文本，峰值内存约为编码数据本身加上解析出的对象
+4. 安装了 orjson 时用于序列化和解析（更快），否则使用标准库 json
+"""
+
+import base64
 import json
 import zlib
-import base64
-from typing import List, Dict, Any
+from typing import Any, Iterable, Iterator, List, Union
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+# 流式处理的分块大小（字节）
+CHUNK_SIZE = 256 * 1024
+
+# base64 中可能出现的空白字符（分块解码前去除，保证按 4 字节对齐）
+_B64_WHITESPACE = b" \t\r\n"
+# 每个数据块中查找顶层元素分界的最大尝试次数
+_MAX_CUT_ATTEMPTS = 4
+
+EncodedInput = Union[str, bytes, Iterable[Union[str, bytes]]]
+
+
+def _dumps(value: Any) -> bytes:
+    """序列化单个值为 UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # orjson 不支持的类型（如非字符串键）回退到标准库
+            pass
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _iter_json(data: Any, chunk_size: int) -> Iterator[bytes]:
+    """分块输出 JSON 文本，顶层为数组时逐项序列化"""
+    if not isinstance(data, (list, tuple)):
+        yield _dumps(data)
+        return
+
+    parts: List[bytes] = [b"["]
+    size = 1
+    for index, item in enumerate(data):
+        if index:
+            parts.append(b",")
+        encoded = _dumps(item)
+        parts.append(encoded)
+        size += len(encoded) + 1
+        if size >= chunk_size:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    parts.append(b"]")
+    yield b"".join(parts)
+
+
+def iter_encode(data: Any, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    流式压缩编码，按块输出 base64 文本（ASCII 字节），可直接作为 HTTP 流式响应体
+
+    所有块拼接后与 compress_and_encode 的结果等价（可被 decompress_and_decode 解码）。
+    """
+    compressor = zlib.compressobj()
+    pending = b""  # 不足 3 字节倍数、尚未 base64 编码的压缩数据
+
+    def encode_aligned(compressed: bytes) -> bytes:
+        nonlocal pending
+        buffer = pending + compressed if pending else compressed
+        aligned = len(buffer) - len(buffer) % 3
+        pending = buffer[aligned:]
+        return base64.b64encode(buffer[:aligned]) if aligned else b""
+
+    for text in _iter_json(data, chunk_size):
+        encoded = encode_aligned(compressor.compress(text))
+        if encoded:
+            yield encoded
+    tail = encode_aligned(compressor.flush())
+    tail += base64.b64encode(pending)
+    if tail:
+        yield tail
 
 
 def compress_and_encode(data: Any) -> str:
     """将JSON数据压缩并base64编码"""
-    json_str = json.dumps(data, ensure_ascii=False)
-    compressed = zlib.compress(json_str.encode('utf-8'))
-    return base64.b64encode(compressed).decode('utf-8')
+    return b"".join(iter_encode(data)).decode("ascii")
+
+
+def _iter_chunks(encoded: EncodedInput, chunk_size: int) -> Iterator[bytes]:
+    """把字符串、字节串或块迭代器统一为字节块"""
+    if isinstance(encoded, (str, bytes, bytearray, memoryview)):
+        for start in range(0, len(encoded), chunk_size):
+            chunk = encoded[start:start + chunk_size]
+            yield chunk.encode("ascii") if isinstance(chunk, str) else bytes(chunk)
+        return
+    for chunk in encoded:
+        yield chunk.encode("ascii") if isinstance(chunk, str) else bytes(chunk)
+
+
+def iter_decompress(encoded: EncodedInput, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """流式 base64 解码 + zlib 解压，按块输出 JSON 文本（UTF-8 字节）"""
+    decompressor = zlib.decompressobj()
+    pending = b""  # 不足 4 字节倍数、尚未解码的 base64 数据
+    for chunk in _iter_chunks(encoded, chunk_size):
+        buffer = pending + chunk.translate(None, _B64_WHITESPACE)
+        aligned = len(buffer) - len(buffer) % 4
+        pending = buffer[aligned:]
+        if aligned:
+            text = decompressor.decompress(base64.b64decode(buffer[:aligned]))
+            if text:
+                yield text
+    if pending:
+        # 末尾缺少填充字符时补齐
+        text = decompressor.decompress(base64.b64decode(pending + b"=" * (-len(pending) % 4)))
+        if text:
+            yield text
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+    if not decompressor.eof:
+        raise zlib.error("压缩数据不完整")
+
+
+def iter_items(encoded: EncodedInput, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """
+    流式解码，顶层为 JSON 数组时逐项输出数组元素；顶层不是数组时输出整个值（只输出一次）
+
+    :raises ValueError: JSON 格式错误
+    :raises zlib.error / binascii.Error: 压缩或编码格式错误
+    """
+    return _parse(encoded, chunk_size, [])
+
+
+def decompress_and_decode(encoded_data: EncodedInput) -> Any:
+    """将base64编码数据解压缩并解析为JSON（流式解码，不生成完整的解压文本）"""
+    kind: List[str] = []
+    items = list(_parse(encoded_data, CHUNK_SIZE, kind))
+    return items if kind == ["array"] else items[0]
+
+
+def _loads(text: bytes) -> Any:
+    """解析 JSON 文本，orjson 不支持的内容（如 NaN）回退到标准库"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except ValueError:
+            pass
+    return json.loads(text)
+
+
+def _parse(encoded: EncodedInput, chunk_size: int, kind: List[str]) -> Iterator[Any]:
+    """
+    增量解析解压后的 JSON 文本，kind 中记录顶层类型（array / value）
+
+    顶层数组按批解析：在缓冲区中从后向前查找对象元素的结尾 "},"，尝试把之前的部分作为
+    数组整体解析。JSON 文法无歧义，截取的前缀能被解析为完整数组时，截断位置必然位于
+    顶层元素之间（位于字符串或嵌套对象内部时解析失败，继续向前查找或等待后续数据）。
+    元素不是对象时退化为全部接收后一次解析。
+    """
+    buffer = b""
+    state = "start"  # start -> items；顶层不是数组时为 value
+
+    for chunk in iter_decompress(encoded, chunk_size):
+        buffer += chunk
+        if state == "start":
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            state = "items" if stripped[:1] == b"[" else "value"
+            kind.append("array" if state == "items" else "value")
+            if state == "items":
+                buffer = stripped[1:]
+        if state != "items":
+            continue
 
+        end = len(buffer)
+        for _ in range(_MAX_CUT_ATTEMPTS):
+            end = buffer.rfind(b"},", 0, end)
+            if end < 0:
+                break
+            try:
+                items = _loads(b"[" + buffer[:end + 1] + b"]")
+            except ValueError:
+                continue
+            buffer = buffer[end + 2:]
+            yield from items
+            break
 
-def decompress_and_decode(encoded_data: str) -> Dict:
-    """将base64编码数据解压缩并解析为JSON"""
-    compressed = base64.b64decode(encoded_data)
-    decompressed = zlib.decompress(compressed)
-    return json.loads(decompressed.decode('utf-8'))
+    if state == "start":
+        raise ValueError("JSON 数据为空")
+    if state == "value":
+        yield _loads(buffer)
+        return
+    # 剩余部分包含最后一批元素和数组结尾的 "]"
+    yield from _loads(b"[" + buffer)
@@ -4,23 +4,52 @@
 1. 拷贝图片到工作目录
 2. 调用 boxdetect 算法进行检测
 3. 返回实际箱体数量
+4. 批量计数：多张图片一次批量推理，后处理按图片并行执行
+5. 图片输入支持路径、编码后的图片字节、数组和共享内存，只解码一次；
+   归档到工作目录为可选项，在后台线程中执行，不占用计数耗时
+6. 推理后端可选 pytorch / onnx / openvino（参数或环境变量 YOLO_BACKEND），导出结果按权重哈希缓存
+7. INT8 量化后端（onnx-int8 / openvino-int8）加载时用样本图片校验：任何一张图片的最终箱数
+   与 FP32 模型不一致即拒绝量化模型，改用同后端的 FP32 模型
+8. 配置本地推理服务（参数或环境变量 INFERENCE_SERVER_URL）时不在本进程加载模型，
+   检测交给推理服务合批执行，本服务只做后处理
+9. 计数结果缓存：同一图片内容 + pile_id + 阈值直接返回上次成功的结果（内存 LRU + 磁盘），
+   best.pt 或 pile_config.json 变化时重新加载并使旧结果失效
+10. 每张图片只推理一次（detect），检测结果由计数和条码识别共用：需要条码时，
+    计数后处理与条码区域裁剪识别并行执行
 """
 
+import hashlib
 import os
 import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional, Tuple
-from ultralytics import YOLO
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
 import logging
 
-from core.detection.utils.yolo_utils import extract_yolo_detections
 from core.detection.detection.scene_prepare import prepare_logic, remove_fake_top_layer
 from core.detection.detection.layer_clustering import cluster_layers_with_box_roi
 from core.detection.detection.stack_processor_factory import StackProcessorFactory
 from core.detection.utils.pile_db import PileTypeDatabase
+from core.vision.barcode_recognizer import BarcodeRecognizer
+from core.vision.detections import ImageDetections, results_to_detections
+from core.vision.model_backend import calibration_images, load_model, weights_hash
+from services.inference.client import get_inference_client
+from services.vision.count_cache import CountResultCache, content_digest
+from services.vision.image_input import ImageInput, SharedImage, describe_image, encode_image, load_image
 
 logger = logging.getLogger(__name__)
 
+# 批量计数时后处理（结果转换、分层聚类、满层判断）的默认并行线程数
+POSTPROCESS_WORKERS = 4
+
+# 计数结果缓存（环境变量 COUNT_RESULT_CACHE=0 关闭）
+RESULT_CACHE_ENTRIES = 1024  # 内存中缓存的结果数
+RESULT_CACHE_BYTES = 64 * 1024 * 1024  # 磁盘缓存目录总大小上限（所有计数进程合计）
+
+BARCODE_CROP_PADDING = 10  # 条码检测框裁剪时四边扩展的像素
+
 
 class BoxCountService:
     """箱体计数服务类"""
@@ -30,7 +59,10 @@ class BoxCountService:
         model_path: Optional[str] = None,
         pile_config_path: Optional[str] = None,
         work_dir: Optional[str] = None,
-        confidence_threshold: float = 0.65
+        confidence_threshold: float = 0.65,
+        backend: Optional[str] = None,
+        inference_url: Optional[str] = None,
+        result_cache: Optional[bool] = None
     ):
         """
         初始化箱体计数服务
@@ -39,6 +71,9 @@ class BoxCountService:
         :param pile_config_path: 堆垛配置路径，默认使用 core/config/pile_config.json
         :param work_dir: 工作目录，用于保存临时图片和处理结果
         :param confidence_threshold: 置信度阈值
+        :param backend: 推理后端（pytorch / onnx / openvino），默认读取环境变量 YOLO_BACKEND
+        :param inference_url: 推理服务地址，默认读取环境变量 INFERENCE_SERVER_URL，未配置时在本进程加载模型
+        :param result_cache: 是否缓存计数结果（缓存目录为 work_dir/result_cache），默认读取环境变量 COUNT_RESULT_CACHE
         """
         # 设置默认路径
         if model_path is None:
@@ -60,17 +95,79 @@ class BoxCountService:
         self.confidence_threshold = confidence_threshold
         
         # 初始化模型和数据库
-        logger.info(f"加载YOLO模型: {self.model_path}")
-        self.model = YOLO(self.model_path)
-        
         logger.info(f"加载堆垛配置: {self.pile_config_path}")
         self.pile_db = PileTypeDatabase(self.pile_config_path)
         
         # 初始化处理器工厂
         self.processor_factory = StackProcessorFactory(enable_debug=False)
         
+        # 加载模型（INT8 后端需要用上面的计数流程做精度校验）；使用推理服务时不加载
+        self.inference = get_inference_client(inference_url)
+        self._requested_backend = backend
+        self._file_hashes = self._current_file_hashes()
+        if self.inference is not None:
+            self.model, self.backend = None, "remote"
+        else:
+            self._load_model()
+
+        # 计数结果缓存
+        if result_cache is None:
+            result_cache = os.environ.get("COUNT_RESULT_CACHE", "1") != "0"
+        self.result_cache: Optional[CountResultCache] = None
+        if result_cache:
+            self.result_cache = CountResultCache(
+                str(self.work_dir / "result_cache"), RESULT_CACHE_ENTRIES, RESULT_CACHE_BYTES)
+            self.result_cache.set_version(self._cache_version())
+
+        # 图片归档线程、条码识别线程（首次使用时创建）
+        self._archive_executor: Optional[ThreadPoolExecutor] = None
+        self._barcode_executor: Optional[ThreadPoolExecutor] = None
+        
         logger.info("BoxCountService 初始化完成")
     
+    def _load_model(self):
+        logger.info(f"加载YOLO模型: {self.model_path}")
+        self.model, self.backend = load_model(
+            self.model_path, self._requested_backend,
+            validator=self._check_quantized_model,
+            validator_key=self._reference_key()
+        )
+
+    def _current_file_hashes(self) -> Tuple[str, str]:
+        """模型权重和堆垛配置的内容哈希（文件大小和修改时间未变时不重新计算）"""
+        weights = weights_hash(self.model_path) if Path(self.model_path).exists() else "none"
+        return weights, weights_hash(self.pile_config_path)
+
+    def _cache_version(self) -> str:
+        weights, pile_config = self._file_hashes
+        return f"{weights}-{pile_config}-{self.backend}"
+
+    def _reload_if_changed(self):
+        """best.pt 或 pile_config.json 变化时重新加载，并切换计数缓存版本（旧结果失效）"""
+        current = self._current_file_hashes()
+        if current == self._file_hashes:
+            return
+        weights, pile_config = current
+        if pile_config != self._file_hashes[1]:
+            logger.info(f"堆垛配置已变化，重新加载: {self.pile_config_path}")
+            self.pile_db = PileTypeDatabase(self.pile_config_path)
+        if weights != self._file_hashes[0] and self.inference is None:
+            logger.info("模型权重已变化，重新加载")
+            self._load_model()
+        self._file_hashes = current
+        if self.result_cache is not None:
+            self.result_cache.set_version(self._cache_version())
+
+    def _cache_key(self, image: ImageInput, pile_id: Optional[int], variant: str = "") -> Optional[str]:
+        """计数缓存键，未启用缓存或图片无法读取时返回 None"""
+        if self.result_cache is None:
+            return None
+        try:
+            return CountResultCache.make_key(content_digest(image), pile_id, self.confidence_threshold, variant)
+        except Exception as e:
+            logger.warning(f"计算图片哈希失败，跳过计数缓存: {str(e)}")
+            return None
+
     def fetch_image(
         self,
         task_id: str,
@@ -124,106 +221,122 @@ class BoxCountService:
         
         return str(target_path)
     
+    def archive_image(
+        self,
+        image: ImageInput,
+        task_id: str,
+        bin_code: Optional[str] = None,
+        name: Optional[str] = None
+    ) -> "Future[str]":
+        """
+        在后台线程中把图片归档到工作目录（文件名规则同 copy_image）
+        
+        :param image: 图片路径、编码后的图片字节、数组或共享内存图片
+        :param task_id: 任务ID，用于命名
+        :param bin_code: 库位代码（可选）
+        :param name: 文件名，默认使用源文件名，非文件输入时按时间生成 .jpg 文件名
+        :return: 归档完成后得到目标路径的 Future
+        """
+        return self._submit_archive(image, self._archive_path(image, task_id, bin_code, name))
+    
+    def _submit_archive(self, image: ImageInput, target_path: Path) -> "Future[str]":
+        # 归档在后台执行，调用方返回后可能释放共享内存或复用缓冲区，先取得数据副本
+        if isinstance(image, SharedImage):
+            image = image.read()
+        elif isinstance(image, (bytearray, memoryview)):
+            image = bytes(image)
+        if self._archive_executor is None:
+            self._archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="box-archive")
+        return self._archive_executor.submit(self._write_archive, image, target_path)
+    
+    def _archive_path(self, image: ImageInput, task_id: str, bin_code: Optional[str],
+                      name: Optional[str] = None) -> Path:
+        if isinstance(image, (str, Path)):
+            name = name or Path(image).name
+        name = name or f"{int(time.time() * 1000)}.jpg"
+        filename = f"{task_id}_{bin_code}_{name}" if bin_code else f"{task_id}_{name}"
+        return self.work_dir / filename
+    
+    @staticmethod
+    def _write_archive(image: ImageInput, target_path: Path) -> str:
+        try:
+            if isinstance(image, (str, Path)):
+                shutil.copy2(image, target_path)
+            else:
+                target_path.write_bytes(encode_image(image, target_path.suffix or ".jpg"))
+        except Exception as e:
+            logger.error(f"图片归档失败: {target_path}, {str(e)}")
+            raise
+        logger.info(f"图片已归档: {target_path}")
+        return str(target_path)
+    
     def count_boxes(
         self,
-        image_path: str,
+        image_path: ImageInput,
         pile_id: Optional[int] = None,
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        archive: bool = False,
+        bin_code: Optional[str] = None,
+        read_barcodes: bool = False
     ) -> Dict:
         """
         对图片进行箱体计数
         
-        :param image_path: 图片路径
+        :param image_path: 图片路径、编码后的图片字节、BGR 数组或共享内存图片（SharedImage）
         :param pile_id: 堆垛ID（用于获取模板配置），如果为None则自动判断
         :param task_id: 任务ID（用于日志记录）
+        :param archive: 是否在后台把图片归档到工作目录（不等待归档完成）
+        :param bin_code: 库位代码（归档文件命名用）
+        :param read_barcodes: 是否同时识别检测到的条码（与计数共用同一次推理）
         :return: 检测结果字典，包含：
             - success: bool 是否成功
             - total_count: int 总箱数
             - status: str 状态信息（"success" 或错误信息）
+            - barcodes: List[str] 识别出的条码（仅 read_barcodes=True 时）
+            - barcodeError: str 条码识别失败原因（仅识别失败时）
+            - archive_path: str 归档路径（仅 archive=True 时）
+            - cached: bool 结果来自计数缓存（仅命中时）
         """
         try:
-            image_path = Path(image_path)
-            if not image_path.exists():
-                raise FileNotFoundError(f"图片不存在: {image_path}")
-            
-            logger.info(f"开始检测图片: {image_path} (任务ID: {task_id})")
-            
-            # Step 1: YOLO 检测
-            results = self.model.predict(
-                source=str(image_path),
-                save=False,
-                conf=self.confidence_threshold
-            )
-            
-            # Step 2: 提取检测结果
-            detections = extract_yolo_detections(results)
-            logger.info(f"YOLO检测到 {len(detections)} 个对象")
-            
-            if not detections:
-                return {
-                    "success": False,
-                    "total_count": 0,
-                    "status": "未检测到任何对象"
-                }
-            
-            # Step 3: 场景准备（过滤并找到pile）
-            prepared = prepare_logic(detections, conf_thr=self.confidence_threshold)
-            if prepared is None:
-                return {
-                    "success": False,
-                    "total_count": 0,
-                    "status": "未检测到pile或pile内没有box"
-                }
-            
-            boxes = prepared["boxes"]
-            pile_roi = prepared["pile_roi"]
-            
-            logger.info(f"场景准备完成: 检测到 {len(boxes)} 个box")
-            
-            # Step 4: 分层聚类
-            layer_result = cluster_layers_with_box_roi(boxes, pile_roi)
-            layers = layer_result.get("layers", [])
-            
-            if not layers:
-                return {
-                    "success": False,
-                    "total_count": 0,
-                    "status": "无法进行分层聚类"
-                }
-            
-            # Step 5: 去除误层
-            layers = remove_fake_top_layer(layers)
-            
-            # Step 6: 重新索引层（最上层为1）
-            layers = sorted(layers, key=lambda l: l["avg_y"])
-            for i, layer in enumerate(layers, 1):
-                layer["index"] = i
-            
-            # Step 7: 获取模板配置
-            if pile_id is None:
-                # 自动判断：使用第一个可用的pile配置（或根据实际情况判断）
-                pile_id = 1
-                logger.warning(f"未指定pile_id，使用默认值: {pile_id}")
-            
-            template_layers = self.pile_db.get_template_layers(pile_id)
-            if not template_layers:
-                # 如果没有配置，使用检测到的层数，每层使用检测到的箱数
-                template_layers = [len(layer["boxes"]) for layer in layers]
-                logger.warning(f"未找到pile_id={pile_id}的配置，使用检测结果作为模板")
-            
-            # Step 8: 处理堆垛（满层判断和计数）
-            result = self.processor_factory.process(layers, template_layers, pile_roi)
+            logger.info(f"开始检测图片: {describe_image(image_path)} (任务ID: {task_id})")
             
-            total_count = result.get("total", 0)
-            is_full = result.get("full", False)
-            
-            logger.info(f"检测完成: 总箱数={total_count}, 是否满层={is_full}")
-            
-            return {
-                "success": True,
-                "total_count": total_count,
-                "status": "success"
-            }
+            archive_path = None
+            if archive:
+                archive_path = self._archive_path(image_path, task_id or "task", bin_code)
+            self._reload_if_changed()
+            cache_key = self._cache_key(image_path, pile_id, "barcodes" if read_barcodes else "")
+            result = self.result_cache.get(cache_key) if cache_key else None
+            if result is not None:
+                # 同一图片、模型和堆垛配置已计数过，直接返回缓存结果
+                logger.info(f"命中计数缓存: 总箱数={result['total_count']}")
+                result["cached"] = True
+                if archive_path is not None:
+                    self._submit_archive(image_path, archive_path)
+            else:
+                # Step 1: 解码图片（只解码一次）；使用推理服务且不识别条码时不解码，由推理服务直接读取
+                image = None
+                if self.inference is None or read_barcodes:
+                    image = load_image(image_path)
+                if archive_path is not None:
+                    # 共享内存图片归档解码后的数组，避免再次读取共享内存
+                    self._submit_archive(
+                        image if image is not None and isinstance(image_path, SharedImage) else image_path,
+                        archive_path)
+
+                # Step 1: YOLO 检测（只推理一次，计数和条码识别共用检测结果）
+                detections = self.detect(image_path if self.inference is not None else image)
+
+                # Step 2-8: 后处理（需要条码时与条码识别并行）
+                if read_barcodes:
+                    result = self._count_and_read_barcodes(image, detections, pile_id)
+                else:
+                    result = self._count_from_detections(detections.detections, pile_id)
+                # 只缓存成功的结果，失败可能来自临时错误，重试时重新计算
+                if cache_key and result["success"] and not result.get("barcodeError"):
+                    self.result_cache.put(cache_key, result)
+            if archive_path is not None:
+                result["archive_path"] = str(archive_path)
+            return result
             
         except Exception as e:
             logger.error(f"箱体计数失败: {str(e)}", exc_info=True)
@@ -232,6 +345,288 @@ class BoxCountService:
                 "total_count": 0,
                 "status": str(e)
             }
+
+    def detect(self, image: ImageInput) -> ImageDetections:
+        """
+        单张图片推理一次，返回全部类别的检测框（计数和条码识别共用）
+
+        :param image: 图片路径、编码后的图片字节、BGR 数组或共享内存图片
+        """
+        if self.inference is not None:
+            return ImageDetections(self.inference.detect(image, conf=self.confidence_threshold))
+        results = self.model.predict(
+            source=load_image(image),
+            save=False,
+            conf=self.confidence_threshold
+        )
+        return ImageDetections(results_to_detections(results, getattr(self.model, "names", None)))
+
+    def _count_and_read_barcodes(self, image, detections: ImageDetections, pile_id: Optional[int]) -> Dict:
+        """计数后处理与条码识别并行执行（条码识别主要等待外部识别程序，不占用 GIL）"""
+        if self._barcode_executor is None:
+            self._barcode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="box-barcode")
+        barcode_future = self._barcode_executor.submit(self.read_barcodes, image, detections)
+        result = self._count_from_detections(detections.detections, pile_id)
+        try:
+            result["barcodes"] = barcode_future.result()
+        except Exception as e:
+            logger.error(f"条码识别失败: {str(e)}")
+            result["barcodes"] = []
+            result["barcodeError"] = str(e)
+        return result
+
+    @staticmethod
+    def read_barcodes(image, detections: ImageDetections) -> List[str]:
+        """
+        裁剪检测到的条码区域并识别
+
+        :param image: BGR 图像数组（与 detections 来自同一张图片）
+        :param detections: detect() 的检测结果
+        :return: 识别出的条码列表
+        :raises FileNotFoundError: 条码识别工具未安装
+        """
+        crops = detections.crops(image, padding=BARCODE_CROP_PADDING)
+        if not crops:
+            return []
+        results = BarcodeRecognizer().recognize_crops(crops)
+        barcodes = [r["output"] for r in results if r["output"]]
+        logger.info(f"条码识别完成: {len(crops)} 个条码区域, 识别出 {len(barcodes)} 个")
+        return barcodes
+    
+    def _count_from_results(self, results, pile_id: Optional[int] = None) -> Dict:
+        """
+        单张图片的后处理：从 YOLO 推理结果得到箱数（Step 2-8）
+
+        :param results: 单张图片的 YOLO 推理结果列表
+        :param pile_id: 堆垛ID，为None时使用默认值
+        :return: 检测结果字典（同 count_boxes）
+        """
+        # Step 2: 提取检测结果
+        return self._count_from_detections(results_to_detections(results), pile_id)
+
+    def _count_from_detections(self, detections: List[Dict], pile_id: Optional[int] = None) -> Dict:
+        """单张图片的后处理：从检测框列表（本地推理或推理服务返回）得到箱数（Step 3-8）"""
+        logger.info(f"YOLO检测到 {len(detections)} 个对象")
+        
+        if not detections:
+            return {
+                "success": False,
+                "total_count": 0,
+                "status": "未检测到任何对象"
+            }
+        
+        # Step 3: 场景准备（过滤并找到pile）
+        prepared = prepare_logic(detections, conf_thr=self.confidence_threshold)
+        if prepared is None:
+            return {
+                "success": False,
+                "total_count": 0,
+                "status": "未检测到pile或pile内没有box"
+            }
+        
+        boxes = prepared["boxes"]
+        pile_roi = prepared["pile_roi"]
+        
+        logger.info(f"场景准备完成: 检测到 {len(boxes)} 个box")
+        
+        # Step 4: 分层聚类
+        layer_result = cluster_layers_with_box_roi(boxes, pile_roi)
+        layers = layer_result.get("layers", [])
+        
+        if not layers:
+            return {
+                "success": False,
+                "total_count": 0,
+                "status": "无法进行分层聚类"
+            }
+        
+        # Step 5: 去除误层
+        layers = remove_fake_top_layer(layers)
+        
+        # Step 6: 重新索引层（最上层为1）
+        layers = sorted(layers, key=lambda l: l["avg_y"])
+        for i, layer in enumerate(layers, 1):
+            layer["index"] = i
+        
+        # Step 7: 获取模板配置
+        if pile_id is None:
+            # 自动判断：使用第一个可用的pile配置（或根据实际情况判断）
+            pile_id = 1
+            logger.warning(f"未指定pile_id，使用默认值: {pile_id}")
+        
+        template_layers = self.pile_db.get_template_layers(pile_id)
+        if not template_layers:
+            # 如果没有配置，使用检测到的层数，每层使用检测到的箱数
+            template_layers = [len(layer["boxes"]) for layer in layers]
+            logger.warning(f"未找到pile_id={pile_id}的配置，使用检测结果作为模板")
+        
+        # Step 8: 处理堆垛（满层判断和计数）
+        result = self.processor_factory.process(layers, template_layers, pile_roi)
+        
+        total_count = result.get("total", 0)
+        is_full = result.get("full", False)
+        
+        logger.info(f"检测完成: 总箱数={total_count}, 是否满层={is_full}")
+        
+        return {
+            "success": True,
+            "total_count": total_count,
+            "status": "success"
+        }
+
+    def _reference_key(self) -> str:
+        """精度校验参考集的标识：样本图片、堆垛配置和置信度阈值任一变化时重新校验"""
+        sha = hashlib.sha256()
+        for path in calibration_images() + [Path(self.pile_config_path)]:
+            if path.exists():
+                stat = path.stat()
+                sha.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+        sha.update(str(self.confidence_threshold).encode("utf-8"))
+        return sha.hexdigest()[:16]
+    
+    def _check_quantized_model(self, model) -> Tuple[bool, str]:
+        """
+        INT8 模型精度校验：样本图片逐张用 FP32（pytorch）模型和量化模型完成整个计数流程，
+        任何一张图片的 total_count 不一致即不通过
+        
+        :return: (是否通过, 说明)
+        """
+        reference_model, _ = load_model(self.model_path, "pytorch")
+        images = calibration_images()
+        mismatches = []
+        for path in images:
+            image = load_image(path)
+            counts = []
+            for candidate in (reference_model, model):
+                results = candidate.predict(source=image, save=False, conf=self.confidence_threshold, verbose=False)
+                counts.append(self._safe_count_from_results(results, None)["total_count"])
+            if counts[0] != counts[1]:
+                mismatches.append(f"{path.parent.name}/{path.name}: FP32 {counts[0]}, INT8 {counts[1]}")
+        if mismatches:
+            return False, f"{len(mismatches)}/{len(images)} 张样本箱数不一致: " + "; ".join(mismatches)
+        return True, f"{len(images)} 张样本箱数与 FP32 一致"
+    
+    def count_boxes_batch(
+        self,
+        images: Sequence[ImageInput],
+        pile_ids: Union[None, int, Sequence[Optional[int]]] = None,
+        task_id: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_workers: int = POSTPROCESS_WORKERS
+    ) -> List[Dict]:
+        """
+        批量箱体计数：多张图片一次批量推理，后处理按图片并行执行
+
+        :param images: 图片路径、编码后的图片字节、BGR 数组或共享内存图片列表
+        :param pile_ids: 堆垛ID，单个值用于全部图片，或与 images 等长的列表
+        :param task_id: 任务ID（用于日志记录）
+        :param batch_size: 单次推理的最大图片数，默认全部图片一次推理
+        :param max_workers: 后处理并行线程数（使用推理服务时同时也是并发请求数）
+        :return: 与 images 顺序一致的检测结果字典列表（同 count_boxes），
+            单张图片失败不影响其他图片
+        """
+        if not images:
+            return []
+        if pile_ids is None or isinstance(pile_ids, int):
+            pile_ids = [pile_ids] * len(images)
+        elif len(pile_ids) != len(images):
+            raise ValueError(f"pile_ids 数量({len(pile_ids)})与图片数量({len(images)})不一致")
+
+        outputs: List[Optional[Dict]] = [None] * len(images)
+        logger.info(f"开始批量检测: {len(images)} 张图片 (任务ID: {task_id})")
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="box-count") as executor:
+            # Step 0: 计数缓存命中的图片直接返回
+            keys: List[Optional[str]] = [None] * len(images)
+            self._reload_if_changed()
+            if self.result_cache is not None:
+                keys = list(executor.map(self._cache_key, images, pile_ids))
+                for index, key in enumerate(keys):
+                    cached = self.result_cache.get(key) if key else None
+                    if cached is not None:
+                        cached["cached"] = True
+                        outputs[index] = cached
+            todo = [index for index, output in enumerate(outputs) if output is None]
+
+            if self.inference is not None:
+                # 推理服务负责合批，这里并发提交单张请求并在各线程中完成后处理
+                for index, output in zip(todo, executor.map(
+                        self._safe_count_remote, [images[i] for i in todo], [pile_ids[i] for i in todo])):
+                    outputs[index] = output
+                todo = []
+
+            # Step 1: 读取图片（并行），读取失败的图片直接返回错误结果
+            arrays = dict(zip(todo, executor.map(self._load_image, [images[i] for i in todo])))
+            valid = []
+            for index, array in arrays.items():
+                if isinstance(array, Exception):
+                    outputs[index] = self._error_result(array)
+                else:
+                    valid.append(index)
+
+            batch_size = batch_size or len(valid) or 1
+            for start in range(0, len(valid), batch_size):
+                indices = valid[start:start + batch_size]
+                # Step 2: 一次批量推理
+                try:
+                    results = self.model.predict(
+                        source=[arrays[i] for i in indices],
+                        save=False,
+                        conf=self.confidence_threshold,
+                        batch=len(indices),
+                        verbose=False
+                    )
+                except Exception as e:
+                    logger.error(f"批量推理失败: {str(e)}", exc_info=True)
+                    for i in indices:
+                        outputs[i] = self._error_result(e)
+                    continue
+
+                # Step 3: 按图片并行后处理
+                futures = [
+                    executor.submit(self._safe_count_from_results, [result], pile_ids[i])
+                    for i, result in zip(indices, results)
+                ]
+                for i, future in zip(indices, futures):
+                    outputs[i] = future.result()
+
+        for key, output in zip(keys, outputs):
+            if key and output["success"] and not output.get("cached"):
+                self.result_cache.put(key, output)
+        logger.info(f"批量检测完成: {len(images)} 张图片, "
+                    f"成功 {sum(1 for r in outputs if r and r['success'])} 张, "
+                    f"缓存命中 {sum(1 for r in outputs if r and r.get('cached'))} 张")
+        return outputs
+
+    @staticmethod
+    def _load_image(image: ImageInput):
+        """解码图片为 BGR 数组，失败时返回异常对象（不抛出，避免影响同批其他图片）"""
+        try:
+            return load_image(image)
+        except Exception as e:
+            return e
+
+    def _safe_count_from_results(self, results, pile_id: Optional[int]) -> Dict:
+        try:
+            return self._count_from_results(results, pile_id)
+        except Exception as e:
+            logger.error(f"箱体计数失败: {str(e)}", exc_info=True)
+            return self._error_result(e)
+
+    def _safe_count_remote(self, image: ImageInput, pile_id: Optional[int]) -> Dict:
+        try:
+            return self._count_from_detections(self.detect(image).detections, pile_id)
+        except Exception as e:
+            logger.error(f"箱体计数失败: {str(e)}", exc_info=True)
+            return self._error_result(e)
+
+    @staticmethod
+    def _error_result(error: Exception) -> Dict:
+        return {
+            "success": False,
+            "total_count": 0,
+            "status": str(error)
+        }
     
     def process_image(
         self,
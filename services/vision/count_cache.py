@@ -0,0 +1,222 @@
+"""
+箱体计数结果缓存
+功能：
+1. 同一张图片重复计数（操作员重新触发、页面刷新后重算）时直接返回上次的结果，不再推理和后处理
+2. 缓存键为图片内容哈希 + pile_id + 置信度阈值，按版本（模型权重哈希、堆垛配置哈希、推理后端）分目录存放，
+   best.pt 或 pile_config.json 变化后版本改变，旧结果不再命中并被清理
+3. 内存 LRU（按条数）+ 磁盘（按总大小上限 LRU 淘汰，文件修改时间即最近访问时间），
+   磁盘缓存可被多个计数进程共用，进程重启后仍然有效；大小上限针对整个缓存目录，
+   各进程定期重新扫描目录，把其他进程写入的结果计入占用后再淘汰
+4. 统计内存命中、磁盘命中、未命中和淘汰次数
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from services.vision.image_input import ImageInput, SharedImage
+
+logger = logging.getLogger(__name__)
+
+RESULT_SUFFIX = ".json"
+# 重新扫描磁盘目录的间隔（秒），用于统计其他计数进程写入的结果
+DISK_RESCAN_INTERVAL = 30.0
+
+
+def content_digest(image: ImageInput) -> str:
+    """
+    图片内容哈希：文件和编码后的字节按原始数据计算，数组和共享内存图片按像素数据计算
+
+    同一张图片以文件/字节和数组两种形式提交时哈希不同，只会各自缓存一份
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    if isinstance(image, SharedImage):
+        image = image.read()
+    if isinstance(image, np.ndarray):
+        hasher.update(f"{image.shape}:{image.dtype}:".encode("utf-8"))
+        hasher.update(np.ascontiguousarray(image).data)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        hasher.update(image)
+    elif isinstance(image, (str, Path)):
+        with open(image, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+    else:
+        raise TypeError(f"不支持的图片输入类型: {type(image).__name__}")
+    return hasher.hexdigest()
+
+
+class CountResultCache:
+    """箱体计数结果缓存（内存 LRU + 磁盘）"""
+
+    def __init__(self, cache_dir: str, max_entries: int = 1024, disk_budget_bytes: int = 64 * 1024 * 1024):
+        """
+        :param cache_dir: 磁盘缓存目录，每个版本一个子目录
+        :param max_entries: 内存中最多缓存的结果数，超出时淘汰最久未使用的
+        :param disk_budget_bytes: 磁盘缓存目录的总大小上限（字节，所有共用该目录的进程合计），
+                                  超出时删除最久未访问的结果
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.disk_budget_bytes = disk_budget_bytes
+        self.version: Optional[str] = None
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 磁盘结果文件名 -> 文件大小，按最近访问排序
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def version_dir(self) -> Path:
+        return self.cache_dir / self.version
+
+    def set_version(self, version: str):
+        """
+        切换缓存版本（模型权重或堆垛配置变化）：清空内存缓存，加载新版本的磁盘索引，删除其他版本的目录
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self._invalidations += 1
+                logger.info(f"计数缓存版本变化: {self.version} -> {version}，旧结果失效")
+            self.version = version
+            self._memory.clear()
+            self.version_dir.mkdir(parents=True, exist_ok=True)
+            for path in self.cache_dir.iterdir():
+                if path.is_dir() and path.name != version:
+                    shutil.rmtree(path, ignore_errors=True)
+            self._load_index()
+
+    def _load_index(self):
+        """扫描当前版本目录，按文件修改时间恢复 LRU 顺序"""
+        entries = []
+        for path in self.version_dir.glob(f"*/*{RESULT_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.relative_to(self.version_dir).as_posix(), stat.st_size))
+        entries.sort()
+        self._files = OrderedDict((name, size) for _, name, size in entries)
+        self._disk_bytes = sum(size for _, _, size in entries)
+        self._last_scan = time.monotonic()
+        self._evict()
+
+    @staticmethod
+    def make_key(digest: str, pile_id: Optional[int], confidence_threshold: float, variant: str = "") -> str:
+        """缓存键；variant 区分同一图片的不同结果内容（如是否包含条码）"""
+        raw = f"{digest}:{pile_id}:{confidence_threshold}" + (f":{variant}" if variant else "")
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存结果（返回副本），未命中时返回 None"""
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return dict(result)
+
+            name = self._file_name(key)
+            path = self.version_dir / name
+            try:
+                result = json.loads(path.read_text(encoding="utf-8"))
+                os.utime(path)  # 记录最近访问时间
+            except FileNotFoundError:
+                # 可能已被其他计数进程淘汰
+                self._disk_bytes -= self._files.pop(name, 0)
+                self._misses += 1
+                return None
+            except (OSError, ValueError) as e:
+                logger.warning(f"计数缓存文件损坏，已忽略: {path} ({str(e)})")
+                self._misses += 1
+                return None
+            if name not in self._files:
+                self._files[name] = path.stat().st_size
+                self._disk_bytes += self._files[name]
+            self._files.move_to_end(name)
+            self._disk_hits += 1
+            self._remember(key, result)
+            return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """写入计数结果（内存和磁盘）"""
+        with self._lock:
+            self._remember(key, dict(result))
+            name = self._file_name(key)
+            path = self.version_dir / name
+            data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+            try:
+                # 先写临时文件再替换，避免其他进程读取到不完整的文件
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"计数缓存写入失败: {path} ({str(e)})")
+                return
+            self._disk_bytes += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            if time.monotonic() - self._last_scan >= DISK_RESCAN_INTERVAL:
+                # 其他计数进程写入的结果只有扫描目录后才能计入占用
+                self._load_index()
+            else:
+                self._evict()
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """超出磁盘大小上限时删除最久未访问的结果（保留最近访问的一个）"""
+        while self._disk_bytes > self.disk_budget_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._disk_bytes -= size
+            self._evictions += 1
+            try:
+                (self.version_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        return f"{key[:2]}/{key}{RESULT_SUFFIX}"
+
+    def stats(self) -> Dict[str, Any]:
+        """返回计数缓存的统计信息"""
+        hits = self._memory_hits + self._disk_hits
+        lookups = hits + self._misses
+        return {
+            "version": self.version,
+            "memoryEntries": len(self._memory),
+            "diskEntries": len(self._files),
+            "diskBytes": self._disk_bytes,
+            "diskBudgetBytes": self.disk_budget_bytes,
+            "memoryHits": self._memory_hits,
+            "diskHits": self._disk_hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+            "hitRate": round(hits / lookups, 4) if lookups else 0.0
+        }
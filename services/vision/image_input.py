@@ -0,0 +1,134 @@
+"""
+计数图片输入
+功能：
+1. 统一计数服务的图片输入：文件路径、编码后的图片字节（JPEG/PNG 等）、BGR 图像数组、共享内存图片
+2. 每张图片只解码一次，解码后的数组直接用于推理，不再经过工作目录中转
+3. 共享内存图片（SharedImage）跨进程传递时只传递名称和形状，不序列化像素数据
+"""
+
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Tuple, Union
+
+import cv2
+import numpy as np
+
+# 当前进程创建的共享内存名称（由创建方负责登记和释放）
+_created_names = set()
+
+
+@dataclass(frozen=True)
+class SharedImage:
+    """共享内存中的 BGR 图像（生产方创建，计数服务只读取）"""
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str = "uint8"
+
+    @classmethod
+    def create(cls, array: np.ndarray) -> Tuple["SharedImage", SharedMemory]:
+        """
+        把图像数组写入新建的共享内存
+
+        :return: (图片描述, 共享内存)，调用方在计数完成后调用 release() 释放
+        """
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        view[...] = array
+        del view
+        _created_names.add(shm.name)
+        return cls(name=shm.name, shape=tuple(array.shape), dtype=str(array.dtype)), shm
+
+    @staticmethod
+    def release(shm: SharedMemory):
+        """释放 create() 创建的共享内存"""
+        _created_names.discard(shm.name)
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def read(self) -> np.ndarray:
+        """读取图像数组（复制后立即断开共享内存，生产方可随时释放）"""
+        shm = _attach(self.name)
+        try:
+            view = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=shm.buf)
+            array = view.copy()
+            del view
+        finally:
+            shm.close()
+        return array
+
+
+ImageInput = Union[str, Path, bytes, bytearray, memoryview, np.ndarray, SharedImage]
+
+
+def _attach(name: str) -> SharedMemory:
+    """附加到已有共享内存，不登记到当前进程的 resource_tracker（否则进程退出时会删除生产方的共享内存）"""
+    if name in _created_names:
+        return SharedMemory(name=name)
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def load_image(image: ImageInput) -> np.ndarray:
+    """
+    把任意输入解码为 BGR 图像数组（与 cv2.imread 一致）
+
+    :raises FileNotFoundError: 图片文件不存在
+    :raises ValueError: 图片无法解码
+    :raises TypeError: 不支持的输入类型
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, SharedImage):
+        return image.read()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        array = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if array is None:
+            raise ValueError(f"图片数据无法解码（{len(image)} 字节）")
+        return array
+    if isinstance(image, (str, Path)):
+        path = Path(image)
+        if not path.exists():
+            raise FileNotFoundError(f"图片不存在: {path}")
+        array = cv2.imread(str(path))
+        if array is None:
+            raise ValueError(f"图片无法解码: {path}")
+        return array
+    raise TypeError(f"不支持的图片输入类型: {type(image).__name__}")
+
+
+def encode_image(image: ImageInput, ext: str = ".jpg") -> bytes:
+    """获取图片的编码数据（归档用），已编码的字节直接返回，不重新编码"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, (str, Path)):
+        return Path(image).read_bytes()
+    ok, buffer = cv2.imencode(ext, load_image(image))
+    if not ok:
+        raise ValueError(f"图片编码失败: {ext}")
+    return buffer.tobytes()
+
+
+def describe_image(image: ImageInput) -> str:
+    """图片输入的简短描述（用于日志）"""
+    if isinstance(image, (str, Path)):
+        return str(image)
+    if isinstance(image, SharedImage):
+        return f"<共享内存 {image.name} {image.shape}>"
+    if isinstance(image, np.ndarray):
+        return f"<数组 {image.shape}>"
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return f"<图片数据 {len(image) / 1024:.0f}KB>"
+    return f"<{type(image).__name__}>"
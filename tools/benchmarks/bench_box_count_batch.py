@@ -0,0 +1,86 @@
+"""
+箱体计数批量推理吞吐量测试（CPU）
+功能：
+1. 加载 BoxCountService，读取 tests/test_images 下的全部图片
+2. 基准：逐张调用 count_boxes（每张图片一次推理）
+3. 按不同批大小调用 count_boxes_batch，统计每秒处理图片数，并校验各图片箱数与逐张计数一致
+
+使用方法：
+    python tools/benchmarks/bench_box_count_batch.py --batch-sizes 1 2 4 8 16 --rounds 3
+注意：
+    默认屏蔽 GPU（CUDA_VISIBLE_DEVICES 置空），测试 CPU 推理；--repeat 可重复图片列表以构造更大的批
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+IMAGE_DIR = PROJECT_ROOT / "tests" / "test_images"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def collect_images(repeat: int):
+    images = sorted(str(p) for p in IMAGE_DIR.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not images:
+        raise SystemExit(f"未找到测试图片: {IMAGE_DIR}")
+    return images * repeat
+
+
+def timed(func, rounds: int):
+    """执行 rounds 次，返回最短耗时和最后一次的结果"""
+    best = float("inf")
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="箱体计数批量推理吞吐量测试")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="批大小列表")
+    parser.add_argument("--rounds", type=int, default=3, help="每项测试轮数（取最短耗时）")
+    parser.add_argument("--repeat", type=int, default=2, help="图片列表重复次数")
+    parser.add_argument("--workers", type=int, default=4, help="后处理并行线程数")
+    parser.add_argument("--model", default=None, help="YOLO 模型路径，默认 shared/models/yolo/best.pt")
+    parser.add_argument("--gpu", action="store_true", help="允许使用 GPU")
+    args = parser.parse_args()
+
+    if not args.gpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    logging.basicConfig(level=logging.WARNING)
+
+    from services.vision.box_count_service import BoxCountService
+
+    images = collect_images(args.repeat)
+    service = BoxCountService(model_path=args.model, result_cache=False)  # 重复图片不走计数缓存
+    # 预热：首次推理包含模型初始化开销
+    service.count_boxes(images[0])
+    service.count_boxes_batch(images[:2])
+
+    print(f"图片数: {len(images)}, CPU 核数: {os.cpu_count()}, 后处理线程: {args.workers}")
+    elapsed, baseline = timed(lambda: [service.count_boxes(image) for image in images], args.rounds)
+    base_rate = len(images) / elapsed
+    print(f"逐张 count_boxes: {base_rate:6.2f} 张/秒  ({elapsed:.2f}s)")
+    expected = [r["total_count"] for r in baseline]
+
+    for batch_size in args.batch_sizes:
+        elapsed, results = timed(
+            lambda: service.count_boxes_batch(images, batch_size=batch_size, max_workers=args.workers),
+            args.rounds
+        )
+        rate = len(images) / elapsed
+        mismatched = sum(1 for r, e in zip(results, expected) if r["total_count"] != e)
+        print(f"批大小 {batch_size:3d}: {rate:6.2f} 张/秒  ({rate / base_rate:.2f}x)  "
+              f"箱数不一致 {mismatched} 张")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+网关回调延迟压测
+功能：
+1. 通过 LMS 模拟服务的 /sim/delay 接口人为放慢 LMS 响应
+2. 在后台持续并发调用网关的 LMS 代理接口（/lms/getCountTasks，每次都请求 LMS；
+   /auth/token 由 token 缓存直接返回，不经过 LMS，不能用于制造上游负载）
+3. 同时测量机器人回调接口 /api/robot/reporter/task 的延迟分布
+
+若网关事件循环被上游调用阻塞，回调延迟会随 LMS 延迟同步上升；
+使用异步上游客户端后，回调延迟应基本保持不变。
+
+使用方法（先启动 LMS 模拟服务和网关）：
+    python tools/benchmarks/bench_callback_latency.py --delays 0 1 3
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+import httpx
+
+AUTH_TOKEN = "d7e8d8fe17fbfcdb6e41efbfbd6d6befbfbd7aefbfbd53634fefbfbd1a7e050c16e3b"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def lms_load(client: httpx.AsyncClient, gateway_url: str, stop: asyncio.Event):
+    """持续调用网关的LMS代理接口（不经过缓存），制造上游负载"""
+    while not stop.is_set():
+        try:
+            await client.get(f"{gateway_url}/lms/getCountTasks", params={"authToken": AUTH_TOKEN}, timeout=60)
+        except httpx.HTTPError:
+            await asyncio.sleep(0.1)
+
+
+async def measure_callbacks(client: httpx.AsyncClient, gateway_url: str, count: int) -> List[float]:
+    """顺序发送回调请求并记录每次的延迟（毫秒）"""
+    payload = {
+        "robotTaskCode": "BENCH-TASK",
+        "singleRobotCode": "BENCH-ROBOT",
+        "extra": json.dumps([{"method": "bench", "data": {}}])
+    }
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await client.post(f"{gateway_url}/api/robot/reporter/task", json=payload, timeout=60)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.02)
+    return latencies
+
+
+async def run_phase(gateway_url: str, lms_url: str, delay: float, load: int, count: int):
+    """在指定LMS延迟下执行一轮测量"""
+    async with httpx.AsyncClient() as client:
+        await client.post(f"{lms_url}/sim/delay", params={"seconds": delay})
+
+        stop = asyncio.Event()
+        loaders = [asyncio.create_task(lms_load(client, gateway_url, stop)) for _ in range(load)]
+        # 等待后台负载进入稳定状态
+        await asyncio.sleep(min(delay, 1.0) + 0.2)
+
+        latencies = await measure_callbacks(client, gateway_url, count)
+
+        stop.set()
+        await asyncio.gather(*loaders, return_exceptions=True)
+        await client.post(f"{lms_url}/sim/delay", params={"seconds": 0})
+
+    return {
+        "delay": delay,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies),
+        "mean": statistics.mean(latencies)
+    }
+
+
+async def main(args):
+    print(f"{'LMS延迟(s)':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'max(ms)':>10} {'mean(ms)':>10}")
+    for delay in args.delays:
+        row = await run_phase(args.gateway, args.lms, delay, args.load, args.count)
+        print(f"{row['delay']:>10.1f} {row['p50']:>10.2f} {row['p99']:>10.2f} "
+              f"{row['max']:>10.2f} {row['mean']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="网关回调延迟压测")
+    parser.add_argument("--gateway", default="http://localhost:8000", help="网关地址")
+    parser.add_argument("--lms", default="http://localhost:6000", help="LMS模拟服务地址")
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 1, 3], help="LMS人为延迟（秒）")
+    parser.add_argument("--load", type=int, default=8, help="后台并发LMS请求数")
+    parser.add_argument("--count", type=int, default=100, help="每轮回调请求数")
+    asyncio.run(main(parser.parse_args()))
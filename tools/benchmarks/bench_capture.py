@@ -0,0 +1,164 @@
+"""
+三相机抓图压测（无需硬件）
+使用 hardware/cam_sys/fake/camera_api.py 模拟相机，对比：
+1. 顺序模式：逐个执行三个抓图脚本，脚本之间间隔 0.5 秒（原网关行为）
+2. 并发模式：CaptureOrchestrator 同时触发三个相机
+3. 常驻服务模式：启动 capture_daemon.py，相机保持登录和预览，网关通过 HTTP 并发抓图
+
+使用方法：
+    python tools/benchmarks/bench_capture.py --rounds 5 --capture-delay 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "services" / "api"))
+
+import httpx  # noqa: E402
+
+from capture_orchestrator import CameraSpec, CaptureOrchestrator  # noqa: E402
+
+CAM_SYS_DIR = PROJECT_ROOT / "hardware" / "cam_sys"
+FAKE_CAMERA_DIR = CAM_SYS_DIR / "fake"
+SCRIPTS = {
+    "3d_camera": "3d_capture.py",
+    "scan_camera_1": "scan_1_capture.py",
+    "scan_camera_2": "scan_2_capture.py",
+}
+
+
+DAEMON_PORTS = {"3d_camera": 8101, "scan_camera_1": 8102, "scan_camera_2": 8103}
+
+
+def prepare_work_dir(work_dir: Path):
+    """在临时目录中复制抓图脚本和常驻服务，避免压测输出写入仓库"""
+    for script in [*SCRIPTS.values(), "capture_daemon.py"]:
+        target = work_dir / script
+        target.write_text((CAM_SYS_DIR / script).read_text(encoding="utf-8"), encoding="utf-8")
+
+
+def build_orchestrator(work_dir: Path, timeout: float, use_daemon: bool = False) -> CaptureOrchestrator:
+    cameras = [
+        CameraSpec(
+            name=name,
+            script=str(work_dir / script),
+            timeout=timeout,
+            retries=1,
+            daemon_url=f"http://127.0.0.1:{DAEMON_PORTS[name]}" if use_daemon else None
+        )
+        for name, script in SCRIPTS.items()
+    ]
+    return CaptureOrchestrator(
+        cameras=cameras,
+        python_cmd=[sys.executable],
+        env={"CAMERA_API_PATH": str(FAKE_CAMERA_DIR)}
+    )
+
+
+async def run_sequential(orchestrator: CaptureOrchestrator, task_no: str, bin_location: str) -> float:
+    """模拟原网关的顺序执行方式"""
+    start = time.perf_counter()
+    for i, camera in enumerate(orchestrator.cameras):
+        single = CaptureOrchestrator([camera], orchestrator.python_cmd, env=orchestrator.env)
+        await single.capture(task_no, bin_location)
+        if i < len(orchestrator.cameras) - 1:
+            await asyncio.sleep(0.5)
+    return time.perf_counter() - start
+
+
+async def start_daemon(work_dir: Path) -> subprocess.Popen:
+    """启动常驻抓图服务并等待所有相机就绪"""
+    process = subprocess.Popen(
+        [sys.executable, str(work_dir / "capture_daemon.py"), "--camera", "all"],
+        env={**os.environ, "CAMERA_API_PATH": str(FAKE_CAMERA_DIR)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    async with httpx.AsyncClient(timeout=1) as client:
+        for _ in range(100):
+            try:
+                for port in DAEMON_PORTS.values():
+                    (await client.get(f"http://127.0.0.1:{port}/health")).raise_for_status()
+                return process
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("常驻抓图服务启动超时")
+
+
+async def daemon_histograms():
+    """查询常驻服务的抓图耗时直方图"""
+    async with httpx.AsyncClient(timeout=5) as client:
+        for name, port in DAEMON_PORTS.items():
+            stats = (await client.get(f"http://127.0.0.1:{port}/stats")).json()
+            print(f"  {name:<14} 重连 {stats['reconnects']} 次, {stats['latency']}")
+
+
+async def main(args):
+    os.environ["FAKE_CAMERA_CAPTURE_DELAY"] = str(args.capture_delay)
+    os.environ["FAKE_CAMERA_LOGIN_DELAY"] = str(args.login_delay)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        prepare_work_dir(work_dir)
+        orchestrator = build_orchestrator(work_dir, args.timeout)
+
+        sequential = []
+        concurrent = []
+        per_camera = {name: [] for name in SCRIPTS}
+        for i in range(args.rounds):
+            bin_location = f"BENCH-{i:03d}"
+            sequential.append(await run_sequential(orchestrator, "BENCH", bin_location))
+
+            report = await orchestrator.capture("BENCH", bin_location)
+            concurrent.append(report["latency"])
+            for camera in report["cameras"]:
+                per_camera[camera["camera"]].append(camera["latency"])
+            if not report["success"]:
+                print(f"第 {i + 1} 轮存在失败的相机: "
+                      f"{[c['camera'] for c in report['cameras'] if not c['success']]}")
+
+        daemon = []
+        if not args.skip_daemon:
+            process = await start_daemon(work_dir)
+            try:
+                daemon_orchestrator = build_orchestrator(work_dir, args.timeout, use_daemon=True)
+                for i in range(args.rounds):
+                    report = await daemon_orchestrator.capture("BENCH", f"DAEMON-{i:03d}")
+                    daemon.append(report["latency"])
+                print("常驻服务抓图耗时直方图:")
+                await daemon_histograms()
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(f"{'模式':<12} {'平均(s)':>10} {'最小(s)':>10} {'最大(s)':>10}")
+    modes = [("顺序", sequential), ("并发", concurrent)]
+    if daemon:
+        modes.append(("常驻服务", daemon))
+    for name, values in modes:
+        print(f"{name:<12} {statistics.mean(values):>10.3f} {min(values):>10.3f} {max(values):>10.3f}")
+    print("\n并发模式各相机平均耗时:")
+    for name, values in per_camera.items():
+        print(f"  {name:<14} {statistics.mean(values):.3f}s")
+    print(f"\n并发加速比: {statistics.mean(sequential) / statistics.mean(concurrent):.2f}x")
+    if daemon:
+        print(f"常驻服务加速比: {statistics.mean(sequential) / statistics.mean(daemon):.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="三相机抓图压测")
+    parser.add_argument("--rounds", type=int, default=5, help="测试轮数")
+    parser.add_argument("--capture-delay", type=float, default=0.3, help="模拟单次抓图耗时（秒）")
+    parser.add_argument("--login-delay", type=float, default=0.1, help="模拟相机登录耗时（秒）")
+    parser.add_argument("--skip-daemon", action="store_true", help="不测试常驻服务模式")
+    parser.add_argument("--timeout", type=float, default=30, help="单个相机超时时间（秒）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,180 @@
+"""
+网关多进程吞吐量压测
+功能：
+1. 分别以 1、2、4 个工作进程（uvicorn --workers）启动网关
+2. 多个压测进程并发发送机器人回调（不重复）和按机器人查询事件历史的请求
+3. 统计每种进程数下的吞吐量和延迟分布，并校验回调在各工作进程间同步（去重、事件历史）
+
+使用方法：
+    python tools/benchmarks/bench_gateway_workers.py --workers 1 2 4 --requests 20000 --clients 4
+注意：
+    压测客户端与网关运行在同一台机器上，CPU 核数少于 工作进程数 + 压测进程数 时结果偏保守
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+API_DIR = PROJECT_ROOT / "services" / "api"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_gateway(workers: int, port: int, state_dir: str) -> subprocess.Popen:
+    """以指定工作进程数启动网关，等待接口可用"""
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(PROJECT_ROOT),
+        TASK_DB_PATH=os.path.join(state_dir, "tasks.db"),
+        GATEWAY_STATE_DIR=os.path.join(state_dir, "cluster"),
+        COUNT_WORKERS="1"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "gateway:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            stats = httpx.get(f"http://127.0.0.1:{port}/api/cluster/stats", timeout=1).json()["data"]
+            if stats["peers"] >= workers - 1:
+                return process
+        except (httpx.HTTPError, KeyError, ValueError):
+            pass
+        time.sleep(0.5)
+    stop_gateway(process)
+    raise RuntimeError(f"网关启动超时（{workers} 个工作进程）")
+
+
+def stop_gateway(process: subprocess.Popen):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def client_main(base_url: str, client_id: int, requests: int, concurrency: int, result_queue):
+    """压测进程：偶数请求发送回调，奇数请求查询事件历史"""
+
+    async def run() -> Tuple[List[float], int]:
+        latencies: List[float] = []
+        errors = 0
+        counter = iter(range(requests))
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+            async def worker():
+                nonlocal errors
+                for i in counter:
+                    start = time.perf_counter()
+                    robot = f"ROBOT{(client_id * 7 + i) % 20:03d}"
+                    if i % 2 == 0:
+                        body = {
+                            "robotTaskCode": f"BENCH-{client_id}-{i}",
+                            "singleRobotCode": robot,
+                            "extra": json.dumps([{"method": "outbin", "seq": i}])
+                        }
+                        response = await client.post("/api/robot/reporter/task", json=body)
+                    else:
+                        response = await client.get("/api/robot/events", params={"robotCode": robot, "limit": 20})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        errors += 1
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors
+
+    result_queue.put(asyncio.run(run()))
+
+
+def bench(workers: int, args) -> dict:
+    state_dir = tempfile.mkdtemp(prefix="bench-gw-")
+    port = args.port
+    process = start_gateway(workers, port, state_dir)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        context = multiprocessing.get_context("spawn")
+        result_queue = context.Queue()
+        per_client = args.requests // args.clients
+        clients = [
+            context.Process(target=client_main,
+                            args=(base_url, i, per_client, args.concurrency, result_queue))
+            for i in range(args.clients)
+        ]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        results = [result_queue.get() for _ in clients]
+        elapsed = time.perf_counter() - start
+        for client in clients:
+            client.join()
+
+        latencies = [latency for result, _ in results for latency in result]
+        errors = sum(e for _, e in results)
+
+        # 每个工作进程都应看到全部回调（本进程接收 + 其他进程同步）
+        expected = (per_client + 1) // 2 * args.clients
+        time.sleep(0.5)
+        seen = set()
+        for _ in range(workers * 4):
+            data = httpx.get(f"{base_url}/api/robot/events/stats", timeout=5).json()["data"]
+            seen.add((data["accepted"], data["replicated"]))
+        synced = all(accepted + replicated == expected for accepted, replicated in seen)
+    finally:
+        stop_gateway(process)
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    return {
+        "workers": workers,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+        "synced": synced
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关多进程吞吐量压测")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="工作进程数列表")
+    parser.add_argument("--requests", type=int, default=20000, help="每轮请求总数")
+    parser.add_argument("--clients", type=int, default=4, help="压测进程数")
+    parser.add_argument("--concurrency", type=int, default=16, help="每个压测进程的并发连接数")
+    parser.add_argument("--port", type=int, default=8600, help="网关监听端口")
+    args = parser.parse_args()
+
+    print(f"CPU 核数: {os.cpu_count()}, 请求数: {args.requests}, "
+          f"压测进程: {args.clients} x 并发 {args.concurrency}")
+    baseline = None
+    for workers in args.workers:
+        result = bench(workers, args)
+        baseline = baseline or result["throughput"]
+        print(f"工作进程 {workers}: {result['throughput']:,.0f} 次/秒 "
+              f"({result['throughput'] / baseline:.2f}x)  p50 {result['p50']:.2f}ms  p99 {result['p99']:.2f}ms  "
+              f"错误 {result['errors']}  回调同步: {'是' if result['synced'] else '否'}")
+
+
+if __name__ == "__main__":
+    main()
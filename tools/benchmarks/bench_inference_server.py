@@ -0,0 +1,157 @@
+"""
+推理服务动态合批压测
+功能：
+1. 基准：本进程加载模型，逐个请求调用一次 predict（合批前各服务的调用方式）
+2. 按不同批大小上限启动推理服务（--max-batch 1 即不合批，只有多进程），
+   用多个并发客户端提交测试图片，统计吞吐量和客户端侧延迟 p50/p99
+3. 输出推理服务 /stats 中的批大小分布、排队和推理耗时，并校验检测框数与基准一致
+
+使用方法：
+    python tools/benchmarks/bench_inference_server.py --workers 2 --max-batches 1 4 8 --concurrency 16
+注意：
+    默认屏蔽 GPU（CUDA_VISIBLE_DEVICES 置空）；--factory 可替换模型加载函数（"模块:函数"），
+    用于在没有模型权重的环境中只测试合批调度
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+IMAGE_DIR = PROJECT_ROOT / "tests" / "test_images"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def collect_images(count: int):
+    images = sorted(str(p) for p in IMAGE_DIR.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not images:
+        raise SystemExit(f"未找到测试图片: {IMAGE_DIR}")
+    return [images[i % len(images)] for i in range(count)]
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench_direct(images, factory: str, model_path: str, conf: float):
+    """基准：本进程逐个请求调用 predict"""
+    import importlib
+    from services.vision.image_input import load_image
+
+    module_name, _, attr = factory.partition(":")
+    loaded = getattr(importlib.import_module(module_name), attr)(model_path, None)
+    model = loaded[0] if isinstance(loaded, tuple) else loaded
+    model.predict(source=load_image(images[0]), save=False, conf=conf, verbose=False)  # 预热
+
+    latencies, counts = [], []
+    start = time.perf_counter()
+    for image in images:
+        begin = time.perf_counter()
+        results = model.predict(source=load_image(image), save=False, conf=conf, verbose=False)
+        latencies.append((time.perf_counter() - begin) * 1000)
+        counts.append(len(results[0].boxes))
+    return time.perf_counter() - start, latencies, counts
+
+
+def start_server(port: int, args, max_batch: int) -> subprocess.Popen:
+    python_path = os.pathsep.join(filter(None, [str(PROJECT_ROOT), os.environ.get("PYTHONPATH")]))
+    env = dict(os.environ, INFERENCE_MODEL_FACTORY=args.factory, PYTHONPATH=python_path)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "services.inference.inference_server", "--port", str(port),
+         "--model", args.model, "--workers", str(args.workers), "--max-batch", str(max_batch),
+         "--max-wait-ms", str(args.max_wait_ms)],
+        cwd=str(PROJECT_ROOT), env=env
+    )
+    import httpx
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"推理服务启动失败（退出码 {process.returncode}）")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("推理服务启动超时")
+
+
+def bench_server(images, port: int, concurrency: int, conf: float):
+    from services.inference.client import InferenceClient
+
+    client = InferenceClient(f"http://127.0.0.1:{port}", timeout=120, max_connections=concurrency)
+    client.detect(images[0], conf=conf)  # 预热连接
+
+    def call(image):
+        begin = time.perf_counter()
+        detections = client.detect(image, conf=conf)
+        return (time.perf_counter() - begin) * 1000, len(detections)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outputs = list(executor.map(call, images))
+    elapsed = time.perf_counter() - start
+    stats = client.stats()
+    client.close()
+    return elapsed, [o[0] for o in outputs], [o[1] for o in outputs], stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理服务动态合批压测")
+    parser.add_argument("--requests", type=int, default=200, help="请求数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--workers", type=int, default=2, help="推理服务工作进程数")
+    parser.add_argument("--max-batches", type=int, nargs="+", default=[1, 4, 8], help="批大小上限列表")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="凑批最长等待时间（毫秒）")
+    parser.add_argument("--conf", type=float, default=0.65, help="置信度阈值")
+    parser.add_argument("--port", type=int, default=8290, help="推理服务端口")
+    parser.add_argument("--model", default=str(PROJECT_ROOT / "shared" / "models" / "yolo" / "best.pt"))
+    parser.add_argument("--factory", default="core.vision.model_backend:load_model", help="模型加载函数")
+    parser.add_argument("--skip-direct", action="store_true", help="跳过本进程逐个 predict 的基准")
+    parser.add_argument("--gpu", action="store_true", help="允许使用 GPU")
+    args = parser.parse_args()
+
+    if not args.gpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    logging.basicConfig(level=logging.WARNING)
+
+    images = collect_images(args.requests)
+    print(f"请求数: {len(images)}, 并发: {args.concurrency}, 推理进程: {args.workers}, CPU 核数: {os.cpu_count()}")
+
+    expected = None
+    base_rate = None
+    if not args.skip_direct:
+        elapsed, latencies, expected = bench_direct(images, args.factory, args.model, args.conf)
+        base_rate = len(images) / elapsed
+        print(f"逐个 predict（单进程）: {base_rate:7.2f} 张/秒  "
+              f"p50 {percentile(latencies, 50):7.1f}ms  p99 {percentile(latencies, 99):7.1f}ms")
+
+    for max_batch in args.max_batches:
+        process = start_server(args.port, args, max_batch)
+        try:
+            elapsed, latencies, counts, stats = bench_server(images, args.port, args.concurrency, args.conf)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        rate = len(images) / elapsed
+        speedup = f"({rate / base_rate:.2f}x)" if base_rate else ""
+        mismatched = sum(1 for c, e in zip(counts, expected) if c != e) if expected else 0
+        print(f"推理服务 批上限 {max_batch:3d}: {rate:7.2f} 张/秒 {speedup:8s} "
+              f"p50 {percentile(latencies, 50):7.1f}ms  p99 {percentile(latencies, 99):7.1f}ms  "
+              f"检测框数不一致 {mismatched} 张")
+        print(f"    平均批大小 {stats['avgBatchSize']}, 批大小分布 {stats['batchSizes']}, "
+              f"排队 p50/p99 {stats['waitMs']['p50']}/{stats['waitMs']['p99']}ms, "
+              f"推理 p50/p99 {stats['inferMs']['p50']}/{stats['inferMs']['p99']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+LMS 数据压缩编码性能对比
+功能：
+1. 生成指定条数的储位数据（字段与 LMS getLmsBin 一致，默认 20 万条）
+2. 分别测试原实现（整体 json.dumps → zlib.compress → b64encode 及其逆过程）和
+   services/utils/compression 流式实现的编码、解码耗时，以及逐项解码（iter_items，不保留结果）的开销
+3. 每项测试在独立子进程中执行，统计操作期间的峰值 RSS 增量（/proc/self/clear_refs 重置峰值）
+
+使用方法：
+    python tools/benchmarks/bench_lms_codec.py --bins 200000
+"""
+
+import argparse
+import base64
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.utils import compression  # noqa: E402
+
+
+def legacy_encode(data):
+    """原实现：整体序列化后压缩编码"""
+    json_str = json.dumps(data, ensure_ascii=False)
+    return base64.b64encode(zlib.compress(json_str.encode("utf-8"))).decode("utf-8")
+
+
+def legacy_decode(encoded):
+    """原实现：整体解码解压后解析"""
+    return json.loads(zlib.decompress(base64.b64decode(encoded)).decode("utf-8"))
+
+
+VARIANTS = {
+    ("legacy", "encode"): legacy_encode,
+    ("legacy", "decode"): legacy_decode,
+    ("stream", "encode"): compression.compress_and_encode,
+    ("stream", "decode"): compression.decompress_and_decode,
+    # 逐项处理、不保留解析结果（如逐条写入数据库）
+    ("iter", "decode"): lambda encoded: sum(1 for _ in compression.iter_items(encoded)),
+}
+
+
+def make_bins(count: int):
+    """生成储位数据"""
+    areas = ["A", "B", "C", "D"]
+    return [
+        {
+            "whCode": "WH01",
+            "areaCode": areas[i % 4],
+            "areaName": f"{areas[i % 4]}库区",
+            "binCode": f"{areas[i % 4]}-{i // 1000:03d}-{i % 1000:03d}",
+            "binDesc": f"{i // 1000}排{i % 1000}列",
+            "maxQty": 50,
+            "binStatus": "1" if i % 7 else "0",
+            "tobaccoQty": i % 50,
+            "tobaccoCode": f"TB{i % 300:05d}",
+            "tobaccoName": f"卷烟规格{i % 300}"
+        }
+        for i in range(count)
+    ]
+
+
+def read_status(field: str) -> int:
+    """读取 /proc/self/status 中的内存字段（KB）"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak() -> bool:
+    """重置进程峰值 RSS（VmHWM），内核不支持时返回 False"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def child(variant: str, op: str, bins: int):
+    """子进程：准备输入数据后执行一次操作，输出耗时和峰值 RSS 增量"""
+    data = make_bins(bins)
+    encoded = legacy_encode(data)
+    payload = data if op == "encode" else encoded
+    if op == "decode":
+        del data
+    func = VARIANTS[(variant, op)]
+    gc.collect()
+
+    baseline = read_status("VmRSS")
+    exact = reset_peak()
+    start = time.perf_counter()
+    result = func(payload)
+    elapsed = time.perf_counter() - start
+    peak = read_status("VmHWM")
+
+    if op == "encode":
+        check = legacy_decode(result) == payload
+    else:
+        check = (result if isinstance(result, int) else len(result)) == bins
+    print(json.dumps({
+        "seconds": elapsed,
+        "peak_mb": (peak - baseline) / 1024,
+        "exact": exact,
+        "ok": check,
+        "encoded_mb": len(encoded) / 1024 / 1024
+    }))
+
+
+def run(variant: str, op: str, bins: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", variant, op, "--bins", str(bins)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LMS 数据压缩编码性能对比")
+    parser.add_argument("--bins", type=int, default=200000, help="储位条数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项测试重复次数（取耗时最小值）")
+    parser.add_argument("--child", nargs=2, metavar=("VARIANT", "OP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.bins)
+        return
+
+    print(f"储位条数: {args.bins}, JSON 后端: {'orjson' if compression.orjson else 'json'}")
+    for op in ("encode", "decode"):
+        results = {}
+        for variant in ("legacy", "stream", "iter"):
+            if (variant, op) not in VARIANTS:
+                continue
+            runs = [run(variant, op, args.bins) for _ in range(args.repeat)]
+            results[variant] = {
+                "seconds": min(r["seconds"] for r in runs),
+                "peak_mb": min(r["peak_mb"] for r in runs),
+                "ok": all(r["ok"] for r in runs),
+                "exact": all(r["exact"] for r in runs)
+            }
+            encoded_mb = runs[0]["encoded_mb"]
+        legacy, stream = results["legacy"], results["stream"]
+        name = "编码" if op == "encode" else "解码"
+        print(f"{name}（编码后 {encoded_mb:.1f}MB）")
+        for variant, result in results.items():
+            print(f"  {variant:<6} 耗时 {result['seconds'] * 1000:8.1f}ms  峰值 RSS 增量 {result['peak_mb']:7.1f}MB"
+                  f"{'' if result['exact'] else '（未能重置峰值，仅供参考）'}  结果正确: {'是' if result['ok'] else '否'}")
+        print(f"  流式/原实现: 耗时 {stream['seconds'] / legacy['seconds']:.2f}x, "
+              f"峰值内存 {stream['peak_mb'] / max(legacy['peak_mb'], 0.1):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+机器人回调接收压测
+功能：
+1. 在进程内通过 ASGI 直接调用网关的 /api/robot/reporter/task（包含中间件和路由，不经过网络），
+   压测期间打开机器人回调存储（临时数据库），包含后台批量写入的开销
+2. 模拟多台机器人的 start / outbin / end 回调，并按比例混入 RCS 重试产生的重复回调
+3. 统计吞吐量、客户端往返延迟和网关处理延迟分布（p50 / p99 / max），并校验重复回调没有重复分发
+
+使用方法：
+    python tools/benchmarks/bench_robot_callbacks.py --callbacks 20000 --concurrency 16 --duplicates 0.2
+    python tools/benchmarks/bench_robot_callbacks.py --gateway http://localhost:8000   # 压测已启动的网关
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "services" / "api"))
+
+import httpx  # noqa: E402
+
+METHODS = ("start", "outbin", "end")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_callbacks(count: int, robots: int, duplicate_ratio: float, seed: int = 0,
+                    prefix: str = "BENCH") -> List[dict]:
+    """生成回调请求体，重复回调紧跟在原回调之后（模拟 RCS 超时重试）"""
+    rng = random.Random(seed)
+    callbacks = []
+    seq = 0
+    while len(callbacks) < count:
+        seq += 1
+        robot = f"ROBOT{seq % robots:03d}"
+        method = METHODS[seq % len(METHODS)]
+        payload = {
+            "robotTaskCode": f"{prefix}-{robot}-{seq // len(METHODS)}",
+            "singleRobotCode": robot,
+            "extra": json.dumps([{"method": method, "seq": seq, "data": {"binCode": f"B{seq}"}}])
+        }
+        callbacks.append(payload)
+        if rng.random() < duplicate_ratio and len(callbacks) < count:
+            callbacks.append(payload)
+    return callbacks
+
+
+class ServerTimer:
+    """包装 ASGI 应用，记录网关从收到请求到响应发送完毕的耗时（不含压测客户端自身的开销）"""
+
+    def __init__(self, app):
+        self.app = app
+        self.latencies: List[float] = []
+
+    async def __call__(self, scope, receive, send):
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http":
+                self.latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run(client: httpx.AsyncClient, url: str, callbacks: List[dict], concurrency: int):
+    """按指定并发发送回调，返回 (每次延迟毫秒列表, 总耗时秒)"""
+    latencies: List[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in callbacks:
+        queue.put_nowait(json.dumps(payload).encode("utf-8"))
+
+    async def worker():
+        while not queue.empty():
+            body = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post(url, content=body, headers={"Content-Type": "application/json"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"回调失败: {response.status_code} {response.text}")
+            # 进程内 ASGI 调用不会真正挂起，主动让出事件循环，后台任务（回调批量写入）才能像真实部署一样穿插执行
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def main(args):
+    callbacks = build_callbacks(args.callbacks, args.robots, args.duplicates)
+    unique = len({(c["robotTaskCode"], c["extra"]) for c in callbacks})
+
+    server_timer = None
+    gateway = None
+    if args.gateway:
+        client = httpx.AsyncClient(base_url=args.gateway, timeout=30)
+    else:
+        if not args.keep_logs:
+            logging.disable(logging.INFO)
+        # ASGI 传输不执行网关的 lifespan，回调存储需在这里打开（使用临时数据库）
+        os.environ["ROBOT_CALLBACK_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "robot_callbacks.db")
+        import gateway
+        await gateway.robot_callback_store.open(gateway.on_robot_event)
+        server_timer = ServerTimer(gateway.app)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server_timer),
+                                   base_url="http://gateway", timeout=30)
+
+    try:
+        await bench(client, callbacks, unique, server_timer, args)
+    finally:
+        await client.aclose()
+        if gateway is not None:
+            # 关闭时写入剩余回调，统计包含全部写入
+            await gateway.robot_callback_store.close()
+            store_stats = gateway.robot_callback_store.stats()
+            print(f"回调存储: 写入 {store_stats['persisted']} 条, 重复 {store_stats['duplicates']} 条, "
+                  f"{store_stats['flushes']} 次提交")
+
+
+async def bench(client: httpx.AsyncClient, callbacks: List[dict], unique: int,
+                server_timer: Optional[ServerTimer], args):
+    # 预热：路由匹配、JSON 编解码等首次调用开销不计入结果
+    await run(client, "/api/robot/reporter/task", build_callbacks(200, 2, 0, prefix="WARMUP"), 4)
+    if server_timer is not None:
+        server_timer.latencies.clear()
+    latencies, elapsed = await run(client, "/api/robot/reporter/task", callbacks, args.concurrency)
+    server_latencies = list(server_timer.latencies) if server_timer is not None else []
+    stats: Optional[dict] = None
+    response = await client.get("/api/robot/events/stats")
+    if response.status_code == 200:
+        stats = response.json()["data"]
+
+    print(f"回调数: {len(callbacks)} (不重复 {unique}), 并发: {args.concurrency}, "
+          f"{'网关 ' + args.gateway if args.gateway else '进程内 ASGI'}")
+    print(f"吞吐量: {len(callbacks) / elapsed:,.0f} 次/秒")
+    print(f"客户端往返延迟(ms): p50 {percentile(latencies, 50):.3f}  p99 {percentile(latencies, 99):.3f}  "
+          f"max {max(latencies):.3f}  mean {statistics.mean(latencies):.3f}")
+    if server_latencies:
+        print(f"网关处理延迟(ms):   p50 {percentile(server_latencies, 50):.3f}  "
+              f"p99 {percentile(server_latencies, 99):.3f}  max {max(server_latencies):.3f}  "
+              f"mean {statistics.mean(server_latencies):.3f}")
+    if stats is not None:
+        print(f"已分发: {stats['accepted']}, 去重: {stats['duplicates']}, 事件历史: {stats['events']}")
+        if not args.gateway and stats["accepted"] != unique + 200:
+            print("警告: 分发次数与不重复回调数不一致")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="机器人回调接收压测")
+    parser.add_argument("--gateway", default=None, help="网关地址（不指定时在进程内调用）")
+    parser.add_argument("--callbacks", type=int, default=20000, help="回调请求数（含重复）")
+    parser.add_argument("--robots", type=int, default=20, help="机器人数")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="重复回调比例")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--keep-logs", action="store_true", help="保留网关 INFO 日志（默认关闭以免影响测量）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+"""
+YOLO 推理后端延迟与一致性对比（CPU）
+功能：
+1. 依次以 pytorch、onnx、openvino 及其 INT8 量化后端创建 BoxCountService（首次使用时导出并缓存模型，
+   INT8 模型加载时自动做精度校验，未通过时回退 FP32，此处记为不可用）
+2. 对 tests/test_images 下的每张图片执行 count_boxes，统计单张延迟（p50/p95/平均）
+3. 以 pytorch 结果为基准，比较每张图片的箱数和检测框数量，箱数不一致时以非零退出码结束
+
+使用方法：
+    python tools/benchmarks/bench_yolo_backends.py --backends pytorch onnx openvino onnx-int8 openvino-int8 --rounds 5
+注意：
+    默认屏蔽 GPU（CUDA_VISIBLE_DEVICES 置空）；缺少 onnxruntime / openvino 依赖的后端会跳过并提示
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+IMAGE_DIR = PROJECT_ROOT / "tests" / "test_images"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_backend(backend: str, images, rounds: int, model_path):
+    """返回 (每张图片的 (箱数, 检测框数), 单张延迟列表, 首次加载耗时)"""
+    from services.vision.box_count_service import BoxCountService
+    from core.detection.utils.yolo_utils import extract_yolo_detections
+
+    start = time.perf_counter()
+    service = BoxCountService(model_path=model_path, backend=backend, result_cache=False)
+    if service.backend != backend:
+        raise RuntimeError(f"后端 {backend} 不可用（已回退到 {service.backend}）")
+    load_seconds = time.perf_counter() - start
+
+    # 预热
+    service.count_boxes(images[0])
+
+    outputs = []
+    latencies = []
+    for _ in range(rounds):
+        outputs = []
+        for image in images:
+            begin = time.perf_counter()
+            result = service.count_boxes(image)
+            latencies.append((time.perf_counter() - begin) * 1000)
+            outputs.append(result["total_count"])
+
+    # 检测框数量单独统计（不计入延迟）
+    boxes = [
+        len(extract_yolo_detections(service.model.predict(
+            source=image, save=False, conf=service.confidence_threshold, verbose=False)))
+        for image in images
+    ]
+    return list(zip(outputs, boxes)), latencies, load_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO 推理后端延迟与一致性对比")
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx", "openvino", "onnx-int8", "openvino-int8"], help="对比的后端")
+    parser.add_argument("--rounds", type=int, default=5, help="每张图片的测试轮数")
+    parser.add_argument("--model", default=None, help="YOLO 模型路径，默认 shared/models/yolo/best.pt")
+    parser.add_argument("--gpu", action="store_true", help="允许使用 GPU")
+    args = parser.parse_args()
+
+    if not args.gpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    logging.basicConfig(level=logging.WARNING)
+
+    images = sorted(str(p) for p in IMAGE_DIR.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not images:
+        raise SystemExit(f"未找到测试图片: {IMAGE_DIR}")
+    backends = ["pytorch"] + [b for b in args.backends if b != "pytorch"]
+    print(f"图片数: {len(images)}, 轮数: {args.rounds}, CPU 核数: {os.cpu_count()}")
+
+    baseline = None
+    mismatched_total = 0
+    for backend in backends:
+        try:
+            outputs, latencies, load_seconds = run_backend(backend, images, args.rounds, args.model)
+        except Exception as e:
+            if backend == "pytorch":
+                raise
+            print(f"{backend:<13} 跳过: {str(e)}")
+            continue
+
+        line = (f"{backend:<13} 平均 {statistics.mean(latencies):7.1f}ms  p50 {percentile(latencies, 50):7.1f}ms  "
+                f"p95 {percentile(latencies, 95):7.1f}ms  加载/导出 {load_seconds:5.1f}s")
+        if baseline is None:
+            baseline = outputs
+            base_mean = statistics.mean(latencies)
+            print(line)
+            continue
+
+        mismatched = [
+            (Path(image).relative_to(IMAGE_DIR), base, out)
+            for image, base, out in zip(images, baseline, outputs) if base[0] != out[0]
+        ]
+        box_diff = sum(abs(base[1] - out[1]) for base, out in zip(baseline, outputs))
+        mismatched_total += len(mismatched)
+        print(f"{line}  加速 {base_mean / statistics.mean(latencies):.2f}x  "
+              f"箱数一致 {len(images) - len(mismatched)}/{len(images)}  检测框数量差异合计 {box_diff}")
+        for image, base, out in mismatched:
+            print(f"    箱数不一致: {image}  pytorch {base[0]}  {backend} {out[0]}")
+
+    sys.exit(1 if mismatched_total else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import { useEffect, useRef } from 'react';
+import { GATEWAY_URL } from '@/config/ip_address';
+
+// 网关推送的盘点进度事件
+export interface InventoryEvent {
+  id: number;
+  type: string;
+  taskNo: string;
+  timestamp: number;
+  data: Record<string, any>;
+}
+
+// 网关推送的事件类型
+const EVENT_TYPES = [
+  'task_started',
+  'robot_arrived',
+  'captured',
+  'counted',
+  'barcode_read',
+  'submitted',
+  'bin_done',
+  'bin_failed',
+  'task_paused',
+  'task_resumed',
+  'task_cancelled',
+  'task_finished',
+];
+
+/**
+ * 订阅网关的盘点进度事件（SSE），替代轮询
+ * 断线后浏览器会自动重连，网关根据 Last-Event-ID 补发遗漏的事件
+ */
+export function useInventoryEvents(
+  taskNo: string | null,
+  enabled: boolean,
+  onEvent: (event: InventoryEvent) => void,
+  onConnectionChange?: (connected: boolean) => void
+) {
+  // 回调保存在 ref 中，避免回调变化导致重新连接
+  const onEventRef = useRef(onEvent);
+  const onConnectionChangeRef = useRef(onConnectionChange);
+  onEventRef.current = onEvent;
+  onConnectionChangeRef.current = onConnectionChange;
+
+  useEffect(() => {
+    if (!taskNo || !enabled) return;
+
+    const source = new EventSource(
+      `${GATEWAY_URL}/api/inventory/${encodeURIComponent(taskNo)}/events`
+    );
+    const handler = (message: MessageEvent) => {
+      try {
+        onEventRef.current(JSON.parse(message.data));
+      } catch (error) {
+        console.error('解析盘点进度事件失败:', error);
+      }
+    };
+
+    EVENT_TYPES.forEach((type) => source.addEventListener(type, handler));
+    source.onopen = () => onConnectionChangeRef.current?.(true);
+    source.onerror = () => onConnectionChangeRef.current?.(false);
+
+    return () => {
+      EVENT_TYPES.forEach((type) => source.removeEventListener(type, handler));
+      source.close();
+    };
+  }, [taskNo, enabled]);
+}
@@ -14,6 +14,7 @@ import { motion } from "framer-motion";
 import { toast } from "sonner";
 import { GATEWAY_URL } from "@/config/ip_address";
 import { useAuth } from "@/contexts/authContext";
+import { useInventoryEvents, InventoryEvent } from "@/hooks/useInventoryEvents";
 
 import { v4 as uuidv4 } from "uuid";
 import {
@@ -392,6 +393,80 @@ export default function InventoryProgress() {
     setIsCalculate(true);
   };
 
+  // 订阅网关推送的盘点进度，更新各储位状态和实盘数量
+  useInventoryEvents(
+    currentTaskNo,
+    isTaskStarted,
+    (event: InventoryEvent) => {
+      const { data } = event;
+      switch (event.type) {
+        case "robot_arrived":
+          setRobotStatus("arrived");
+          setCaptureStatus("capturing");
+          break;
+        case "captured": {
+          setRobotStatus("moving");
+          setCaptureStatus("captured");
+          setCalculationStatus("calculating");
+          // 显示网关生成的3D相机缩略图，避免下载原始大图
+          const thumbnail = data.thumbnails?.["3d_camera"]?.[0];
+          const rowIndex = inventoryItems.findIndex(
+            (item) => item.locationName === data.binLocation
+          );
+          if (thumbnail && rowIndex >= 0) {
+            setOriginalImagesFromGateway((prev) => {
+              const next = [...prev];
+              next[rowIndex] = `${GATEWAY_URL}${thumbnail}`;
+              return next;
+            });
+            setCurrentImageIndex(rowIndex);
+          }
+          break;
+        }
+        case "counted":
+          setCalculationStatus("calculated");
+          break;
+        case "submitted":
+          setInventoryItems((prevItems) =>
+            prevItems.map((item) =>
+              item.locationName === data.binLocation
+                ? { ...item, actualQuantity: data.countQty }
+                : item
+            )
+          );
+          break;
+        case "bin_done":
+        case "bin_failed":
+          if (data.totalBins) {
+            setProgress(
+              Math.min(
+                Math.round(
+                  ((data.completedBins + data.failedBins) / data.totalBins) * 100
+                ),
+                100
+              )
+            );
+          }
+          break;
+        case "task_paused":
+          toast.info("盘点任务已暂停");
+          break;
+        case "task_resumed":
+          toast.info("盘点任务已恢复");
+          break;
+        case "task_cancelled":
+          setRobotStatus("idle");
+          toast.warning(`盘点任务已取消${data.reason ? `: ${data.reason}` : ""}`);
+          break;
+        case "task_finished":
+          setRobotStatus("idle");
+          setIsTaskCompleted(data.status === "completed");
+          break;
+      }
+    },
+    (connected) => setGatewayStatus(connected ? "connected" : "disconnected")
+  );
+
   // 启动盘点任务 - 与内部网关程序交互
   const handleStartCountingTask = async () => {
     setIsStartingTask(true);
@@ -19,6 +19,17 @@ interface BinItem {
   tobaccoCode: string;
 }
 
+// 库位分页查询结果（/lms/bins）
+interface BinPage {
+  total: number;
+  page: number;
+  pageSize: number;
+  items: BinItem[];
+}
+
+// 库位信息每页条数（由网关分页和搜索，不再一次获取全量库位）
+const BIN_PAGE_SIZE = 50;
+
 // 盘点任务结构体
 interface InventoryTask {
   taskID: string;
@@ -43,6 +54,14 @@ export default function InventoryStart() {
   const [taskLoading, setTaskLoading] = useState(false);
   const [binsData, setBinsData] = useState<BinItem[]>([]);
   const [isLoading, setIsLoading] = useState<boolean>(false);
+  // 库位分页与搜索
+  const [binsTotal, setBinsTotal] = useState<number>(0);
+  const [binsPage, setBinsPage] = useState<number>(1);
+  const [binKeyword, setBinKeyword] = useState<string>("");
+  const [keywordInput, setKeywordInput] = useState<string>("");
+  // 已加载过的库位（按 binCode），翻页后仍可把其他页选中的库位加入任务
+  const binCache = useRef<Map<string, BinItem>>(new Map());
+  const binPages = Math.max(1, Math.ceil(binsTotal / BIN_PAGE_SIZE));
 
   // 新增状态：选中的库位信息
   const [selectedBins, setSelectedBins] = useState<string[]>([]);
@@ -98,20 +117,29 @@ export default function InventoryStart() {
     }
   }, [binsData]);
 
-  // 获取库位信息
-  const fetchBins = async (retryCount = 0): Promise<boolean> => {
+  // 获取库位信息（分页，按关键字在网关搜索）
+  const fetchBins = async (
+    page = 1,
+    keyword = binKeyword,
+    retryCount = 0
+  ): Promise<boolean> => {
     if (!authToken) {
       toast.error("未找到认证令牌，请重新登录");
       return false;
     }
     setLoading(true);
     try {
-      const response = await fetch(
-        `${GATEWAY_URL}/lms/getLmsBin?authToken=${authToken}`,
-        {
-          signal: AbortSignal.timeout(5000),
-        }
-      );
+      const params = new URLSearchParams({
+        authToken,
+        page: String(page),
+        pageSize: String(BIN_PAGE_SIZE),
+      });
+      if (keyword) {
+        params.set("keyword", keyword);
+      }
+      const response = await fetch(`${GATEWAY_URL}/lms/bins?${params}`, {
+        signal: AbortSignal.timeout(5000),
+      });
       if (response.status === 401) {
         toast.error("认证过期，请重新登录");
         return false;
@@ -125,17 +153,20 @@ export default function InventoryStart() {
             `请求失败（状态码: ${response.status}），重试 ${retryCount + 1}/2`
           );
           await new Promise((resolve) => setTimeout(resolve, 1000));
-          return fetchBins(retryCount + 1);
+          return fetchBins(page, keyword, retryCount + 1);
         }
         toast.error(
           `获取库位信息失败: ${errorData.message || response.statusText}`
         );
         return false;
       }
-      const data = await response.json();
-      setBinsData(data);
-      // 清空选中的库位
-      setSelectedBins([]);
+      const result = await response.json();
+      const data: BinPage = result.data;
+      data.items.forEach((bin) => binCache.current.set(bin.binCode, bin));
+      setBinsData(data.items);
+      setBinsTotal(data.total);
+      setBinsPage(data.page);
+      setBinKeyword(keyword);
       return true;
     } catch (error) {
       toast.error("请求超时，请重试");
@@ -215,7 +246,10 @@ export default function InventoryStart() {
   const fetchbinData = async () => {
     setIsLoading(true);
     try {
-      const success = await fetchBins(); // 获取库位信息
+      // 重新获取时清空选中的库位
+      setSelectedBins([]);
+      binCache.current.clear();
+      const success = await fetchBins(1, keywordInput.trim()); // 获取库位信息
       if (success) {
         toast.success(`成功获取库位信息`);
       }
@@ -329,15 +363,22 @@ export default function InventoryStart() {
     toast.success("盘点任务已删除");
   };
 
-  // 处理全选/全不选（库位信息）
+  // 搜索库位（在网关按储位名称、储位编码、品规名称匹配）
+  const handleSearchBins = () => {
+    fetchBins(1, keywordInput.trim());
+  };
+
+  // 处理全选/全不选（当前页库位信息）
   const handleSelectAllBins = () => {
-    const allSelected = binsData.every((bin) =>
-      selectedBins.includes(bin.binCode)
-    );
+    const pageCodes = binsData.map((bin) => bin.binCode);
+    const allSelected = pageCodes.every((code) => selectedBins.includes(code));
     if (allSelected) {
-      setSelectedBins([]);
+      setSelectedBins(selectedBins.filter((code) => !pageCodes.includes(code)));
     } else {
-      setSelectedBins(binsData.map((bin) => bin.binCode));
+      setSelectedBins([
+        ...selectedBins,
+        ...pageCodes.filter((code) => !selectedBins.includes(code)),
+      ]);
     }
   };
 
@@ -369,7 +410,7 @@ export default function InventoryStart() {
 
     const newTasks: InventoryTask[] = selectedBins
       .map((binCode) => {
-        const bin = binsData.find((b) => b.binCode === binCode);
+        const bin = binCache.current.get(binCode);
         if (!bin) return null;
 
         return {
@@ -562,7 +603,7 @@ export default function InventoryStart() {
                     <div className="w-16 h-16 border-4 border-green-200 border-t-green-700 rounded-full animate-spin mb-4"></div>
                     <p className="text-gray-500">正在获取数据...</p>
                   </div>
-                ) : binsData.length > 0 ? (
+                ) : binsTotal > 0 || binKeyword ? (
                   // 库位信息表格
                   <div className="mb-8">
                     <div className="flex items-center mb-4">
@@ -582,6 +623,25 @@ export default function InventoryStart() {
                         </span>
                       </div>
                     </div>
+                    {/* 库位搜索 */}
+                    <div className="flex items-center space-x-2 mb-4">
+                      <input
+                        type="text"
+                        placeholder="搜索储位名称 / 储位编码 / 品规名称"
+                        value={keywordInput}
+                        onChange={(e) => setKeywordInput(e.target.value)}
+                        onKeyDown={(e) => e.key === "Enter" && handleSearchBins()}
+                        className="border border-gray-300 rounded px-3 py-2 text-sm w-72 h-10"
+                      />
+                      <button
+                        onClick={handleSearchBins}
+                        disabled={loading}
+                        className="px-4 py-2 bg-green-700 hover:bg-green-800 text-white text-sm rounded-lg transition-colors flex items-center h-10"
+                      >
+                        <i className="fa-solid fa-magnifying-glass mr-2"></i>
+                        搜索
+                      </button>
+                    </div>
                     {/* 可滚动容器 - 限制高度为20行 */}
                     <div className="overflow-x-auto overflow-y-auto max-h-[300px] border rounded-lg">
                       <table className="min-w-full divide-y divide-gray-200 table-fixed">
@@ -594,7 +654,9 @@ export default function InventoryStart() {
                                 type="checkbox"
                                 checked={
                                   binsData.length > 0 &&
-                                  selectedBins.length === binsData.length
+                                  binsData.every((bin) =>
+                                    selectedBins.includes(bin.binCode)
+                                  )
                                 }
                                 onChange={handleSelectAllBins}
                                 className="h-4 w-4 text-green-600 rounded border-gray-300"
@@ -640,7 +702,7 @@ export default function InventoryStart() {
                         <tbody className="bg-white divide-y divide-gray-200">
                           {binsData.map((item, index) => (
                             <tr
-                              key={index}
+                              key={item.binCode}
                               className="hover:bg-gray-50 transition-colors"
                             >
                               <td
@@ -656,7 +718,7 @@ export default function InventoryStart() {
                               <td
                                 className={`px-4 py-4 text-sm text-gray-700 ${columnWidths.index}`}
                               >
-                                {index + 1}
+                                {(binsPage - 1) * BIN_PAGE_SIZE + index + 1}
                               </td>
                               <td
                                 className={`px-4 py-4 text-sm text-gray-900 truncate ${columnWidths.whCode}`}
@@ -697,10 +759,27 @@ export default function InventoryStart() {
                         </tbody>
                       </table>
                     </div>
-                    {/* 数据统计信息 */}
-                    <div className="mt-2 text-sm text-gray-500">
-                      共 {binsData.length}{" "}
-                      条数据，当前显示前20条（滚动查看更多）
+                    {/* 数据统计信息与翻页 */}
+                    <div className="mt-2 flex justify-between items-center text-sm text-gray-500">
+                      <span>
+                        共 {binsTotal} 条数据，第 {binsPage}/{binPages} 页
+                      </span>
+                      <div className="flex space-x-2">
+                        <button
+                          onClick={() => fetchBins(binsPage - 1)}
+                          disabled={loading || binsPage <= 1}
+                          className="px-3 py-1 border border-gray-300 rounded hover:bg-gray-100 disabled:opacity-50"
+                        >
+                          上一页
+                        </button>
+                        <button
+                          onClick={() => fetchBins(binsPage + 1)}
+                          disabled={loading || binsPage >= binPages}
+                          className="px-3 py-1 border border-gray-300 rounded hover:bg-gray-100 disabled:opacity-50"
+                        >
+                          下一页
+                        </button>
+                      </div>
                     </div>
                   </div>
                 ) : (
@@ -851,12 +930,12 @@ export default function InventoryStart() {
                 </div>
               </div>
               {/* 底部操作栏 */}
-              {binsData.length > 0 && (
+              {binsTotal > 0 && (
                 <div className="p-6 border-t border-gray-100 bg-gray-50 flex justify-between items-center">
                   <div className="text-sm text-gray-500">
                     库位信息共{" "}
                     <span className="font-medium text-green-700">
-                      {binsData.length}
+                      {binsTotal}
                     </span>{" "}
                     条记录，盘点任务共{" "}
                     <span className="font-medium text-blue-700">